@@ -0,0 +1,170 @@
+"""
+Общие фикстуры нагрузочных тестов: наборы данных нескольких размеров, Redis
+в памяти процесса (fakeredis), локальная заглушка Stripe API и клиент API
+с JWT владельца курсов.
+"""
+
+import datetime
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import fakeredis
+import pytest
+import stripe
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from materials.models import Course, CourseSubscription, Lesson
+from users.models import User
+from users.throttling import RedisTokenBucketThrottle
+
+# Размер набора данных: курсов у владельца, уроков в курсе, других пользователей
+# (подписчики первого курса и кандидаты на деактивацию)
+DATASET_SIZES = {
+    "small": {"courses": 10, "lessons": 5, "users": 10},
+    "large": {"courses": 200, "lessons": 20, "users": 200},
+}
+PASSWORD = "bench-password"
+
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    """Redis приложения и кэша - в памяти процесса: замеряется код, а не сеть."""
+    server = fakeredis.FakeServer()
+    with patch(
+        "skillshare_platform.redis_client._client",
+        fakeredis.FakeRedis(server=server, decode_responses=True),
+    ), patch(
+        "django.core.cache.backends.redis.RedisCacheClient.get_client",
+        side_effect=lambda *args, **kwargs: fakeredis.FakeRedis(server=server),
+    ), patch.dict(
+        # Лимиты запросов проверяются, но не срабатывают на сотнях повторов
+        RedisTokenBucketThrottle.THROTTLE_RATES,
+        dict.fromkeys(RedisTokenBucketThrottle.THROTTLE_RATES, "1000000/min"),
+    ):
+        cache.clear()
+        yield server
+
+
+@pytest.fixture(params=list(DATASET_SIZES))
+def dataset(request, db):
+    """
+    Владелец с курсами и уроками и пользователи, подписанные на первый курс
+    и не заходившие больше месяца. Пароль хэшируется один раз на все записи.
+    """
+    size = DATASET_SIZES[request.param]
+    password = make_password(PASSWORD)
+    owner = User.objects.create(email="owner@example.com", password=password)
+    courses = Course.objects.bulk_create(
+        Course(
+            title=f"Курс {number}",
+            description="Описание курса",
+            course_user=owner,
+            fixed_price=1000,
+        )
+        for number in range(size["courses"])
+    )
+    Lesson.objects.bulk_create(
+        Lesson(
+            course=course,
+            title=f"Урок {number}",
+            description="Описание урока",
+            price=100,
+            lesson_user=owner,
+        )
+        for course in courses
+        for number in range(size["lessons"])
+    )
+    long_ago = timezone.now() - datetime.timedelta(days=60)
+    users = User.objects.bulk_create(
+        User(
+            email=f"user{number}@example.com",
+            password=password,
+            last_login=long_ago,
+        )
+        for number in range(size["users"])
+    )
+    CourseSubscription.objects.bulk_create(
+        CourseSubscription(user=user, course=courses[0]) for user in users
+    )
+    return {
+        "owner": owner,
+        "courses": courses,
+        "course": courses[0],
+        "lesson": Lesson.objects.filter(course=courses[0]).first(),
+        "users": users,
+    }
+
+
+@pytest.fixture
+def api_client(dataset):
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(dataset['owner'])}"
+    )
+    return client
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    """Ответы Stripe API, которые использует создание платежа (users.services)."""
+
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными пакетами: без этого keep-alive ждёт delayed ACK
+    disable_nagle_algorithm = True
+    session_ids = itertools.count(1)
+
+    def respond(self, body):
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.respond({"object": "list", "data": [], "has_more": False, "url": path})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?")[0]
+        if path == "/v1/products":
+            self.respond({"id": "prod_stub", "object": "product", "name": "stub"})
+        elif path == "/v1/prices":
+            self.respond({"id": "price_stub", "object": "price", "unit_amount": 1})
+        else:
+            session_id = f"cs_stub_{next(self.session_ids)}"
+            self.respond(
+                {
+                    "id": session_id,
+                    "object": "checkout.session",
+                    "url": f"https://checkout.stripe.com/c/pay/{session_id}",
+                }
+            )
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def stripe_stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StripeStubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def stripe_stub(stripe_stub_url):
+    """Stripe SDK обращается к локальной заглушке по HTTP."""
+    with patch.object(stripe, "api_base", stripe_stub_url), patch.object(
+        stripe, "api_key", "sk_test_stub"
+    ):
+        yield
@@ -0,0 +1,73 @@
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from benchmarks.conftest import PASSWORD
+
+
+def test_course_list(benchmark, api_client):
+    url = reverse("materials:course-list")
+    response = benchmark(api_client.get, url, {"page_size": 100})
+    assert response.status_code == 200
+
+
+def test_course_retrieve(benchmark, api_client, dataset):
+    url = reverse("materials:course-detail", args=[dataset["course"].pk])
+    response = benchmark(api_client.get, url)
+    assert response.status_code == 200
+
+
+def test_lesson_list(benchmark, api_client):
+    url = reverse("materials:lesson-list-create")
+    response = benchmark(api_client.get, url, {"page_size": 100})
+    assert response.status_code == 200
+
+
+def test_lesson_retrieve(benchmark, api_client, dataset):
+    url = reverse("materials:lesson-detail", args=[dataset["lesson"].pk])
+    response = benchmark(api_client.get, url)
+    assert response.status_code == 200
+
+
+def test_subscription_toggle(benchmark, api_client, dataset):
+    """Каждый вызов поочерёдно подписывает и отписывает владельца."""
+    url = reverse("materials:course_subscribe")
+    response = benchmark(
+        api_client.post, url, {"course_id": dataset["course"].pk}, format="json"
+    )
+    assert response.status_code == 200
+
+
+def test_lesson_progress(benchmark, api_client, dataset):
+    """Событие просмотра только добавляется в поток Redis (fakeredis)."""
+    url = reverse("materials:lesson-progress", args=[dataset["lesson"].pk])
+    response = benchmark(api_client.post, url, {"progress": 50}, format="json")
+    assert response.status_code == 202
+
+
+def test_payment_create(benchmark, api_client, dataset, stripe_stub):
+    """Платёж за курс с созданием продукта, цены и сессии в заглушке Stripe."""
+    url = reverse("users:payment-create")
+    response = benchmark(
+        api_client.post, url, {"paid_course": dataset["course"].pk}, format="json"
+    )
+    assert response.status_code == 200, response.content
+    assert response.json()["payment_url"].startswith("https://checkout.stripe.com/")
+
+
+def test_token_obtain(benchmark, client, dataset):
+    """Включает проверку пароля (PBKDF2) - основную часть времени входа."""
+    url = reverse("token_obtain_pair")
+    credentials = {"email": dataset["owner"].email, "password": PASSWORD}
+    response = benchmark(client.post, url, credentials)
+    assert response.status_code == 200
+
+
+def test_token_refresh(benchmark, client, dataset):
+    """Refresh-токен одноразовый: на каждый замер выпускается новый."""
+    url = reverse("token_refresh")
+
+    def setup():
+        return (url, {"refresh": str(RefreshToken.for_user(dataset["owner"]))}), {}
+
+    response = benchmark.pedantic(client.post, setup=setup, rounds=50)
+    assert response.status_code == 200
@@ -0,0 +1,51 @@
+import datetime
+
+from django.core import mail
+from django.test import override_settings
+from django.utils import timezone
+
+from materials.models import Lesson, LessonProgress
+from materials.progress import record_progress
+from materials.tasks import (deactivate_inactive_users, flush_lesson_progress,
+                             send_course_update_notification)
+from users.models import User
+
+LOCMEM_EMAIL = "django.core.mail.backends.locmem.EmailBackend"
+
+
+@override_settings(EMAIL_BACKEND=LOCMEM_EMAIL)
+def test_send_course_update_notification(benchmark, dataset):
+    benchmark(send_course_update_notification, dataset["course"].pk)
+    assert mail.outbox[-1].to == [user.email for user in dataset["users"]]
+
+
+@override_settings(EMAIL_BACKEND=LOCMEM_EMAIL)
+def test_deactivate_inactive_users(benchmark, dataset):
+    """Перед каждым замером пользователи снова активны и давно не заходили."""
+    long_ago = timezone.now() - datetime.timedelta(days=60)
+
+    def setup():
+        User.objects.filter(pk__in=[user.pk for user in dataset["users"]]).update(
+            is_active=True, last_login=long_ago
+        )
+        mail.outbox = []
+
+    benchmark.pedantic(deactivate_inactive_users, setup=setup, rounds=10)
+    assert len(mail.outbox) == len(dataset["users"])
+    assert not User.objects.filter(is_active=True, last_login=long_ago).exists()
+
+
+def test_flush_lesson_progress(benchmark, dataset):
+    """Перенос пакета событий: каждый пользователь открывает и досматривает уроки курса."""
+    lesson_ids = list(
+        Lesson.objects.filter(course=dataset["course"]).values_list("id", flat=True)
+    )
+
+    def setup():
+        for user in dataset["users"]:
+            for lesson_id in lesson_ids:
+                record_progress(user.pk, lesson_id, 0)
+                record_progress(user.pk, lesson_id, 100)
+
+    benchmark.pedantic(flush_lesson_progress, setup=setup, rounds=10)
+    assert LessonProgress.objects.count() == len(dataset["users"]) * len(lesson_ids)
@@ -35,5 +35,7 @@ docker compose -f docker-compose.prod.yml up -d --build --remove-orphans
 sleep 5
 docker compose -f docker-compose.prod.yml exec -T backend python manage.py migrate --noinput || true
 docker compose -f docker-compose.prod.yml exec -T backend python manage.py collectstatic --noinput || true
+# Схема OpenAPI генерируется один раз на деплой и отдаётся из файла
+docker compose -f docker-compose.prod.yml exec -T backend python manage.py build_openapi_schema || true
 
 echo "Развернули $BRANCH в $DEPLOY_PATH"
@@ -0,0 +1,169 @@
+"""
+Профиль запуска gunicorn: gunicorn -c gunicorn.conf.py (файл в текущем каталоге
+gunicorn подхватывает и без -c).
+
+Число воркеров и потоков подбирается по доступным процессу CPU (с учётом квоты cgroup
+контейнера) и ограничивается памятью: на воркер закладывается GUNICORN_WORKER_MEMORY_MB.
+Приложение загружается до форка (preload), и воркеры делят его память copy-on-write.
+Воркеры перезапускаются после GUNICORN_MAX_REQUESTS запросов со случайным разбросом,
+чтобы утечки памяти не накапливались, а воркеры не перезапускались одновременно.
+Все значения переопределяются переменными окружения GUNICORN_*.
+"""
+
+import gc
+import math
+import os
+import resource
+
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def env_bool(name, default):
+    return os.getenv(name, default).lower() == "true"
+
+
+def available_cpus():
+    """Число CPU, доступных процессу: привязка к ядрам и квота cgroup (cpu.max)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def available_memory_mb():
+    """Лимит памяти контейнера (cgroup memory.max) или память машины в МБ."""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            return int(limit) // 2**20
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def default_workers(worker_class, threads, cpus, memory_mb):
+    """
+    Синхронные воркеры: 2 × CPU + 1 - пока одни ждут базу, Redis или Stripe, другие
+    заняты CPU. С потоками или асинхронными воркерами ожидание перекрывается внутри
+    процесса, и достаточно воркера на CPU. Воркеров не больше, чем помещается в память.
+    """
+    workers = cpus * 2 + 1 if threads == 1 and worker_class == "sync" else cpus
+    if memory_mb is not None:
+        per_worker = env_int("GUNICORN_WORKER_MEMORY_MB", "150")
+        reserved = env_int("GUNICORN_RESERVED_MEMORY_MB", "256")
+        workers = min(workers, (memory_mb - reserved) // per_worker)
+    return max(1, workers)
+
+
+# Приложение: WSGI по умолчанию, ASGI - skillshare_platform.asgi:application
+# с GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker
+wsgi_app = os.getenv("GUNICORN_APP", "skillshare_platform.wsgi:application")
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+
+# sync с GUNICORN_THREADS > 1 gunicorn заменяет на gthread
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+threads = env_int("GUNICORN_THREADS", "4")
+workers = env_int("GUNICORN_WORKERS", "0") or default_workers(
+    worker_class, threads, available_cpus(), available_memory_mb()
+)
+
+preload_app = env_bool("GUNICORN_PRELOAD", "True")
+
+# Перезапуск воркера после max_requests ± max_requests_jitter запросов
+max_requests = env_int("GUNICORN_MAX_REQUESTS", "2000")
+max_requests_jitter = env_int("GUNICORN_MAX_REQUESTS_JITTER", "200")
+
+# Воркер, молчащий дольше timeout, перезапускается; long-poll статуса платежа
+# (PAYMENT_STATUS_MAX_WAIT, 20 секунд) должен укладываться в этот срок
+timeout = env_int("GUNICORN_TIMEOUT", "30")
+# Сколько воркер дозавершает начатые запросы после SIGTERM (деплой, перезапуск)
+graceful_timeout = env_int("GUNICORN_GRACEFUL_TIMEOUT", "30")
+keepalive = env_int("GUNICORN_KEEPALIVE", "5")
+# Файл heartbeat воркеров - в памяти: overlay-диск контейнера может тормозить
+worker_tmp_dir = os.getenv("GUNICORN_WORKER_TMP_DIR", "/dev/shm")
+
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+# Метрики воркеров (запросы, длительность, коды ответов, число воркеров) в StatsD
+statsd_host = os.getenv("GUNICORN_STATSD_HOST") or None
+statsd_prefix = os.getenv("GUNICORN_STATSD_PREFIX", "skillshare")
+
+
+def on_starting(server):
+    # Метрики Prometheus воркеров (skillshare_platform.metrics) суммируются по файлам
+    # PROMETHEUS_MULTIPROC_DIR - файлы прошлого запуска удаляются
+    from skillshare_platform.metrics import clear_multiproc_dir
+
+    clear_multiproc_dir()
+    server.log.info(
+        "Профиль gunicorn: %s воркеров %s, потоков %s, preload=%s, max_requests=%s±%s",
+        workers,
+        worker_class,
+        threads,
+        preload_app,
+        max_requests,
+        max_requests_jitter,
+    )
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    # Django импортирует URLconf, представления и сериализаторы при первом запросе -
+    # загружаем их до форка, иначе каждый воркер держит свою копию
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    # Объекты, созданные до форка, исключаются из сборки мусора: сборщик не меняет
+    # их заголовки, и страницы памяти остаются общими с мастером
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    # Соединения с базой, открытые при загрузке приложения, не должны достаться воркерам
+    if preload_app:
+        from django.db import connections
+
+        connections.close_all()
+
+
+def worker_exit(server, worker):
+    # Сколько запросов обслужил воркер и сколько памяти занимал (для подбора max_requests)
+    server.log.info(
+        "Воркер %s завершён: запросов %s, пик памяти %s МБ",
+        worker.pid,
+        worker.nr,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+    )
+
+
+def child_exit(server, worker):
+    # Запросы в обработке завершившегося воркера больше не учитываются в /metrics
+    from skillshare_platform.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
+def worker_abort(worker):
+    worker.log.warning(
+        "Воркер %s прерван по таймауту %s с (запросов %s)",
+        worker.pid,
+        timeout,
+        worker.nr,
+    )
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import OuterRef, Subquery, Sum
 
 from materials.models import Course, CourseSubscription, Lesson
 
@@ -16,6 +17,11 @@ class CourseAdmin(admin.ModelAdmin):
         "calculated_price_display",
         "actual_price_display",
     )
+    # Владелец загружается в том же запросе, что и курсы
+    list_select_related = ("course_user",)
+    search_fields = ("title",)
+    # Поиск владельца вместо <select> со всеми пользователями
+    autocomplete_fields = ("course_user",)
     # Добавим 'fields' для контроля порядка и включения полей на странице изменения
     fields = (
         "title",
@@ -31,19 +37,66 @@ class CourseAdmin(admin.ModelAdmin):
         "actual_price_display",
     )
 
+    def get_queryset(self, request):
+        """
+        Сумма цен уроков считается подзапросом в том же запросе, что и список курсов,
+        а не отдельным aggregate на каждую строку. Подзапрос, в отличие от JOIN с
+        GROUP BY, не попадает в COUNT(*) пагинатора.
+        """
+        lessons_total = (
+            Lesson.objects.filter(course=OuterRef("pk"))
+            .order_by()
+            .values("course")
+            .annotate(total=Sum("price"))
+            .values("total")
+        )
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(lessons_total=Subquery(lessons_total))
+        )
+
     def calculated_price_display(self, obj):
         """Метод для отображения расчетной стоимости курса по урокам в админ-панели."""
-        return f"{obj.calculated_price_from_lessons:.2f} руб."
+        return f"{obj.lessons_total or 0:.2f} руб."
 
     calculated_price_display.short_description = "Стоимость по урокам"
 
     def actual_price_display(self, obj):
         """Метод для отображения общей стоимости курса в админ-панели."""
-        return f"{obj.actual_price:.2f} руб."  # Форматируем как валюту
+        if obj.fixed_price is not None and obj.fixed_price > 0:
+            return f"{obj.fixed_price:.2f} руб."  # Форматируем как валюту
+        return self.calculated_price_display(obj)
 
     actual_price_display.short_description = "Стоимость курса (фактическая)"
 
 
+class LessonAdmin(admin.ModelAdmin):
+    """
+    Класс для настройки отображения модели Lesson в админ-панели.
+    Курс (нужен для __str__ урока) и владелец загружаются вместе с уроками.
+    """
+
+    list_display = ("title", "course", "lesson_user", "price")
+    search_fields = ("title", "course__title")
+    autocomplete_fields = ("course", "lesson_user")
+
+    def get_queryset(self, request):
+        # Вместо list_select_related: ChangeList не применяет его к queryset, где
+        # select_related уже задан, а курс нужен и автодополнению (подписи через __str__)
+        return super().get_queryset(request).select_related("course", "lesson_user")
+
+
+class CourseSubscriptionAdmin(admin.ModelAdmin):
+    """
+    Класс для настройки отображения модели CourseSubscription в админ-панели.
+    """
+
+    list_display = ("user", "course", "created")
+    list_select_related = ("user", "course")
+    autocomplete_fields = ("user", "course")
+
+
 admin.site.register(Course, CourseAdmin)
-admin.site.register(Lesson)
-admin.site.register(CourseSubscription)
+admin.site.register(Lesson, LessonAdmin)
+admin.site.register(CourseSubscription, CourseSubscriptionAdmin)
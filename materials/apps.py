@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EducationConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "materials"
+
+    def ready(self):
+        # Подключаем обработчики сигналов (сброс кэша уроков курса)
+        from materials import signals  # noqa: F401
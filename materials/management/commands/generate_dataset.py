@@ -0,0 +1,439 @@
+import datetime
+import io
+import itertools
+import math
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from materials.models import Course, CourseSubscription, Lesson
+from users.models import Payment, User
+
+# Объёмы набора: (аргумент, значение по умолчанию, описание)
+COUNT_ARGUMENTS = [
+    ("users", 1000, "Количество пользователей"),
+    ("courses", 100, "Количество курсов"),
+    ("lessons-per-course", 10, "Количество уроков в каждом курсе"),
+    ("subscriptions", 5000, "Количество подписок на курсы"),
+    ("payments", 10000, "Количество платежей"),
+]
+# Доля способов оплаты; бесплатные материалы (free) оформляются с нулевой суммой
+PAYMENT_METHOD_WEIGHTS = {"stripe": 70, "transfer": 15, "cash": 10, "free": 5}
+# Статусы платежей Stripe по умолчанию; остальные способы оплаты всегда succeeded
+DEFAULT_STATUS_MIX = "succeeded=85,failed=10,pending=5"
+# Доля платежей за курс целиком (остальные - за отдельный урок)
+COURSE_PAYMENT_SHARE = 0.7
+
+FIRST_NAMES = ["Анна", "Иван", "Мария", "Олег", "Елена", "Павел", "Ольга", "Дмитрий"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев"]
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург", None]
+TOPICS = [
+    "Python",
+    "Django",
+    "SQL",
+    "Дизайн",
+    "Маркетинг",
+    "Английский",
+    "Data Science",
+]
+VIDEO_ID_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-"
+
+
+def parse_mix(value):
+    """Разбирает строку вида 'succeeded=85,failed=10' в (статусы, накопленные веса)."""
+    statuses = dict(Payment.PAYMENT_STATUS_CHOICES)
+    names, weights = [], []
+    try:
+        for part in value.split(","):
+            name, weight = part.split("=")
+            names.append(name.strip())
+            weights.append(float(weight))
+    except ValueError:
+        raise CommandError(f"Неверный формат --status-mix: '{value}'")
+    unknown = set(names) - set(statuses)
+    if unknown or sum(weights) <= 0:
+        raise CommandError(
+            f"Статусы --status-mix должны быть из {sorted(statuses)} с положительными весами"
+        )
+    return names, list(itertools.accumulate(weights))
+
+
+def copy_value(value):
+    """Значение в текстовом формате COPY: NULL - \\N, спецсимволы экранируются."""
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if isinstance(value, str):
+        return (
+            value.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def distinct_pairs(rng, count, rows, columns):
+    """
+    count различных пар (строка, столбец) из таблицы rows x columns без хранения
+    выданных пар: номера ячеек обходятся с шагом, взаимно простым с числом ячеек.
+    """
+    cells = rows * columns
+    start = rng.randrange(cells)
+    step = rng.randrange(1, cells) if cells > 1 else 1
+    while math.gcd(step, cells) != 1:
+        step += 1
+    for number in range(count):
+        yield divmod((start + number * step) % cells, columns)
+
+
+class Command(BaseCommand):
+    """
+    Команда Django для генерации синтетического набора данных заданного размера:
+    пользователи, курсы, уроки, подписки и платежи со смесью способов оплаты и статусов.
+    Строки формируются потоком и загружаются пачками через COPY (на PostgreSQL)
+    или bulk_create, с явными ID, поэтому связи не требуют чтения из базы.
+    Хэш пароля вычисляется один раз для всех пользователей. При одинаковых --seed,
+    --end-date и исходном состоянии базы результат совпадает до байта.
+    """
+
+    help = "Генерирует синтетический набор данных для нагрузочных тестов"
+
+    def add_arguments(self, parser):
+        for name, default, description in COUNT_ARGUMENTS:
+            parser.add_argument(
+                f"--{name}",
+                type=int,
+                default=default,
+                help=f"{description} (по умолчанию {default})",
+            )
+        parser.add_argument(
+            "--status-mix",
+            default=DEFAULT_STATUS_MIX,
+            help=f"Доли статусов платежей Stripe (по умолчанию {DEFAULT_STATUS_MIX})",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Начальное значение генератора"
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="За сколько дней до --end-date распределены даты (по умолчанию 365)",
+        )
+        parser.add_argument(
+            "--end-date",
+            type=datetime.date.fromisoformat,
+            default=None,
+            help="Последний день истории в формате ГГГГ-ММ-ДД (по умолчанию сегодня)",
+        )
+        parser.add_argument(
+            "--password",
+            default="password",
+            help="Пароль всех сгенерированных пользователей (по умолчанию password)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100_000,
+            help="Количество строк в одной пачке загрузки (по умолчанию 100000)",
+        )
+        parser.add_argument(
+            "--skip-derived",
+            action="store_true",
+            help="Не перестраивать доступы и агрегаты выручки после загрузки",
+        )
+
+    def handle(self, *args, **options):
+        for name, _, _ in COUNT_ARGUMENTS:
+            if options[name.replace("-", "_")] < 0:
+                raise CommandError(f"--{name} не может быть меньше 0")
+        if options["days"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--days и --batch-size должны быть больше 0")
+        if (options["payments"] or options["courses"]) and not options["users"]:
+            raise CommandError("Для курсов и платежей нужен хотя бы один пользователь")
+        if options["payments"] and not options["courses"]:
+            raise CommandError("Для платежей нужен хотя бы один курс")
+        if options["subscriptions"] > options["users"] * options["courses"]:
+            raise CommandError(
+                "Подписок не может быть больше, чем пар пользователь-курс"
+            )
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.status_mix = parse_mix(options["status_mix"])
+        end_date = options["end_date"] or timezone.localdate()
+        self.end = datetime.datetime.combine(
+            end_date + datetime.timedelta(days=1),
+            datetime.time.min,
+            tzinfo=datetime.timezone.utc,
+        )
+        self.period = options["days"] * 86400
+        # Соль из seed: хэш, а значит и весь набор, воспроизводим
+        self.password = make_password(
+            options["password"], salt=f"dataset{options['seed']}"
+        )
+
+        with transaction.atomic():
+            self.user_ids = self.generate_users(options["users"])
+            self.courses = self.generate_courses(options["courses"])
+            self.lessons = self.generate_lessons(options["lessons_per_course"])
+            self.generate_subscriptions(options["subscriptions"])
+            self.generate_payments(options["payments"])
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [User, Course, Lesson, CourseSubscription, Payment]
+                ):
+                    cursor.execute(sql)
+
+        if not options["skip_derived"] and options["payments"]:
+            call_command(
+                "rebuild_entitlements", batch_size=self.batch_size, stdout=self.stdout
+            )
+            call_command("backfill_revenue_rollups", stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Набор данных сгенерирован."))
+
+    def random_moment(self):
+        return self.end - datetime.timedelta(seconds=self.rng.randrange(self.period))
+
+    def first_id(self, model):
+        return (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+    def load(self, model, columns, rows):
+        """Загружает строки (кортежи значений столбцов columns) пачками по batch_size."""
+        started = time.monotonic()
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.load_batch(model, columns, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.load_batch(model, columns, batch)
+            total += len(batch)
+        self.stdout.write(
+            f"  {model._meta.verbose_name_plural}: {total} "
+            f"за {time.monotonic() - started:.1f} с"
+        )
+
+    def load_batch(self, model, columns, batch):
+        if connection.vendor != "postgresql":
+            model.objects.bulk_create(
+                [model(**dict(zip(columns, row))) for row in batch]
+            )
+            return
+        buffer = io.StringIO()
+        buffer.writelines(
+            "\t".join([copy_value(value) for value in row]) + "\n" for row in batch
+        )
+        buffer.seek(0)
+        db_columns = ", ".join(
+            connection.ops.quote_name(model._meta.get_field(column).column)
+            for column in columns
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(model._meta.db_table)} "
+                f"({db_columns}) FROM STDIN",
+                buffer,
+            )
+
+    def generate_users(self, count):
+        first_id = self.first_id(User)
+        rng = self.rng
+
+        def rows():
+            for user_id in range(first_id, first_id + count):
+                joined = self.random_moment()
+                last_login = None if rng.random() < 0.2 else self.random_moment()
+                if last_login is not None and last_login < joined:
+                    joined, last_login = last_login, joined
+                yield (
+                    user_id,
+                    self.password,
+                    f"user{user_id}@generated.example.com",
+                    rng.choice(FIRST_NAMES),
+                    rng.choice(LAST_NAMES),
+                    rng.choice(CITIES),
+                    False,
+                    False,
+                    True,
+                    joined,
+                    last_login,
+                )
+
+        self.load(
+            User,
+            [
+                "id",
+                "password",
+                "email",
+                "first_name",
+                "last_name",
+                "city",
+                "is_superuser",
+                "is_staff",
+                "is_active",
+                "date_joined",
+                "last_login",
+            ],
+            rows(),
+        )
+        return range(first_id, first_id + count)
+
+    def generate_courses(self, count):
+        """Возвращает список (ID курса, ID владельца, фиксированная цена или None)."""
+        first_id = self.first_id(Course)
+        rng = self.rng
+        courses = []
+        for course_id in range(first_id, first_id + count):
+            fixed_price = (
+                rng.randrange(1000, 20000, 100) if rng.random() < 0.6 else None
+            )
+            courses.append((course_id, rng.choice(self.user_ids), fixed_price))
+
+        self.load(
+            Course,
+            [
+                "id",
+                "title",
+                "description",
+                "course_user_id",
+                "fixed_price",
+                "updated_at",
+            ],
+            (
+                (
+                    course_id,
+                    f"Курс {course_id}: {rng.choice(TOPICS)}",
+                    "Сгенерированный курс для нагрузочного тестирования.",
+                    owner_id,
+                    fixed_price,
+                    self.random_moment(),
+                )
+                for course_id, owner_id, fixed_price in courses
+            ),
+        )
+        return courses
+
+    def generate_lessons(self, per_course):
+        """
+        Возвращает список (ID урока, ID курса, цена) и дополняет курсы
+        без фиксированной цены суммой цен уроков - ценой курса при оплате.
+        """
+        first_id = self.first_id(Lesson)
+        rng = self.rng
+        lessons = []
+        for index, (course_id, owner_id, fixed_price) in enumerate(self.courses):
+            prices = [rng.randrange(100, 2000, 10) for _ in range(per_course)]
+            for price in prices:
+                lessons.append((first_id + len(lessons), course_id, owner_id, price))
+            if fixed_price is None:
+                self.courses[index] = (course_id, owner_id, sum(prices))
+
+        self.load(
+            Lesson,
+            ["id", "course_id", "title", "video_link", "price", "lesson_user_id"],
+            (
+                (
+                    lesson_id,
+                    course_id,
+                    f"Урок {lesson_id}",
+                    "https://www.youtube.com/watch?v="
+                    + "".join(rng.choices(VIDEO_ID_ALPHABET, k=11)),
+                    price,
+                    owner_id,
+                )
+                for lesson_id, course_id, owner_id, price in lessons
+            ),
+        )
+        return [(lesson_id, price) for lesson_id, _, _, price in lessons]
+
+    def generate_subscriptions(self, count):
+        first_id = self.first_id(CourseSubscription)
+        pairs = distinct_pairs(self.rng, count, len(self.user_ids), len(self.courses))
+        self.load(
+            CourseSubscription,
+            ["id", "user_id", "course_id", "created"],
+            (
+                (
+                    first_id + number,
+                    self.user_ids[user_index],
+                    self.courses[course_index][0],
+                    self.random_moment(),
+                )
+                for number, (user_index, course_index) in enumerate(pairs)
+            ),
+        )
+
+    def generate_payments(self, count):
+        first_id = self.first_id(Payment)
+        rng = self.rng
+        user_ids = self.user_ids
+        courses = self.courses
+        lessons = self.lessons
+        methods = list(PAYMENT_METHOD_WEIGHTS)
+        method_weights = list(itertools.accumulate(PAYMENT_METHOD_WEIGHTS.values()))
+        statuses, status_weights = self.status_mix
+
+        def rows():
+            for payment_id in range(first_id, first_id + count):
+                if not lessons or rng.random() < COURSE_PAYMENT_SHARE:
+                    course_id, _, amount = rng.choice(courses)
+                    lesson_id = None
+                else:
+                    lesson_id, amount = rng.choice(lessons)
+                    course_id = None
+                method = rng.choices(methods, cum_weights=method_weights)[0]
+                stripe_id = payment_url = None
+                if method == "stripe":
+                    status = rng.choices(statuses, cum_weights=status_weights)[0]
+                    stripe_id = f"cs_test_{payment_id}"
+                    payment_url = f"https://checkout.stripe.com/c/pay/{stripe_id}"
+                else:
+                    status = "succeeded"
+                    if method == "free":
+                        amount = 0
+                yield (
+                    payment_id,
+                    rng.choice(user_ids),
+                    self.random_moment(),
+                    course_id,
+                    lesson_id,
+                    amount,
+                    method,
+                    stripe_id,
+                    payment_url,
+                    status,
+                )
+
+        self.load(
+            Payment,
+            [
+                "id",
+                "user_id",
+                "payment_date",
+                "paid_course_id",
+                "paid_lesson_id",
+                "amount",
+                "payment_method",
+                "stripe_id",
+                "payment_url",
+                "status",
+            ],
+            rows(),
+        )
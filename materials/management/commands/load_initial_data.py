@@ -1,11 +1,62 @@
+import json
+import re
 from pathlib import Path
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.management import call_command
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
 
-from materials.models import Course, Lesson
-from users.models import Payment, User
+from materials.models import (LESSONS_CACHE_KEY, Course, CourseSubscription,
+                              Lesson)
+from users.authentication import revoke_user_tokens
+from users.models import Entitlement, Payment, RevenueRollup, User
+from users.signals import invalidate_roles
+
+# Таблицы, очищаемые в режиме --reset; CASCADE очищает и ссылающиеся на них
+# (группы и права пользователей, журнал админки)
+RESET_MODELS = [
+    User,
+    Course,
+    Lesson,
+    CourseSubscription,
+    Payment,
+    Entitlement,
+    RevenueRollup,
+]
+# Разделители между объектами массива фикстуры
+SEPARATORS = re.compile(r"[\s,]*")
+
+
+def iter_fixture_objects(path, chunk_size=1 << 16):
+    """
+    Объекты JSON-фикстуры (массива) по одному: файл читается кусками по chunk_size,
+    в памяти не больше куска и одного объекта.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as stream:
+        buffer = stream.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise CommandError(f"Фикстура '{path.name}' должна быть JSON-массивом")
+        position = 1
+        while True:
+            position = SEPARATORS.match(buffer, position).end()
+            if buffer.startswith("]", position):
+                return
+            try:
+                obj, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Объект обрезан границей куска: дочитываем файл
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    raise CommandError(f"Фикстура '{path.name}' повреждена")
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield obj
 
 
 class Command(BaseCommand):
@@ -13,12 +64,62 @@ class Command(BaseCommand):
     Команда Django для загрузки начальных тестовых данных в базу данных.
     Перед загрузкой данных, она удаляет существующие записи для предотвращения дублирования.
     Данные загружаются из фикстуры 'initial_data.json', расположенной в 'materials/fixtures/'.
+    С --reset (на PostgreSQL) таблицы очищаются через TRUNCATE вместо удаления ORM,
+    которое собирает каскад в Python. Фикстуры читаются потоком и записываются пачками.
+    Загрузка идёт без сигналов, поэтому доступы и агрегаты выручки затем перестраиваются
+    по загруженным платежам.
     """
 
     help = "Загружает тестовые данные из фикстуры (курсы, уроки, пользователи, платежи)"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Очистить таблицы через TRUNCATE ... RESTART IDENTITY CASCADE "
+            "(суперпользователи сохраняются)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Количество объектов фикстуры в одном запросе (по умолчанию 5000)",
+        )
+        parser.add_argument(
+            "--skip-derived",
+            action="store_true",
+            help="Не перестраивать доступы и агрегаты выручки после загрузки",
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write("Удаление данных...")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size должен быть больше 0")
+        self.batch_size = options["batch_size"]
+        # Списки уроков этих курсов в кэше устаревают после перезагрузки
+        self.course_ids = set(Course.objects.values_list("id", flat=True))
+
+        with transaction.atomic():
+            self.stdout.write("Удаление данных...")
+            if options["reset"] and connection.vendor == "postgresql":
+                self.truncate_data()
+            else:
+                self.delete_data()
+            self.stdout.write(self.style.SUCCESS("Данные удалены."))
+            self.load_fixtures()
+
+        cache.delete_many(
+            [LESSONS_CACHE_KEY.format(course_id=pk) for pk in self.course_ids]
+        )
+        if not options["skip_derived"]:
+            call_command(
+                "rebuild_entitlements",
+                batch_size=self.batch_size,
+                clear=True,
+                stdout=self.stdout,
+            )
+            call_command("backfill_revenue_rollups", stdout=self.stdout)
+
+    def delete_data(self):
         # Удаляем платежи первыми, чтобы избежать конфликтов
         Payment.objects.all().delete()
         # Удаляем уроки, так как они зависят от курсов
@@ -28,8 +129,35 @@ class Command(BaseCommand):
         # Потом пользователей (суперпользователя не удаляем)
         User.objects.filter(is_superuser=False).delete()
 
-        self.stdout.write(self.style.SUCCESS("Данные удалены."))
+    def truncate_data(self):
+        """
+        Очищает таблицы одним TRUNCATE и возвращает суперпользователей с их группами
+        и правами. Сигналы удаления при этом не срабатывают, поэтому токены и роли
+        удалённых пользователей сбрасываются здесь: их ID снова выдаются с 1.
+        """
+        superusers = list(User.objects.filter(is_superuser=True))
+        memberships = [
+            (through, list(through.objects.filter(user__in=superusers)))
+            for through in (User.groups.through, User.user_permissions.through)
+        ]
+        removed_ids = list(
+            User.objects.filter(is_superuser=False).values_list("id", flat=True)
+        )
+
+        tables = ", ".join(
+            connection.ops.quote_name(model._meta.db_table) for model in RESET_MODELS
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+        User.objects.bulk_create(superusers)
+        for through, rows in memberships:
+            through.objects.bulk_create(rows)
+        self.reset_sequences([User] + [through for through, _ in memberships])
+
+        transaction.on_commit(lambda: revoke_user_tokens(*removed_ids))
+        invalidate_roles(removed_ids)
 
+    def load_fixtures(self):
         fixture_name = "initial_data.json"
         # Путь к директории с фикстурами групп
         group_fixtures_dir = Path(settings.BASE_DIR) / "users" / "fixtures"
@@ -42,7 +170,7 @@ class Command(BaseCommand):
                 for group_file_path in group_fixture_files:
                     group_filename = group_file_path.name
                     self.stdout.write(f"  Загрузка {group_filename}...")
-                    call_command("loaddata", group_filename)
+                    self.load_fixture(group_file_path)
                 self.stdout.write(self.style.SUCCESS("Все фикстуры групп загружены."))
             else:
                 self.stdout.write(
@@ -59,9 +187,73 @@ class Command(BaseCommand):
         fixture_path = Path(settings.BASE_DIR) / "materials" / "fixtures" / fixture_name
         if fixture_path.exists():
             self.stdout.write("Загрузка фикстуры...")
-            call_command("loaddata", fixture_name)
-            self.stdout.write(self.style.SUCCESS("Данные загружены."))
+            count = self.load_fixture(fixture_path)
+            self.stdout.write(self.style.SUCCESS(f"Данные загружены ({count})."))
         else:
             self.stdout.write(
                 self.style.WARNING(f"Фикстура '{fixture_name}' не найдена.")
             )
+
+    def load_fixture(self, path):
+        """
+        Загружает фикстуру пачками по batch_size объектов одной модели, как loaddata:
+        объект с существующим ID перезаписывается. Проверка внешних ключей отложена
+        до конца файла, поэтому порядок объектов в фикстуре не важен.
+        """
+        batches = {}
+        count = 0
+        with connection.constraint_checks_disabled():
+            for deserialized in Deserializer(iter_fixture_objects(path)):
+                model = type(deserialized.object)
+                batch = batches.setdefault(model, [])
+                batch.append(deserialized)
+                if len(batch) >= self.batch_size:
+                    self.save_batch(model, batch)
+                    count += len(batch)
+                    batches[model] = []
+            for model, batch in batches.items():
+                self.save_batch(model, batch)
+                count += len(batch)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in batches]
+        )
+        self.reset_sequences(list(batches))
+        return count
+
+    def save_batch(self, model, batch):
+        if not batch:
+            return
+        fields = [
+            field.name for field in model._meta.concrete_fields if not field.primary_key
+        ]
+        model.objects.bulk_create(
+            [deserialized.object for deserialized in batch],
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=fields,
+        )
+        if model is Lesson:
+            self.course_ids.update(
+                deserialized.object.course_id for deserialized in batch
+            )
+
+        # Связи многие-ко-многим заменяются целиком, как при loaddata
+        for name in {name for deserialized in batch for name in deserialized.m2m_data}:
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source, target = field.m2m_column_name(), field.m2m_reverse_name()
+            objects = [d for d in batch if name in d.m2m_data]
+            through.objects.filter(
+                **{f"{source}__in": [d.object.pk for d in objects]}
+            ).delete()
+            through.objects.bulk_create(
+                through(**{source: d.object.pk, target: value})
+                for d in objects
+                for value in d.m2m_data[name]
+            )
+
+    def reset_sequences(self, models):
+        """Сдвигает последовательности ID за записи, вставленные с явными ID."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
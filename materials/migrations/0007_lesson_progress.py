@@ -0,0 +1,127 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_course_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CourseProgress",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "completed_lessons",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Завершено уроков"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(verbose_name="Дата обновления")),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="progress",
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="course_progress",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Прогресс по курсу",
+                "verbose_name_plural": "Прогресс по курсам",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "course"), name="unique_course_progress"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="LessonProgress",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "progress",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="Просмотренная часть урока в процентах",
+                        verbose_name="Прогресс",
+                    ),
+                ),
+                (
+                    "first_viewed_at",
+                    models.DateTimeField(verbose_name="Первый просмотр"),
+                ),
+                (
+                    "last_viewed_at",
+                    models.DateTimeField(verbose_name="Последний просмотр"),
+                ),
+                (
+                    "completed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата завершения"
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="progress",
+                        to="materials.lesson",
+                        verbose_name="Урок",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lesson_progress",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Прогресс по уроку",
+                "verbose_name_plural": "Прогресс по урокам",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "lesson"), name="unique_lesson_progress"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.db.models import Sum
 
+# Ключ кэша со списком уроков курса
+LESSONS_CACHE_KEY = "course:lessons:{course_id}"
+
 
 class Course(models.Model):
     """
@@ -60,6 +64,20 @@ class Course(models.Model):
         # 'lessons' - это related_name из ForeignKey в модели Lesson
         return self.lessons.aggregate(total_amount=Sum("price"))["total_amount"] or 0.00
 
+    @property
+    def lesson_summaries(self):
+        """
+        Возвращает ID и названия уроков курса.
+        Список хранится в кэше (в памяти процесса и в Redis) и сбрасывается при изменении
+        уроков (materials.signals), поэтому список курсов не выполняет запросов на каждый курс.
+        """
+        key = LESSONS_CACHE_KEY.format(course_id=self.pk)
+        summaries = cache.get(key)
+        if summaries is None:
+            summaries = list(self.lessons.order_by("id").values("id", "title"))
+            cache.set(key, summaries)
+        return summaries
+
     @property
     def actual_price(self):
         """
@@ -170,3 +188,83 @@ class CourseSubscription(models.Model):
 
     def __str__(self):
         return f"{self.user} - {self.course}"
+
+
+class LessonProgress(models.Model):
+    """
+    Прогресс пользователя по уроку: когда урок открыт впервые и в последний раз,
+    какая доля просмотрена (максимум по событиям) и когда урок завершён.
+    Строки пишутся не из API, а пакетами из потока событий в Redis (materials.progress).
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="lesson_progress",
+        verbose_name="Пользователь",
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        related_name="progress",
+        verbose_name="Урок",
+    )
+    progress = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Прогресс",
+        help_text="Просмотренная часть урока в процентах",
+    )
+    first_viewed_at = models.DateTimeField(verbose_name="Первый просмотр")
+    last_viewed_at = models.DateTimeField(verbose_name="Последний просмотр")
+    completed_at = models.DateTimeField(
+        blank=True, null=True, verbose_name="Дата завершения"
+    )
+
+    class Meta:
+        verbose_name = "Прогресс по уроку"
+        verbose_name_plural = "Прогресс по урокам"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "lesson"], name="unique_lesson_progress"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.lesson_id}: {self.progress}%"
+
+
+class CourseProgress(models.Model):
+    """
+    Агрегат прогресса пользователя по курсу: число завершённых уроков.
+    Пересчитывается пакетно вместе с LessonProgress, поэтому процент завершения курса
+    читается одной строкой, а не подсчётом по урокам.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="course_progress",
+        verbose_name="Пользователь",
+    )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name="progress",
+        verbose_name="Курс",
+    )
+    completed_lessons = models.PositiveIntegerField(
+        default=0, verbose_name="Завершено уроков"
+    )
+    updated_at = models.DateTimeField(verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Прогресс по курсу"
+        verbose_name_plural = "Прогресс по курсам"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "course"], name="unique_course_progress"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.course_id}: {self.completed_lessons}"
@@ -0,0 +1,263 @@
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from prometheus_client.core import GaugeMetricFamily
+from redis import RedisError, ResponseError
+from redis.exceptions import LockError
+
+from materials.models import CourseProgress, Lesson, LessonProgress
+from skillshare_platform.redis_client import get_redis
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# Поток Redis с событиями просмотра уроков и группа, читающая его для переноса в базу
+PROGRESS_STREAM = "progress:events"
+PROGRESS_GROUP = "progress-flush"
+PROGRESS_CONSUMER = "flush"
+# Через сколько миллисекунд события, выданные прерванному переносу, забираются повторно
+CLAIM_IDLE_MS = 60_000
+# Блокировка переноса: одновременные запуски писали бы пересекающиеся строки в разном
+# порядке. Истекает вместе с повторной выдачей событий, если перенос прервался
+PROGRESS_LOCK = "progress:flush-lock"
+
+
+def record_progress(user_id, lesson_id, progress):
+    """
+    Добавляет событие просмотра урока в поток Redis вместо записи в базу.
+    В базу событие попадает при следующем flush_progress_events. Поток ограничен
+    примерно LESSON_PROGRESS_STREAM_MAXLEN событиями: если перенос долго не работает,
+    отбрасываются самые старые. Если Redis недоступен, событие пишется в базу сразу.
+    """
+    try:
+        get_redis().xadd(
+            PROGRESS_STREAM,
+            {"user": user_id, "lesson": lesson_id, "progress": progress},
+            maxlen=settings.LESSON_PROGRESS_STREAM_MAXLEN,
+            approximate=True,
+        )
+    except RedisError as e:
+        logger.warning(
+            f"Поток событий прогресса недоступен, событие пишется в базу: {e}"
+        )
+        save_progress(merge_events([(user_id, lesson_id, progress, timezone.now())]))
+
+
+def merge_events(events):
+    """
+    Схлопывает события (пользователь, урок, прогресс, время) по паре пользователь-урок:
+    один INSERT ... ON CONFLICT не может изменить строку дважды.
+        Возвращает:
+            dict: (user_id, lesson_id) -> [прогресс, первый просмотр, последний просмотр,
+                  время завершения или None].
+    """
+    merged = {}
+    for user_id, lesson_id, progress, viewed_at in events:
+        completed_at = viewed_at if progress >= 100 else None
+        row = merged.get((user_id, lesson_id))
+        if row is None:
+            merged[(user_id, lesson_id)] = [
+                progress,
+                viewed_at,
+                viewed_at,
+                completed_at,
+            ]
+            continue
+        row[0] = max(row[0], progress)
+        row[1] = min(row[1], viewed_at)
+        row[2] = max(row[2], viewed_at)
+        if completed_at is not None and (row[3] is None or completed_at < row[3]):
+            row[3] = completed_at
+    return merged
+
+
+def save_progress(merged):
+    """
+    Записывает прогресс по урокам одним многострочным INSERT ... ON CONFLICT:
+    прогресс и время последнего просмотра только растут, время первого просмотра
+    и завершения остаются самыми ранними. События по удалённым урокам и пользователям
+    пропускаются. Затем одним запросом пересчитывается CourseProgress тех пар
+    пользователь-курс, в которых пакет завершил уроки.
+    """
+    if not merged:
+        return
+    quote = connection.ops.quote_name
+    progress_table = quote(LessonProgress._meta.db_table)
+    lesson_table = quote(Lesson._meta.db_table)
+    user_table = quote(User._meta.db_table)
+    timestamp = "CAST(%s AS timestamp with time zone)"
+    row_sql = f"(%s, %s, %s, {timestamp}, {timestamp}, {timestamp})"
+
+    # Строки в порядке ключа: параллельные записи блокируют их в одном порядке
+    rows = [(*key, *values) for key, values in sorted(merged.items())]
+    completed = [row[:2] for row in rows if row[5] is not None]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {progress_table} AS progress
+                (user_id, lesson_id, progress, first_viewed_at, last_viewed_at, completed_at)
+            SELECT * FROM (VALUES {", ".join([row_sql] * len(rows))}) AS event
+            WHERE EXISTS (SELECT 1 FROM {lesson_table} WHERE id = event.column2)
+                AND EXISTS (SELECT 1 FROM {user_table} WHERE id = event.column1)
+            ON CONFLICT (user_id, lesson_id) DO UPDATE SET
+                progress = GREATEST(progress.progress, EXCLUDED.progress),
+                first_viewed_at = LEAST(progress.first_viewed_at, EXCLUDED.first_viewed_at),
+                last_viewed_at = GREATEST(progress.last_viewed_at, EXCLUDED.last_viewed_at),
+                completed_at = LEAST(progress.completed_at, EXCLUDED.completed_at)
+            """,
+            [value for row in rows for value in row],
+        )
+        if not completed:
+            return
+        cursor.execute(
+            f"""
+            INSERT INTO {quote(CourseProgress._meta.db_table)}
+                (user_id, course_id, completed_lessons, updated_at)
+            SELECT progress.user_id, lesson.course_id, COUNT(*), NOW()
+            FROM {progress_table} AS progress
+            JOIN {lesson_table} AS lesson ON lesson.id = progress.lesson_id
+            WHERE progress.completed_at IS NOT NULL
+                AND (progress.user_id, lesson.course_id) IN (
+                    SELECT event.column1, event_lesson.course_id
+                    FROM (VALUES {", ".join(["(%s, %s)"] * len(completed))}) AS event
+                    JOIN {lesson_table} AS event_lesson ON event_lesson.id = event.column2
+                )
+            GROUP BY progress.user_id, lesson.course_id
+            ON CONFLICT (user_id, course_id) DO UPDATE SET
+                completed_lessons = EXCLUDED.completed_lessons,
+                updated_at = EXCLUDED.updated_at
+            """,
+            [value for key in completed for value in key],
+        )
+
+
+def _parse_entry(entry_id, fields):
+    """Событие потока -> (пользователь, урок, прогресс, время); время - из ID записи."""
+    milliseconds = int(entry_id.split("-")[0])
+    return (
+        int(fields["user"]),
+        int(fields["lesson"]),
+        int(fields["progress"]),
+        datetime.datetime.fromtimestamp(milliseconds / 1000, tz=datetime.timezone.utc),
+    )
+
+
+def _save_entries(redis_client, entries):
+    events = []
+    for entry_id, fields in entries:
+        # XAUTOCLAIM возвращает пустые поля для событий, отброшенных по MAXLEN
+        if not fields:
+            continue
+        try:
+            events.append(_parse_entry(entry_id, fields))
+        except (KeyError, ValueError):
+            logger.warning(
+                f"Пропущено некорректное событие прогресса {entry_id}: {fields}"
+            )
+    save_progress(merge_events(events))
+
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xack(PROGRESS_STREAM, PROGRESS_GROUP, *entry_ids)
+    pipe.xdel(PROGRESS_STREAM, *entry_ids)
+    pipe.execute()
+
+
+class ProgressLagCollector:
+    """
+    Отставание переноса событий в базу, считается по потоку при каждом запросе /metrics,
+    а не задачей переноса: если перенос встал, метрики продолжают расти. Обработанные
+    события удаляются из потока, поэтому его длина - число ещё не записанных в базу.
+    """
+
+    def collect(self):
+        try:
+            redis_client = get_redis()
+            length = redis_client.xlen(PROGRESS_STREAM)
+            oldest = redis_client.xrange(PROGRESS_STREAM, count=1)
+        except RedisError as e:
+            logger.warning(f"Не удалось получить отставание переноса прогресса: {e}")
+            return
+        age = (
+            max(0, time.time() - int(oldest[0][0].split("-")[0]) / 1000)
+            if oldest
+            else 0
+        )
+        yield GaugeMetricFamily(
+            "lesson_progress_lag_events",
+            "События прогресса по урокам, ещё не перенесённые в базу",
+            value=length,
+        )
+        yield GaugeMetricFamily(
+            "lesson_progress_lag_seconds",
+            "Возраст самого старого не перенесённого события прогресса",
+            value=age,
+        )
+
+
+def flush_progress_events(batch_size=None, max_batches=None):
+    """
+    Переносит события просмотра уроков из потока Redis в базу: не больше max_batches
+    пакетов по batch_size за запуск, остальное - при следующем запуске. Одновременно
+    выполняется только один перенос (блокировка PROGRESS_LOCK), остальные запуски
+    сразу завершаются. События читаются через группу потребителей и удаляются
+    из потока только после записи в базу; события, выданные прерванному переносу,
+    забираются повторно через CLAIM_IDLE_MS. Повторная запись события ничего не меняет.
+        Возвращает:
+            int: Количество обработанных событий.
+    """
+    batch_size = batch_size or settings.LESSON_PROGRESS_BATCH_SIZE
+    max_batches = max_batches or settings.LESSON_PROGRESS_MAX_BATCHES
+    redis_client = get_redis()
+    lock = redis_client.lock(
+        PROGRESS_LOCK, timeout=CLAIM_IDLE_MS / 1000, blocking=False
+    )
+    if not lock.acquire():
+        logger.info("Перенос прогресса по урокам уже выполняется, запуск пропущен")
+        return 0
+    try:
+        return _flush_batches(redis_client, batch_size, max_batches)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # Блокировка истекла: перенос шёл дольше CLAIM_IDLE_MS
+            logger.warning("Блокировка переноса прогресса по урокам истекла")
+
+
+def _flush_batches(redis_client, batch_size, max_batches):
+    try:
+        redis_client.xgroup_create(
+            PROGRESS_STREAM, PROGRESS_GROUP, id="0", mkstream=True
+        )
+    except ResponseError:
+        # Группа уже создана (BUSYGROUP)
+        pass
+
+    _, entries, *_ = redis_client.xautoclaim(
+        PROGRESS_STREAM,
+        PROGRESS_GROUP,
+        PROGRESS_CONSUMER,
+        min_idle_time=CLAIM_IDLE_MS,
+        count=batch_size,
+    )
+    total = 0
+    for _ in range(max_batches):
+        if not entries:
+            response = redis_client.xreadgroup(
+                PROGRESS_GROUP,
+                PROGRESS_CONSUMER,
+                {PROGRESS_STREAM: ">"},
+                count=batch_size,
+            )
+            entries = response[0][1] if response else []
+        if not entries:
+            break
+        _save_entries(redis_client, entries)
+        total += len(entries)
+        entries = None
+    return total
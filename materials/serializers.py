@@ -25,19 +25,51 @@ class CourseLessonSerializer(serializers.ModelSerializer):
 
 class CourseSerializer(serializers.ModelSerializer):
     lessons_count = serializers.SerializerMethodField()
-    lessons = CourseLessonSerializer(many=True, read_only=True)
+    lessons = CourseLessonSerializer(
+        source="lesson_summaries", many=True, read_only=True
+    )
     is_subscribed = serializers.SerializerMethodField()
+    completion_percent = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
         fields = "__all__"
 
     def get_lessons_count(self, obj) -> int:
-        return obj.lessons.count()
+        return len(obj.lesson_summaries)
 
     def get_is_subscribed(self, obj) -> bool:
         """Проверяет подписку текущего пользователя на курс"""
+        # Курсы из CourseViewSet уже содержат подписку в аннотации user_is_subscribed
+        if hasattr(obj, "user_is_subscribed"):
+            return obj.user_is_subscribed
         request = self.context.get("request")
         if request and request.user.is_authenticated:
-            return obj.subscribers.filter(user=request.user).exists()
+            return obj.subscribers.filter(user_id=request.user.pk).exists()
         return False
+
+    def get_completion_percent(self, obj) -> int:
+        """Процент уроков курса, завершённых текущим пользователем (агрегат CourseProgress)"""
+        # Курсы из CourseViewSet уже содержат число завершённых уроков в аннотации
+        if hasattr(obj, "user_completed_lessons"):
+            completed = obj.user_completed_lessons
+        else:
+            request = self.context.get("request")
+            if not request or not request.user.is_authenticated:
+                return 0
+            completed = (
+                obj.progress.filter(user_id=request.user.pk)
+                .values_list("completed_lessons", flat=True)
+                .first()
+            )
+        lessons_count = len(obj.lesson_summaries)
+        if not completed or not lessons_count:
+            return 0
+        # Удалённые уроки остаются в агрегате до следующего завершения урока курса
+        return min(100, round(100 * completed / lessons_count))
+
+
+class LessonProgressSerializer(serializers.Serializer):
+    """Событие просмотра урока: просмотренная часть в процентах (0 - урок открыт)."""
+
+    progress = serializers.IntegerField(min_value=0, max_value=100, default=0)
@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from materials.models import LESSONS_CACHE_KEY, Lesson
+
+
+@receiver(pre_save, sender=Lesson)
+def remember_previous_course(sender, instance, **kwargs):
+    """Запоминает курс урока до сохранения: при переносе урока меняются списки обоих курсов."""
+    instance._previous_course_id = (
+        Lesson.objects.filter(pk=instance.pk)
+        .values_list("course_id", flat=True)
+        .first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_course_lessons(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш списка уроков курса сразу и ещё раз после фиксации транзакции:
+    до фиксации параллельный запрос может успеть закэшировать старый список.
+    """
+    course_ids = {instance.course_id, getattr(instance, "_previous_course_id", None)}
+    keys = [
+        LESSONS_CACHE_KEY.format(course_id=course_id)
+        for course_id in course_ids
+        if course_id is not None
+    ]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -4,9 +4,15 @@ import logging
 from celery import shared_task
 from django.conf import settings
 from django.core.mail import send_mail
+from django.db import DatabaseError
+from django.db.models.functions import Greatest
 from django.utils import timezone
+from redis import RedisError
 
 from materials.models import Course, CourseSubscription
+from materials.progress import flush_progress_events
+from users.activity import flush_user_activity
+from users.authentication import revoke_user_tokens
 from users.models import User
 
 logger = logging.getLogger(__name__)
@@ -74,7 +80,7 @@ def send_course_update_notification(course_id: int):
 def deactivate_inactive_users():
     """
     Фоновая задача Celery для деактивации пользователей, которые
-    не заходили на сайт более одного месяца.
+    не заходили на сайт и не обращались к API более одного месяца.
     После деактивации пользователю отправляется уведомление по электронной почте.
 
     Эта задача запускается Celery Beat по расписанию,
@@ -85,22 +91,34 @@ def deactivate_inactive_users():
 
     logger.info(f"Начало проверки неактивных пользователей. Порог: {month_ago}")
 
+    # last_login и last_seen накапливаются в Redis - сначала переносим их в базу
+    try:
+        flush_user_activity()
+    except RedisError as e:
+        logger.error(
+            f"Не удалось перенести активность пользователей, деактивация отложена: {e}"
+        )
+        return
+
     # Находим пользователей, которые активны, не являются суперпользователями
-    # и их последний вход был раньше, чем месяц назад.
+    # и их последний вход или запрос к API был раньше, чем месяц назад.
     # Исключаем суперпользователей, чтобы случайно не заблокировать администраторов.
-    inactive_users = User.objects.filter(
-        is_active=True, is_superuser=False, last_login__lt=month_ago
-    )
+    inactive_users = User.objects.annotate(
+        last_activity=Greatest("last_login", "last_seen")
+    ).filter(is_active=True, is_superuser=False, last_activity__lt=month_ago)
 
     if inactive_users.exists():
         # Собираем email-адреса пользователей перед деактивацией
         deactivated_user_emails = [user.email for user in inactive_users if user.email]
+        deactivated_user_ids = [user.id for user in inactive_users]
         # Добавим лог с пользователями, которые будут деактивированы
         logger.info(f"Найдены пользователи для деактивации: {deactivated_user_emails}")
 
         # Обновляем флаг is_active для найденных пользователей
         count = inactive_users.update(is_active=False)
         logger.info(f"Деактивировано {count} неактивных пользователей.")
+        # update() не вызывает сигналы, поэтому отзываем токены явно
+        revoke_user_tokens(*deactivated_user_ids)
 
         # Отправляем уведомления деактивированным пользователям
         subject = "Ваш аккаунт на SkillShare был деактивирован"
@@ -137,3 +155,26 @@ def deactivate_inactive_users():
             logger.info("Нет email-адресов для отправки уведомлений о деактивации.")
     else:
         logger.info("Не найдено пользователей для деактивации.")
+
+
+@shared_task
+def flush_lesson_progress():
+    """
+    Фоновая задача Celery для переноса событий просмотра уроков из потока Redis
+    в таблицы прогресса (LessonProgress, CourseProgress) пакетными запросами.
+
+    Эта задача запускается Celery Beat по расписанию,
+    определенному в настройках Django (CELERY_BEAT_SCHEDULE).
+    """
+    try:
+        count = flush_progress_events()
+    except RedisError as e:
+        logger.error(f"Не удалось перенести прогресс по урокам из Redis: {e}")
+        return
+    except DatabaseError as e:
+        # События остаются в потоке и будут перенесены повторно
+        logger.error(f"Не удалось записать прогресс по урокам в базу: {e}")
+        return
+    if count:
+        logger.info(f"Событий прогресса по урокам перенесено в базу: {count}")
+    return count
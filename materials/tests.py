@@ -1,15 +1,40 @@
+import datetime
+import json
+from io import StringIO
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 from urllib.error import URLError
 
+import fakeredis
+from asgiref.sync import async_to_sync, iscoroutinefunction
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from django.test import (AsyncRequestFactory, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from prometheus_client.parser import text_string_to_metric_families
+from redis import RedisError
 from rest_framework import status
-from rest_framework.test import APIClient, APITestCase
-
-from materials.models import Course, CourseSubscription, Lesson
+from rest_framework.test import APIClient, APITestCase, force_authenticate
+
+from materials.management.commands.load_initial_data import \
+    iter_fixture_objects
+from materials.models import (Course, CourseProgress, CourseSubscription,
+                              Lesson, LessonProgress)
+from materials.progress import (PROGRESS_LOCK, PROGRESS_STREAM,
+                                flush_progress_events, record_progress)
+from materials.tasks import flush_lesson_progress
 from materials.validators import validate_youtube_url
+from materials.views import (CourseViewSet, LessonListCreateAPIView,
+                             LessonRetrieveUpdateDestroyAPIView)
+from users.models import Entitlement, Payment, RevenueRollup
 
 User = get_user_model()
 
@@ -485,3 +510,436 @@ class ValidatorTest(APITestCase):
         with self.assertRaises(ValidationError) as cm:
             validate_youtube_url(url)
         self.assertIn("Видео недоступно", cm.exception.message)
+
+
+class MaterialsAdminQueriesTest(APITestCase):
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(
+            email="admin@example.com", password="pass"
+        )
+        self.client.force_login(self.superuser)
+
+    def add_courses(self, count):
+        for _ in range(count):
+            course = Course.objects.create(title="Курс", course_user=self.superuser)
+            Lesson.objects.create(
+                course=course, title="Урок", price=100, lesson_user=self.superuser
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_changelists_do_not_depend_on_rows_count(self):
+        """Число запросов списков курсов и уроков не растёт с числом строк."""
+        for name in (
+            "admin:materials_course_changelist",
+            "admin:materials_lesson_changelist",
+        ):
+            with self.subTest(name=name):
+                self.add_courses(2)
+                queries = self.count_queries(reverse(name))
+                self.add_courses(5)
+                self.assertEqual(self.count_queries(reverse(name)), queries)
+
+    def test_course_prices_from_annotation(self):
+        """Стоимость по урокам в админке совпадает со свойством модели."""
+        self.add_courses(1)
+        course = Course.objects.get()
+        Lesson.objects.create(course=course, title="Урок 2", price=50)
+        response = self.client.get(reverse("admin:materials_course_changelist"))
+        self.assertContains(
+            response, f"{course.calculated_price_from_lessons:.2f} руб."
+        )
+
+
+@override_settings(ASYNC_VIEWS=True)
+class AsyncMaterialsViewsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.other_user = User.objects.create_user(
+            email="other@example.com", password="pass"
+        )
+        self.course = Course.objects.create(title="Курс", course_user=self.user)
+        self.lesson = Lesson.objects.create(
+            course=self.course, title="Урок", lesson_user=self.user
+        )
+        Course.objects.create(title="Чужой курс", course_user=self.other_user)
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, url, user, **kwargs):
+        """Вызывает асинхронное представление так же, как ASGI-обработчик Django."""
+        self.assertTrue(iscoroutinefunction(view))
+        request = self.factory.get(url, {"page_size": 1})
+        force_authenticate(request, user)
+        response = async_to_sync(view)(request, **kwargs)
+        response.render()
+        return response
+
+    def assert_same_as_sync(self, view, url, user, **kwargs):
+        response = self.call(view, url, user, **kwargs)
+        self.client.force_authenticate(user)
+        expected = self.client.get(url, {"page_size": 1})
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.data, expected.data)
+        return response
+
+    def test_async_views_return_same_data(self):
+        """Асинхронные обработчики отвечают так же, как синхронные."""
+        cases = [
+            (
+                CourseViewSet.as_view({"get": "list"}),
+                reverse("materials:course-list"),
+                {},
+            ),
+            (
+                CourseViewSet.as_view({"get": "retrieve"}),
+                reverse("materials:course-detail", args=[self.course.id]),
+                {"pk": self.course.id},
+            ),
+            (
+                LessonListCreateAPIView.as_view(),
+                reverse("materials:lesson-list-create"),
+                {},
+            ),
+            (
+                LessonRetrieveUpdateDestroyAPIView.as_view(),
+                reverse("materials:lesson-detail", args=[self.lesson.id]),
+                {"pk": self.lesson.id},
+            ),
+        ]
+        for view, url, kwargs in cases:
+            with self.subTest(url=url):
+                response = self.assert_same_as_sync(view, url, self.user, **kwargs)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_async_views_keep_permissions(self):
+        """Чужой курс недоступен, список фильтруется по владельцу, без токена - 401."""
+        view = CourseViewSet.as_view({"get": "retrieve"})
+        url = reverse("materials:course-detail", args=[self.course.id])
+        response = self.assert_same_as_sync(
+            view, url, self.other_user, pk=self.course.id
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.call(
+            CourseViewSet.as_view({"get": "list"}),
+            reverse("materials:course-list"),
+            self.other_user,
+        )
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(response.data["results"][0]["title"], "Чужой курс")
+
+        response = self.call(
+            LessonListCreateAPIView.as_view(),
+            reverse("materials:lesson-list-create"),
+            None,
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_writes_use_sync_implementation(self):
+        """Запись через асинхронное представление выполняется синхронным кодом."""
+        view = LessonRetrieveUpdateDestroyAPIView.as_view()
+        request = self.factory.patch(
+            reverse("materials:lesson-detail", args=[self.lesson.id]),
+            {"title": "Новое название"},
+            content_type="application/json",
+        )
+        force_authenticate(request, self.user)
+        response = async_to_sync(view)(request, pk=self.lesson.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.title, "Новое название")
+
+
+class GenerateDatasetCommandTest(APITestCase):
+    options = {
+        "users": 20,
+        "courses": 4,
+        "lessons_per_course": 3,
+        "subscriptions": 30,
+        "payments": 200,
+        "end_date": datetime.date(2025, 1, 31),
+        "stdout": StringIO(),
+    }
+
+    def snapshot(self):
+        return (
+            list(User.objects.order_by("id").values_list()),
+            list(Course.objects.order_by("id").values_list()),
+            list(Lesson.objects.order_by("id").values_list()),
+            list(CourseSubscription.objects.order_by("id").values_list()),
+            list(Payment.objects.order_by("id").values_list()),
+        )
+
+    def test_generates_requested_counts(self):
+        call_command("generate_dataset", password="secret", **self.options)
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Lesson.objects.count(), 12)
+        self.assertEqual(CourseSubscription.objects.count(), 30)
+        self.assertEqual(Payment.objects.count(), 200)
+        self.assertEqual(
+            set(Payment.objects.values_list("status", flat=True)),
+            {"succeeded", "failed", "pending"},
+        )
+        self.assertFalse(
+            Payment.objects.filter(payment_date__date__gt=datetime.date(2025, 1, 31))
+        )
+        self.assertEqual(User.objects.values("password").distinct().count(), 1)
+        self.assertTrue(User.objects.first().check_password("secret"))
+        self.assertTrue(Entitlement.objects.exists())
+
+    def test_same_seed_same_dataset(self):
+        call_command("generate_dataset", seed=7, skip_derived=True, **self.options)
+        first = self.snapshot()
+        for model in (Payment, CourseSubscription, Lesson, Course, User):
+            model.objects.all().delete()
+        call_command("generate_dataset", seed=7, skip_derived=True, **self.options)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_invalid_status_mix(self):
+        with self.assertRaises(CommandError):
+            call_command("generate_dataset", status_mix="paid=1", **self.options)
+
+
+class LoadInitialDataCommandTest(TransactionTestCase):
+    """TRUNCATE не выполняется в транзакции с отложенными проверками ключей - без TestCase."""
+
+    serialized_rollback = True
+    fixture_path = Path(__file__).parent / "fixtures" / "initial_data.json"
+
+    def setUp(self):
+        self.fixture = json.loads(self.fixture_path.read_text(encoding="utf-8"))
+        self.curators = Group.objects.create(name="Кураторы")
+        # Объекты фикстуры перезаписывают строки с теми же ID, как при loaddata
+        self.admin = User.objects.create_superuser(
+            id=1000, email="admin@example.com", password="pass"
+        )
+        self.admin.groups.add(self.curators)
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        course = Course.objects.create(title="Старый курс", course_user=self.user)
+        Payment.objects.create(user=self.user, paid_course=course, amount=100)
+
+    def fixture_count(self, model):
+        label = model._meta.label_lower
+        return sum(1 for obj in self.fixture if obj["model"] == label)
+
+    def assert_fixture_loaded(self):
+        for model in (Course, Lesson, Payment):
+            self.assertEqual(model.objects.count(), self.fixture_count(model))
+        self.assertTrue(User.objects.filter(pk=self.admin.pk, is_superuser=True))
+        self.assertFalse(User.objects.filter(email="user@example.com"))
+        self.assertEqual(Group.objects.get(pk=1).permissions.count(), 4)
+        # Доступы и выручка перестроены по загруженным успешным платежам
+        succeeded = Payment.objects.filter(status="succeeded")
+        self.assertTrue(succeeded)
+        self.assertEqual(
+            Entitlement.objects.count(),
+            succeeded.values("user", "paid_course", "paid_lesson").distinct().count(),
+        )
+        self.assertEqual(
+            RevenueRollup.objects.aggregate(total=Sum("payments_count"))["total"],
+            succeeded.count(),
+        )
+
+    def test_reset_truncates_and_keeps_superusers(self):
+        call_command("load_initial_data", reset=True, batch_size=2, stdout=StringIO())
+        self.assert_fixture_loaded()
+        admin = User.objects.get(email="admin@example.com")
+        self.assertTrue(admin.check_password("pass"))
+        self.assertEqual(list(admin.groups.all()), [self.curators])
+        # Последовательности продолжаются после загруженных ID
+        course = Course.objects.create(title="Новый курс")
+        self.assertEqual(
+            course.pk,
+            max(obj["pk"] for obj in self.fixture if obj["model"] == "materials.course")
+            + 1,
+        )
+
+    def test_repeated_load_overwrites_rows(self):
+        call_command("load_initial_data", stdout=StringIO())
+        Course.objects.filter(pk=1).update(title="Изменено")
+        call_command("load_initial_data", stdout=StringIO())
+        self.assert_fixture_loaded()
+        self.assertNotEqual(Course.objects.get(pk=1).title, "Изменено")
+
+    def test_fixture_streamed_in_small_chunks(self):
+        objects = list(iter_fixture_objects(self.fixture_path, chunk_size=7))
+        self.assertEqual(objects, self.fixture)
+
+
+class LessonProgressTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="student@example.com", password="pass"
+        )
+        self.course = Course.objects.create(title="Курс", course_user=self.user)
+        self.lessons = [
+            Lesson.objects.create(
+                course=self.course, title=f"Урок {number}", lesson_user=self.user
+            )
+            for number in range(4)
+        ]
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        redis_patcher = patch("skillshare_platform.redis_client._client", self.redis)
+        redis_patcher.start()
+        self.addCleanup(redis_patcher.stop)
+        self.client.force_authenticate(self.user)
+
+    def send(self, lesson, progress):
+        return self.client.post(
+            reverse("materials:lesson-progress", args=[lesson.pk]),
+            {"progress": progress},
+            format="json",
+        )
+
+    def test_events_are_buffered_in_stream(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send(self.lessons[0], 30)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(
+            any(query["sql"].startswith("INSERT") for query in queries.captured_queries)
+        )
+        self.assertEqual(self.redis.xlen(PROGRESS_STREAM), 1)
+        self.assertFalse(LessonProgress.objects.exists())
+
+        self.assertEqual(
+            self.send(self.lessons[0], 101).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        missing = Lesson(pk=self.lessons[-1].pk + 100)
+        self.assertEqual(self.send(missing, 50).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.redis.xlen(PROGRESS_STREAM), 1)
+
+    def test_progress_only_for_accessible_lessons(self):
+        """Чужой урок неотличим от несуществующего, пока материал не куплен."""
+        author = User.objects.create_user(email="author@example.com", password="pass")
+        course = Course.objects.create(title="Чужой курс", course_user=author)
+        lesson = Lesson.objects.create(
+            course=course, title="Чужой урок", lesson_user=author
+        )
+        self.assertEqual(self.send(lesson, 50).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.redis.xlen(PROGRESS_STREAM), 0)
+
+        Entitlement.objects.create(
+            user=self.user,
+            course=course,
+            payment_method="stripe",
+            granted_at=timezone.now(),
+        )
+        self.assertEqual(self.send(lesson, 50).status_code, status.HTTP_202_ACCEPTED)
+
+        moderator = User.objects.create_user(email="mod@example.com", password="pass")
+        moderator.groups.add(Group.objects.get_or_create(name="Moderators")[0])
+        self.client.force_authenticate(moderator)
+        self.assertEqual(
+            self.send(self.lessons[0], 50).status_code, status.HTTP_202_ACCEPTED
+        )
+
+    def test_flush_merges_events_in_batches(self):
+        self.send(self.lessons[0], 0)
+        self.send(self.lessons[0], 100)
+        self.send(self.lessons[0], 40)
+        self.send(self.lessons[1], 60)
+        self.send(self.lessons[2], 100)
+        deleted = Lesson.objects.create(
+            course=self.course, title="Удалённый урок", lesson_user=self.user
+        )
+        self.send(deleted, 50)
+        deleted.delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_progress_events(batch_size=3), 6)
+        inserts = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].lstrip().startswith("INSERT")
+        ]
+        # Пакеты из 3 событий: прогресс уроков и пересчёт курса в каждом пакете
+        self.assertEqual(len(inserts), 4)
+
+        first = LessonProgress.objects.get(lesson=self.lessons[0])
+        self.assertEqual(first.progress, 100)
+        self.assertIsNotNone(first.completed_at)
+        self.assertLessEqual(first.first_viewed_at, first.completed_at)
+        self.assertEqual(LessonProgress.objects.count(), 3)
+        self.assertEqual(
+            CourseProgress.objects.get(
+                user=self.user, course=self.course
+            ).completed_lessons,
+            2,
+        )
+        self.assertEqual(self.redis.xlen(PROGRESS_STREAM), 0)
+
+        response = self.client.get(
+            reverse("materials:course-detail", args=[self.course.pk])
+        )
+        self.assertEqual(response.data["completion_percent"], 50)
+
+    def scrape_lag(self):
+        """Отставание переноса из ответа /metrics: (события, секунды)."""
+        samples = {
+            sample.name: sample.value
+            for family in text_string_to_metric_families(
+                self.client.get("/metrics").content.decode()
+            )
+            for sample in family.samples
+        }
+        return (
+            samples["lesson_progress_lag_events"],
+            samples["lesson_progress_lag_seconds"],
+        )
+
+    def test_lag_metric_and_reclaim_of_interrupted_flush(self):
+        for lesson in self.lessons:
+            self.send(lesson, 100)
+        # Отставание видно без запуска переноса
+        events, seconds = self.scrape_lag()
+        self.assertEqual(events, 4)
+        self.assertGreaterEqual(seconds, 0)
+
+        # Перенос прервался после чтения событий: они остаются в потоке
+        with patch("materials.progress.save_progress", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                flush_progress_events()
+        self.assertEqual(flush_progress_events(), 0)
+        self.assertEqual(self.scrape_lag()[0], 4)
+
+        # Некорректное событие пропускается, но удаляется из потока
+        self.redis.xadd(PROGRESS_STREAM, {"user": self.user.pk})
+        with patch("materials.progress.CLAIM_IDLE_MS", 0):
+            self.assertEqual(flush_progress_events(), 5)
+        self.assertEqual(self.scrape_lag(), (0, 0))
+        self.assertEqual(
+            CourseProgress.objects.get(user=self.user).completed_lessons, 4
+        )
+
+    def test_flush_is_capped_and_runs_once_at_a_time(self):
+        for lesson in reversed(self.lessons):
+            self.send(lesson, 100)
+        self.assertEqual(flush_progress_events(batch_size=1, max_batches=3), 3)
+        self.assertEqual(self.redis.xlen(PROGRESS_STREAM), 1)
+
+        # Пока блокировку держит другой перенос, запуск ничего не делает
+        lock = self.redis.lock(PROGRESS_LOCK, timeout=60)
+        lock.acquire()
+        self.assertEqual(flush_progress_events(), 0)
+        lock.release()
+        self.assertEqual(flush_progress_events(), 1)
+        self.assertEqual(
+            CourseProgress.objects.get(user=self.user).completed_lessons, 4
+        )
+
+        self.send(self.lessons[0], 50)
+        with patch("materials.progress.save_progress", side_effect=DatabaseError):
+            self.assertIsNone(flush_lesson_progress())
+        self.assertEqual(self.redis.xlen(PROGRESS_STREAM), 1)
+
+    @patch("skillshare_platform.redis_client._client")
+    def test_redis_unavailable_writes_to_database(self, redis_client):
+        redis_client.xadd.side_effect = RedisError("недоступен")
+        record_progress(self.user.pk, self.lessons[0].pk, 100)
+        self.assertEqual(LessonProgress.objects.get().progress, 100)
+        self.assertEqual(CourseProgress.objects.get().completed_lessons, 1)
@@ -2,7 +2,7 @@ from django.urls import path
 from rest_framework.routers import DefaultRouter
 
 from materials.views import (CourseSubscriptionView, CourseViewSet,
-                             LessonListCreateAPIView,
+                             LessonListCreateAPIView, LessonProgressView,
                              LessonRetrieveUpdateDestroyAPIView)
 
 app_name = "materials"
@@ -17,6 +17,11 @@ urlpatterns = [
         LessonRetrieveUpdateDestroyAPIView.as_view(),
         name="lesson-detail",
     ),
+    path(
+        "lessons/<int:pk>/progress/",
+        LessonProgressView.as_view(),
+        name="lesson-progress",
+    ),
     path(
         "courses/subscribe/", CourseSubscriptionView.as_view(), name="course_subscribe"
     ),
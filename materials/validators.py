@@ -4,6 +4,8 @@ from urllib.request import urlopen
 
 from django.core.exceptions import ValidationError
 
+from skillshare_platform.instrumentation import record_time
+
 
 def validate_youtube_url(value):
     """
@@ -35,7 +37,8 @@ def validate_youtube_url(value):
         )
 
     try:
-        response = urlopen(value)
+        with record_time("http"):
+            response = urlopen(value)
         if response.getcode() != 200:
             raise ValidationError("Видео недоступно")
     except URLError:
@@ -1,5 +1,7 @@
 from datetime import timedelta
 
+from django.db.models import Exists, OuterRef, Subquery
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from drf_spectacular.utils import extend_schema
@@ -8,19 +10,25 @@ from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from materials.models import Course, CourseSubscription, Lesson
+from materials.models import Course, CourseProgress, CourseSubscription, Lesson
 from materials.paginators import MaterialsPagination
-from materials.serializers import CourseSerializer, LessonSerializer
+from materials.progress import record_progress
+from materials.serializers import (CourseSerializer, LessonProgressSerializer,
+                                   LessonSerializer)
 from materials.tasks import send_course_update_notification
+from skillshare_platform.async_views import AsyncReadMixin
 from users.permissions import (IsNotModerator, IsOwnerOrModerator,
                                IsOwnerOrSuperuser)
+from users.services import get_accessible_lessons
+from users.throttling import RedisTokenBucketThrottle
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     """
     ViewSet для CRUD операций с курсами.
     Обеспечивает, что не-модераторы могут видеть, редактировать и удалять только свои курсы.
     Модераторы и администраторы имеют полный доступ.
+    В ASGI-развёртывании список и детали курса обслуживаются асинхронно (alist, aretrieve).
     """
 
     # permission_classes = [IsAuthenticated]
@@ -34,14 +42,27 @@ class CourseViewSet(viewsets.ModelViewSet):
         if getattr(self, "swagger_fake_view", False):
             return Course.objects.none()
 
+        # Подписка и прогресс текущего пользователя вычисляются в том же запросе, что и курсы,
+        # а не отдельным запросом на каждый курс (CourseSerializer.get_is_subscribed,
+        # CourseSerializer.get_completion_percent)
+        courses = Course.objects.annotate(
+            user_is_subscribed=Exists(
+                CourseSubscription.objects.filter(
+                    course_id=OuterRef("pk"), user_id=self.request.user.pk
+                )
+            ),
+            user_completed_lessons=Subquery(
+                CourseProgress.objects.filter(
+                    course_id=OuterRef("pk"), user_id=self.request.user.pk
+                ).values("completed_lessons")[:1]
+            ),
+        )
+
         # Если пользователь не является суперпользователем и не входит в группу модераторов,
         # он видит только свои курсы. В противном случае (модератор/админ) видит все курсы.
-        if (
-            not self.request.user.is_superuser
-            and not self.request.user.groups.filter(name="Moderators").exists()
-        ):
-            return Course.objects.filter(course_user=self.request.user)
-        return Course.objects.all()
+        if not self.request.user.is_superuser and not self.request.user.is_moderator:
+            return courses.filter(course_user_id=self.request.user.pk)
+        return courses
 
     def get_permissions(self):
         # Динамическое определение прав доступа в зависимости от действия
@@ -153,10 +174,11 @@ class CourseViewSet(viewsets.ModelViewSet):
     description="Позволяет авторизованным пользователям (не модераторам) создавать новые уроки.",
     tags=["Lessons"],
 )
-class LessonListCreateAPIView(generics.ListCreateAPIView):
+class LessonListCreateAPIView(AsyncReadMixin, generics.ListCreateAPIView):
     """
     Generic-класс для получения списка уроков и создания нового урока.
     Обеспечивает, что не-модераторы могут видеть только свои уроки и создавать новые.
+    В ASGI-развёртывании список уроков обслуживается асинхронно.
     """
 
     # queryset = Lesson.objects.all()
@@ -171,11 +193,8 @@ class LessonListCreateAPIView(generics.ListCreateAPIView):
         # Если пользователь не является суперпользователем и не входит в группу модераторов,
         # он видит только свои уроки. В противном случае (модератор/админ) видит все уроки.
         # Уроки фильтруются по полю lesson_user (владелец урока).
-        if (
-            not self.request.user.is_superuser
-            and not self.request.user.groups.filter(name="Moderators").exists()
-        ):
-            return Lesson.objects.filter(lesson_user=self.request.user)
+        if not self.request.user.is_superuser and not self.request.user.is_moderator:
+            return Lesson.objects.filter(lesson_user_id=self.request.user.pk)
         return Lesson.objects.all()
 
     def get_permissions(self):
@@ -197,6 +216,9 @@ class LessonListCreateAPIView(generics.ListCreateAPIView):
         """
         serializer.save(lesson_user=self.request.user)
 
+    async def aget(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
 
 @extend_schema(
     methods=["GET"],
@@ -216,10 +238,13 @@ class LessonListCreateAPIView(generics.ListCreateAPIView):
     description="Позволяет владельцу или администратору удалить урок. Модераторам удаление запрещено.",
     tags=["Lessons"],
 )
-class LessonRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class LessonRetrieveUpdateDestroyAPIView(
+    AsyncReadMixin, generics.RetrieveUpdateDestroyAPIView
+):
     """
     Generic-класс для получения, обновления и удаления конкретного урока.
     Обеспечивает, что не-модераторы могут просматривать, обновлять и удалять только свои уроки.
+    В ASGI-развёртывании детали урока обслуживаются асинхронно.
     """
 
     # queryset = Lesson.objects.all()
@@ -232,11 +257,8 @@ class LessonRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
 
         # Для действий с одним объектом, также фильтруем queryset, чтобы предотвратить доступ
         # к чужим объектам через прямой URL для не-модераторов.
-        if (
-            not self.request.user.is_superuser
-            and not self.request.user.groups.filter(name="Moderators").exists()
-        ):
-            return Lesson.objects.filter(lesson_user=self.request.user)
+        if not self.request.user.is_superuser and not self.request.user.is_moderator:
+            return Lesson.objects.filter(lesson_user_id=self.request.user.pk)
         return Lesson.objects.all()
 
     def get_permissions(self):
@@ -284,6 +306,9 @@ class LessonRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
             # чтобы это поле обновилось до текущего времени.
             course_of_lesson.save()
 
+    async def aget(self, request, *args, **kwargs):
+        return await self.aretrieve(request, *args, **kwargs)
+
 
 class CourseSubscriptionView(APIView):
     """
@@ -340,3 +365,40 @@ class CourseSubscriptionView(APIView):
             message = "Подписка добавлена"
 
         return Response({"message": message}, status=status.HTTP_200_OK)
+
+
+class LessonProgressView(APIView):
+    """
+    Приём событий просмотра урока: урок открыт или просмотрен на progress процентов.
+    Событие добавляется в поток Redis и переносится в базу пакетами задачей
+    flush_lesson_progress (materials.progress), поэтому запрос не пишет в базу, а только
+    проверяет, что урок доступен пользователю (get_accessible_lessons). На недоступный
+    урок, как и на несуществующий, ответ 404.
+    """
+
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [RedisTokenBucketThrottle]
+    throttle_scope = "progress"
+
+    @extend_schema(
+        summary="Событие просмотра урока",
+        description="Отмечает, что пользователь открыл урок или просмотрел его на `progress` процентов. "
+        "Событие обрабатывается асинхронно: прогресс по уроку и процент завершения курса "
+        "(`completion_percent`) обновляются в течение нескольких секунд.",
+        request=LessonProgressSerializer,
+        responses={
+            202: {"description": "Событие принято"},
+            400: {"description": "Неверное значение progress"},
+            401: {"description": "Неавторизованный доступ"},
+            404: {"description": "Урок не найден или недоступен"},
+            429: {"description": "Превышен лимит запросов"},
+        },
+        tags=["Lessons"],
+    )
+    def post(self, request, pk, *args, **kwargs):
+        serializer = LessonProgressSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not get_accessible_lessons(request.user).filter(pk=pk).exists():
+            raise Http404("Урок не найден.")
+        record_progress(request.user.pk, pk, serializer.validated_data["progress"])
+        return Response({"message": "Событие принято"}, status=status.HTTP_202_ACCEPTED)
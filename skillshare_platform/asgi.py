@@ -3,5 +3,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "skillshare_platform.settings")
+# В ASGI-развёртывании горячие GET-эндпоинты обслуживаются асинхронными обработчиками
+os.environ.setdefault("DJANGO_ASYNC_VIEWS", "True")
 
 application = get_asgi_application()
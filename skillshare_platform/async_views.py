@@ -0,0 +1,142 @@
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.http import Http404
+from django.utils.functional import classproperty
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+
+class AsyncReadMixin:
+    """
+    Примесь к APIView и ViewSet для ASGI-развёртывания (ASYNC_VIEWS=True).
+    GET-запросы обслуживаются асинхронными обработчиками `a<действие>`
+    (aget у APIView, alist и aretrieve у ViewSet) и не занимают поток на время
+    ожидания базы или внешних API. Остальные методы выполняются синхронной реализацией
+    представления в пуле потоков.
+    DRF не поддерживает асинхронный dispatch, поэтому он реализован здесь.
+    Аутентификация, права, ограничения частоты и сериализация обращаются к базе и Redis
+    синхронно и выполняются через sync_to_async.
+    Без ASYNC_VIEWS представление остаётся обычным синхронным.
+    """
+
+    async_methods = ("GET",)
+    # Передаётся в as_view: представление создано в асинхронном режиме
+    async_dispatch = False
+
+    @classproperty
+    def view_is_async(cls):
+        return settings.ASYNC_VIEWS
+
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
+        if not cls.view_is_async:
+            return super().as_view(*args, **initkwargs)
+        view = super().as_view(*args, async_dispatch=True, **initkwargs)
+        # ViewSetMixin.as_view не помечает представление асинхронным
+        if not iscoroutinefunction(view):
+            markcoroutinefunction(view)
+        return view
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.async_dispatch:
+            return super().dispatch(request, *args, **kwargs)
+        if request.method in self.async_methods:
+            return self.adispatch(request, *args, **kwargs)
+        return sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """Асинхронный аналог APIView.dispatch."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            name = getattr(self, "action", None) or request.method.lower()
+            handler = getattr(self, f"a{name}", None)
+            if handler is not None:
+                response = await handler(request, *args, **kwargs)
+            else:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = await sync_to_async(self.handle_exception)(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_filtered_queryset(self):
+        """filter_queryset(get_queryset()): get_queryset проверяет роли пользователя."""
+        return await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+
+    async def aget_object(self):
+        """Асинхронный аналог GenericAPIView.get_object."""
+        queryset = await self.aget_filtered_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404(
+                f"No {queryset.model._meta.object_name} matches the given query."
+            )
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        """
+        Асинхронный аналог PageNumberPagination.paginate_queryset:
+        количество и страница объектов читаются асинхронными запросами.
+        """
+        pagination = self.paginator
+        if pagination is None:
+            return None
+        pagination.request = self.request
+        page_size = pagination.get_page_size(self.request)
+        if not page_size:
+            return None
+
+        paginator = pagination.django_paginator_class(queryset, page_size)
+        # count - cached_property, заполняем её заранее вместо синхронного COUNT
+        paginator.count = await queryset.acount()
+        page_number = pagination.get_page_number(self.request, paginator)
+        try:
+            pagination.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                pagination.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+        pagination.page.object_list = [obj async for obj in pagination.page.object_list]
+        if paginator.num_pages > 1 and pagination.template is not None:
+            pagination.display_page_controls = True
+        return list(pagination.page)
+
+    async def aserialize(self, instance, many=False):
+        """Данные сериализатора; поля сериализатора могут обращаться к базе и кэшу."""
+        return await sync_to_async(
+            lambda: self.get_serializer(instance, many=many).data
+        )()
+
+    async def alist(self, request, *args, **kwargs):
+        """Асинхронный аналог ListModelMixin.list."""
+        queryset = await self.aget_filtered_queryset()
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(await self.aserialize(page, many=True))
+        return Response(
+            await self.aserialize([obj async for obj in queryset], many=True)
+        )
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """Асинхронный аналог RetrieveModelMixin.retrieve."""
+        return Response(await self.aserialize(await self.aget_object()))
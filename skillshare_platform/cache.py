@@ -0,0 +1,443 @@
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import redis
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.redis import RedisCache
+from redis import RedisError
+
+from skillshare_platform.metrics import CACHE_READS
+
+logger = logging.getLogger(__name__)
+
+# Канал Redis, по которому процессы сообщают друг другу об изменённых ключах
+INVALIDATION_CHANNEL = "cache:invalidate"
+# Сообщение об очистке всего кэша
+CLEAR_ALL = "*"
+# Хэш Redis со счётчиками попаданий всех процессов
+STATS_KEY = "cache:stats"
+STATS_FIELDS = ("local_hits", "shared_hits", "misses")
+
+# Локальные уровни процесса по LOCATION и KEY_PREFIX. Django создаёт отдельный
+# экземпляр бэкенда на каждый поток, а локальный уровень общий для всех потоков процесса
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class LocalLRU:
+    """
+    Ограниченный по числу записей словарь со сроком жизни значений.
+    При переполнении вытесняются давно не читавшиеся записи. Потокобезопасен.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalTier:
+    """
+    Локальный уровень кэша процесса: LRU, подписка на канал инвалидации и счётчики.
+    Значения отдаются из памяти, только пока действует подписка: сообщения, пришедшие
+    без неё, были бы пропущены, поэтому при разрыве локальный уровень очищается
+    и до переподключения все чтения идут в Redis.
+    """
+
+    def __init__(self, server, max_entries, stats_interval):
+        self.server = server
+        self.lru = LocalLRU(max_entries)
+        self.stats_interval = stats_interval
+        self.subscribed = threading.Event()
+        # Номер последней инвалидации: значение, прочитанное из Redis до неё, в память не кладётся
+        self.generation = 0
+        self.pid = None
+        self.node_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._totals = dict.fromkeys(STATS_FIELDS, 0)
+        self._unflushed = dict.fromkeys(STATS_FIELDS, 0)
+        self._stats_flushed_at = time.monotonic()
+
+    @property
+    def active(self):
+        return self.subscribed.is_set()
+
+    def ensure_listener(self):
+        """Запускает поток подписки в текущем процессе (в том числе после fork)."""
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            # После fork подписка родителя не действует, а память содержит его копию
+            self.subscribed.clear()
+            self.lru.clear()
+            self.node_id = uuid.uuid4().hex
+            self.pid = os.getpid()
+            threading.Thread(
+                target=self._listen, name="cache-invalidation", daemon=True
+            ).start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            try:
+                client = redis.Redis.from_url(self.server, health_check_interval=30)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Пока подписки не было, сообщения могли быть пропущены
+                self.invalidate_all()
+                self.subscribed.set()
+                backoff = 1
+                while True:
+                    message = pubsub.get_message(timeout=5.0)
+                    if message is not None:
+                        self.handle_message(message["data"])
+            except RedisError as e:
+                logger.warning(f"Подписка на инвалидацию кэша прервана: {e}")
+            self.subscribed.clear()
+            self.invalidate_all()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def message(self, key):
+        return f"{self.node_id}:{key}"
+
+    def handle_message(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        sender, _, key = data.partition(":")
+        if sender == self.node_id:
+            return
+        if key == CLEAR_ALL:
+            self.invalidate_all()
+        else:
+            self.invalidate(key)
+
+    def invalidate(self, key):
+        self.generation += 1
+        self.lru.delete(key)
+
+    def invalidate_all(self):
+        self.generation += 1
+        self.lru.clear()
+
+    def count(self, field, get_client):
+        """Увеличивает счётчик и раз в stats_interval секунд переносит счётчики в Redis."""
+        CACHE_READS.labels(field).inc()
+        with self._lock:
+            self._totals[field] += 1
+            self._unflushed[field] += 1
+            if time.monotonic() - self._stats_flushed_at < self.stats_interval:
+                return
+            unflushed = self._unflushed
+            self._unflushed = dict.fromkeys(STATS_FIELDS, 0)
+            self._stats_flushed_at = time.monotonic()
+        try:
+            pipe = get_client().pipeline(transaction=False)
+            for name, value in unflushed.items():
+                if value:
+                    pipe.hincrby(STATS_KEY, name, value)
+            pipe.execute()
+        except RedisError as e:
+            logger.debug(f"Не удалось записать статистику кэша: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._totals)
+
+
+def hit_ratios(counters):
+    """
+    Доли попаданий по уровням: local_hit_ratio - от всех чтений,
+    shared_hit_ratio - от чтений, не найденных в памяти процесса.
+    """
+    local_hits = counters.get("local_hits", 0)
+    shared_hits = counters.get("shared_hits", 0)
+    misses = counters.get("misses", 0)
+    total = local_hits + shared_hits + misses
+    shared_total = shared_hits + misses
+    return {
+        **counters,
+        "local_hit_ratio": local_hits / total if total else 0.0,
+        "shared_hit_ratio": shared_hits / shared_total if shared_total else 0.0,
+        "hit_ratio": (local_hits + shared_hits) / total if total else 0.0,
+    }
+
+
+class TwoTierCache(BaseCache):
+    """
+    Двухуровневый бэкенд кэша Django: LRU в памяти процесса перед общим Redis.
+    Чтение сначала ищет значение в памяти (не дольше LOCAL_TIMEOUT секунд и не больше
+    MAX_ENTRIES записей), затем в Redis. Запись и удаление идут в Redis, а имя ключа
+    публикуется в канал cache:invalidate, по которому остальные процессы (воркеры
+    gunicorn, Celery) удаляют свою копию. Ошибки Redis только логируются: чтение
+    считается промахом, значение вычисляется заново.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = dict(params.get("OPTIONS", {}))
+        self.local_timeout = options.pop("LOCAL_TIMEOUT", 60)
+        stats_interval = options.pop("STATS_INTERVAL", 30)
+        # Остальные параметры передаются пулу соединений Redis
+        options.pop("MAX_ENTRIES", None)
+        options.pop("CULL_FREQUENCY", None)
+        self._shared = RedisCache(server, {**params, "OPTIONS": options})
+
+        tier_key = (self._shared._servers[0], self.key_prefix)
+        with _local_tiers_lock:
+            if tier_key not in _local_tiers:
+                _local_tiers[tier_key] = LocalTier(
+                    self._shared._servers[0], self._max_entries, stats_interval
+                )
+        self._tier = _local_tiers[tier_key]
+
+    def _client(self):
+        return self._shared._cache.get_client(write=True)
+
+    def _local_expiry(self, timeout):
+        """Срок жизни значения в памяти процесса: не дольше LOCAL_TIMEOUT и срока в Redis."""
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            timeout = self.local_timeout
+        return time.monotonic() + min(timeout, self.local_timeout)
+
+    def _store_local(self, key, value, timeout, generation=None):
+        tier = self._tier
+        if not tier.active or (
+            generation is not None and generation != tier.generation
+        ):
+            return
+        if self.get_backend_timeout(timeout) == 0:
+            return
+        tier.lru.set(
+            key,
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            self._local_expiry(timeout),
+        )
+
+    def _publish(self, *keys):
+        tier = self._tier
+        for key in keys:
+            tier.invalidate(key)
+        try:
+            pipe = self._client().pipeline(transaction=False)
+            for key in keys:
+                pipe.publish(INVALIDATION_CHANNEL, tier.message(key))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Не удалось разослать инвалидацию кэша: {e}")
+
+    def _count(self, field):
+        self._tier.count(field, self._client)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        tier = self._tier
+        tier.ensure_listener()
+        if tier.active:
+            pickled = tier.lru.get(local_key)
+            if pickled is not None:
+                self._count("local_hits")
+                return pickle.loads(pickled)
+
+        generation = tier.generation
+        missing = object()
+        try:
+            value = self._shared.get(key, missing, version=version)
+        except RedisError as e:
+            logger.debug(f"Кэш Redis недоступен: {e}")
+            value = missing
+        if value is missing:
+            self._count("misses")
+            return default
+        self._count("shared_hits")
+        self._store_local(local_key, value, DEFAULT_TIMEOUT, generation)
+        return value
+
+    def get_many(self, keys, version=None):
+        tier = self._tier
+        tier.ensure_listener()
+        result = {}
+        remaining = {}
+        for key in keys:
+            local_key = self.make_and_validate_key(key, version=version)
+            pickled = tier.lru.get(local_key) if tier.active else None
+            if pickled is not None:
+                self._count("local_hits")
+                result[key] = pickle.loads(pickled)
+            else:
+                remaining[key] = local_key
+        if not remaining:
+            return result
+
+        generation = tier.generation
+        try:
+            shared = self._shared.get_many(remaining, version=version)
+        except RedisError as e:
+            logger.debug(f"Кэш Redis недоступен: {e}")
+            shared = {}
+        for key, local_key in remaining.items():
+            if key in shared:
+                self._count("shared_hits")
+                self._store_local(local_key, shared[key], DEFAULT_TIMEOUT, generation)
+            else:
+                self._count("misses")
+        result.update(shared)
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._tier.ensure_listener()
+        try:
+            self._shared.set(key, value, timeout, version=version)
+        except RedisError as e:
+            logger.warning(f"Не удалось записать значение в кэш Redis: {e}")
+        self._publish(local_key)
+        self._store_local(local_key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        local_keys = {
+            key: self.make_and_validate_key(key, version=version) for key in data
+        }
+        self._tier.ensure_listener()
+        try:
+            self._shared.set_many(data, timeout, version=version)
+        except RedisError as e:
+            logger.warning(f"Не удалось записать значения в кэш Redis: {e}")
+        self._publish(*local_keys.values())
+        for key, value in data.items():
+            self._store_local(local_keys[key], value, timeout)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._tier.ensure_listener()
+        try:
+            added = self._shared.add(key, value, timeout, version=version)
+        except RedisError as e:
+            logger.warning(f"Не удалось записать значение в кэш Redis: {e}")
+            return False
+        if added:
+            self._publish(local_key)
+            self._store_local(local_key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            return self._shared.touch(key, timeout, version=version)
+        except RedisError as e:
+            logger.warning(f"Не удалось продлить значение в кэше Redis: {e}")
+            return False
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._shared.incr(key, delta, version=version)
+        self._publish(local_key)
+        return value
+
+    def delete(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._tier.ensure_listener()
+        try:
+            deleted = self._shared.delete(key, version=version)
+        except RedisError as e:
+            logger.warning(f"Не удалось удалить значение из кэша Redis: {e}")
+            deleted = False
+        self._publish(local_key)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        local_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        self._tier.ensure_listener()
+        try:
+            self._shared.delete_many(keys, version=version)
+        except RedisError as e:
+            logger.warning(f"Не удалось удалить значения из кэша Redis: {e}")
+        self._publish(*local_keys)
+
+    def has_key(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        if self._tier.active and self._tier.lru.get(local_key) is not None:
+            return True
+        try:
+            return self._shared.has_key(key, version=version)
+        except RedisError as e:
+            logger.debug(f"Кэш Redis недоступен: {e}")
+            return False
+
+    def clear(self):
+        """
+        Удаляет ключи кэша (по KEY_PREFIX) из Redis и памяти всех процессов.
+        В отличие от RedisCache.clear, не выполняет FLUSHDB: в той же базе Redis
+        хранятся лимиты запросов, отзывы токенов и буфер активности.
+        """
+        client = self._client()
+        try:
+            keys = []
+            for key in client.scan_iter(match=f"{self.key_prefix}:*", count=1000):
+                keys.append(key)
+                if len(keys) >= 1000:
+                    client.delete(*keys)
+                    keys = []
+            if keys:
+                client.delete(*keys)
+        except RedisError as e:
+            logger.warning(f"Не удалось очистить кэш Redis: {e}")
+        self._publish(CLEAR_ALL)
+        self._tier.invalidate_all()
+
+    def close(self, **kwargs):
+        self._shared.close(**kwargs)
+
+    def stats(self):
+        """Счётчики и доли попаданий по уровням для текущего процесса."""
+        return hit_ratios(self._tier.stats())
+
+    def reset_cluster_stats(self):
+        """Обнуляет счётчики всех процессов в Redis."""
+        self._client().delete(STATS_KEY)
+
+    def cluster_stats(self):
+        """Счётчики и доли попаданий по уровням для всех процессов (из хэша cache:stats)."""
+        counters = self._client().hgetall(STATS_KEY)
+        return hit_ratios(
+            {field: int(counters.get(field.encode(), 0)) for field in STATS_FIELDS}
+        )
@@ -1,6 +1,19 @@
 import os
+import time
 
 from celery import Celery
+from celery.signals import (before_task_publish, task_failure, task_postrun,
+                            task_prerun, task_retry, worker_init,
+                            worker_process_shutdown)
+from django.conf import settings
+from prometheus_client import start_http_server
+
+from skillshare_platform.metrics import (CELERY_TASK_FAILURES,
+                                         CELERY_TASK_QUEUE_WAIT,
+                                         CELERY_TASK_RETRIES,
+                                         CELERY_TASK_RUNTIME,
+                                         clear_multiproc_dir, get_registry,
+                                         mark_process_dead)
 
 # Устанавливаем переменную окружения по умолчанию для настроек Django.
 # Это необходимо, чтобы Celery мог получить доступ к вашим настройкам Django.
@@ -15,6 +28,9 @@ app = Celery("skillshare_platform")
 # если они начинаются с префикса 'CELERY_'.
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
+# Автоматически находим задачи в модулях tasks.py всех приложений из INSTALLED_APPS.
+app.autodiscover_tasks()
+
 
 # Пример отладочной задачи для Celery (опционально, для проверки работы).
 # Эта задача просто выводит сообщение в консоль Celery worker'а.
@@ -25,3 +41,62 @@ def debug_task(self):
     Используется для проверки работоспособности Celery.
     """
     print(f"Запрос: {self.request!r}")
+
+
+# Метрики задач для Prometheus (skillshare_platform.metrics).
+# Время начала выполняемых задач процесса: task_id -> time.monotonic()
+_task_started = {}
+
+
+@before_task_publish.connect
+def add_published_at(headers=None, **kwargs):
+    # Заголовок сообщения доступен воркеру как task.request.published_at
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@task_prerun.connect
+def observe_task_start(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.monotonic()
+    published_at = getattr(task.request, "published_at", None)
+    # Задачи с отложенным запуском (eta, countdown) ждут намеренно
+    if published_at is not None and not task.request.eta:
+        CELERY_TASK_QUEUE_WAIT.labels(task.name).observe(
+            max(0, time.time() - published_at)
+        )
+
+
+@task_postrun.connect
+def observe_task_runtime(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_RUNTIME.labels(task.name, state or "UNKNOWN").observe(
+            time.monotonic() - started
+        )
+
+
+@task_retry.connect
+def count_task_retry(sender=None, **kwargs):
+    CELERY_TASK_RETRIES.labels(sender.name).inc()
+
+
+@task_failure.connect
+def count_task_failure(sender=None, **kwargs):
+    CELERY_TASK_FAILURES.labels(sender.name).inc()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """
+    Главный процесс воркера отдаёт метрики задач на порту WORKER_METRICS_PORT
+    (в prefork-пуле - сумму по дочерним процессам через PROMETHEUS_MULTIPROC_DIR).
+    """
+    if not settings.WORKER_METRICS_PORT:
+        return
+    clear_multiproc_dir()
+    start_http_server(settings.WORKER_METRICS_PORT, registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def mark_worker_process_dead(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
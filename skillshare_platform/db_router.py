@@ -0,0 +1,127 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from redis import RedisError
+
+from skillshare_platform.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REPLICA_DB_ALIAS = "replica"
+
+# Ключ Redis: пользователь недавно писал в базу и читает с основной базы
+PIN_KEY = "db:pin:{user_id}"
+
+
+class RoutingState:
+    """Состояние маршрутизации текущего запроса или задачи."""
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+# Своё значение для каждого потока и каждой asyncio-задачи
+_state = ContextVar("db_routing_state", default=None)
+
+
+def replica_configured():
+    """Задана ли реплика (DB_REPLICA_HOST)."""
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def db_routing(use_replica):
+    """
+    Задаёт маршрутизацию чтений внутри блока: use_replica=True - на реплику,
+    False - на основную базу. Возвращает состояние, в котором отмечается, были ли записи.
+    """
+    state = RoutingState(use_replica)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def read_from_replica():
+    """
+    Отправляет чтения внутри блока на реплику независимо от закрепления пользователя.
+    Для отчётов и фоновых задач, которым допустимо отставание реплики на несколько секунд.
+    Работает и как декоратор.
+    """
+    with db_routing(use_replica=True):
+        yield
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Оставляет чтения внутри блока на основной базе, в том числе в GET-запросах.
+    Для обработчиков, которые по прочитанному состоянию меняют данные (колбэки оплаты).
+    Работает и как декоратор.
+    """
+    with db_routing(use_replica=False):
+        yield
+
+
+def is_pinned(user_id):
+    """
+    Закреплён ли пользователь за основной базой после недавней записи.
+    Если Redis недоступен, считается закреплённым: лишнее чтение с основной базы
+    лучше, чем устаревшие данные.
+    """
+    try:
+        return bool(get_redis().exists(PIN_KEY.format(user_id=user_id)))
+    except RedisError as e:
+        logger.warning(f"Не удалось проверить закрепление за основной базой: {e}")
+        return True
+
+
+def pin_to_primary(user_id):
+    """Закрепляет пользователя за основной базой на DATABASE_REPLICA_PIN_SECONDS секунд."""
+    try:
+        get_redis().set(
+            PIN_KEY.format(user_id=user_id),
+            1,
+            ex=settings.DATABASE_REPLICA_PIN_SECONDS,
+        )
+    except RedisError as e:
+        logger.warning(
+            f"Не удалось закрепить пользователя {user_id} за основной базой: {e}"
+        )
+
+
+class PrimaryReplicaRouter:
+    """
+    Роутер баз данных: чтения внутри db_routing(use_replica=True) идут на реплику,
+    всё остальное - на основную базу (default).
+    На основной базе остаются чтения внутри транзакции (в том числе select_for_update,
+    get_or_create и чтения, следующие за записью в atomic), а также все чтения,
+    если реплика не задана. Миграции применяются только к основной базе.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or not replica_configured():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DB_ALIAS
@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from skillshare_platform.celery import app as celery_app
+from skillshare_platform.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Последний результат проверок: (время monotonic, {зависимость: ошибка или None})
+_readiness = None
+_readiness_lock = threading.Lock()
+
+
+def check_database():
+    with connections["default"].cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def check_redis():
+    get_redis().ping()
+
+
+def check_broker():
+    # Одна попытка соединения без повторов: проверка не должна ждать брокер
+    with celery_app.connection_for_read() as conn:
+        conn.ensure_connection(max_retries=0, timeout=settings.REDIS_SOCKET_TIMEOUT)
+
+
+CHECKS = {
+    "database": check_database,
+    "redis": check_redis,
+    "broker": check_broker,
+}
+
+
+def run_checks():
+    """Проверяет зависимости, возвращает {зависимость: текст ошибки или None}."""
+    results = {}
+    for name, check in CHECKS.items():
+        try:
+            check()
+        except Exception as exc:
+            logger.warning("Проверка готовности %s не прошла: %s", name, exc)
+            results[name] = str(exc) or exc.__class__.__name__
+        else:
+            results[name] = None
+    return results
+
+
+def get_readiness():
+    """
+    Результаты проверок зависимостей, закэшированные в процессе на
+    HEALTH_CHECK_CACHE_SECONDS: частые пробы не нагружают базу, Redis и брокер.
+    Пока один поток проверяет зависимости, остальные получают прошлый результат.
+    """
+    global _readiness
+    cached = _readiness
+    if (
+        cached is not None
+        and time.monotonic() - cached[0] < settings.HEALTH_CHECK_CACHE_SECONDS
+    ):
+        return cached[1]
+    if not _readiness_lock.acquire(blocking=cached is None):
+        return cached[1]
+    try:
+        results = run_checks()
+        _readiness = (time.monotonic(), results)
+    finally:
+        _readiness_lock.release()
+    return results
@@ -0,0 +1,135 @@
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from rest_framework.renderers import JSONRenderer
+
+# Счётчики текущего запроса; контекст переходит и в потоки sync_to_async (ASGI)
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """
+    Замеры одного запроса: число SQL-запросов, время по категориям в миллисекундах
+    (db - база, serialize - рендеринг ответа, stripe и http - внешние вызовы)
+    и время каждого текста SQL.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.durations = {}
+        # Текст SQL с плейсхолдерами -> [число выполнений, время в мс]
+        self.sql = {}
+
+    @property
+    def elapsed(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def add(self, category, duration):
+        self.durations[category] = self.durations.get(category, 0) + duration
+
+
+@contextmanager
+def instrument_request():
+    """Включает замеры для кода внутри блока и возвращает их объект."""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def record_time(category):
+    """Добавляет время блока к категории текущего запроса; вне запроса ничего не делает."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(category, (time.perf_counter() - started) * 1000)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка connection.execute_wrapper: время и текст SQL текущего запроса."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - started) * 1000
+        timings.queries += 1
+        timings.add("db", duration)
+        stats = timings.sql.setdefault(sql, [0, 0.0])
+        stats[0] += 1
+        stats[1] += duration
+
+
+def instrument_connection(connection):
+    """
+    Подключает record_query к соединению насовсем: соединения принадлежат потокам,
+    а под ASGI запрос выполняет SQL в потоках sync_to_async.
+    """
+    if record_query not in connection.execute_wrappers:
+        # В начало списка: контекстный менеджер execute_wrapper() снимает обёртки с конца
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def on_connection_created(sender, connection, **kwargs):
+    instrument_connection(connection)
+
+
+connection_created.connect(on_connection_created)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer, время которого учитывается как serialize."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with record_time("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+_SQL_NORMALIZATION = [
+    # Строковые и числовые литералы, плейсхолдеры
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%s"), "?"),
+    # IN (?, ?, ...) и VALUES (...), (...) разной длины
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),
+    (re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+"), "(...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def normalize_sql(sql):
+    """Текст SQL без значений: запросы, отличающиеся только параметрами, совпадают."""
+    for pattern, replacement in _SQL_NORMALIZATION:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def group_queries(sql_stats, limit):
+    """
+    Группирует SQL запроса по нормализованному тексту.
+    Возвращает limit самых долгих групп: [{"sql", "count", "duration_ms"}].
+    """
+    groups = {}
+    for sql, (count, duration) in sql_stats.items():
+        group = groups.setdefault(normalize_sql(sql), [0, 0.0])
+        group[0] += count
+        group[1] += duration
+    ordered = sorted(groups.items(), key=lambda item: item[1][1], reverse=True)
+    return [
+        {"sql": sql, "count": count, "duration_ms": round(duration, 2)}
+        for sql, (count, duration) in ordered[:limit]
+    ]
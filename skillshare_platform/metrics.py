@@ -0,0 +1,108 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+# С PROMETHEUS_MULTIPROC_DIR (воркеры gunicorn, prefork-пул Celery) каждый процесс пишет
+# значения в свои файлы каталога, а /metrics суммирует их по всем процессам
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# Границы гистограмм длительности: до long-poll статуса платежа и таймаута воркера
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUESTS = Counter(
+    "http_requests",
+    "HTTP-запросы по представлению, методу и коду ответа",
+    ["view", "method", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Длительность HTTP-запроса",
+    ["view", "method"],
+    buckets=DURATION_BUCKETS,
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Число SQL-запросов на HTTP-запрос",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP-запросы в обработке",
+    multiprocess_mode="livesum",
+)
+CACHE_READS = Counter(
+    "cache_reads",
+    "Чтения двухуровневого кэша: local_hits, shared_hits, misses",
+    ["result"],
+)
+
+CELERY_TASK_RUNTIME = Histogram(
+    "celery_task_runtime_seconds",
+    "Время выполнения задачи Celery",
+    ["task", "state"],
+    buckets=DURATION_BUCKETS + (60, 300),
+)
+CELERY_TASK_QUEUE_WAIT = Histogram(
+    "celery_task_queue_wait_seconds",
+    "Время от отправки задачи до начала выполнения",
+    ["task"],
+    buckets=DURATION_BUCKETS + (60, 300),
+)
+CELERY_TASK_RETRIES = Counter(
+    "celery_task_retries", "Повторные запуски задач Celery", ["task"]
+)
+CELERY_TASK_FAILURES = Counter(
+    "celery_task_failures", "Задачи Celery, завершившиеся ошибкой", ["task"]
+)
+
+
+def observe_request(view, method, status, duration, db_queries):
+    """Метрики завершённого HTTP-запроса (RequestTimingMiddleware)."""
+    view = view or "unmatched"
+    HTTP_REQUESTS.labels(view, method, status).inc()
+    HTTP_REQUEST_DURATION.labels(view, method).observe(duration)
+    HTTP_REQUEST_DB_QUERIES.labels(view).observe(db_queries)
+
+
+def get_registry():
+    """Реестр для выдачи: сумма файлов всех процессов или реестр этого процесса."""
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics(collectors=()):
+    """
+    Возвращает тело и Content-Type ответа в текстовом формате Prometheus.
+    collectors - сборщики, значения которых вычисляются в момент запроса.
+    """
+    body = generate_latest(get_registry())
+    if collectors:
+        registry = CollectorRegistry()
+        for collector in collectors:
+            registry.register(collector)
+        body += generate_latest(registry)
+    return body, CONTENT_TYPE_LATEST
+
+
+def clear_multiproc_dir():
+    """Удаляет файлы метрик прошлого запуска; вызывается до запуска рабочих процессов."""
+    if not MULTIPROC_DIR:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    for name in os.listdir(MULTIPROC_DIR):
+        if name.endswith(".db"):
+            os.remove(os.path.join(MULTIPROC_DIR, name))
+
+
+def mark_process_dead(pid):
+    """Live-метрики (запросы в обработке) завершившегося процесса больше не учитываются."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
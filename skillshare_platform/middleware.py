@@ -0,0 +1,269 @@
+import json
+import logging
+import random
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from skillshare_platform.db_router import (db_routing, is_pinned,
+                                           pin_to_primary, replica_configured)
+from skillshare_platform.health import get_readiness
+from skillshare_platform.instrumentation import (group_queries,
+                                                 instrument_connection,
+                                                 instrument_request)
+from skillshare_platform.metrics import (HTTP_REQUESTS_IN_PROGRESS,
+                                         observe_request)
+
+request_logger = logging.getLogger("skillshare_platform.requests")
+
+
+class HealthCheckMiddleware:
+    """
+    Отвечает на пробы /healthz (процесс жив) и /readyz (доступны база, Redis
+    и брокер Celery) до остальных middleware: без аутентификации, сессий,
+    проверки ALLOWED_HOSTS и маршрутизации. Стоит первой в MIDDLEWARE.
+    Результат /readyz кэшируется (skillshare_platform.health.get_readiness).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path == "/healthz":
+            return self.liveness_response()
+        if request.path == "/readyz":
+            return self.readiness_response(get_readiness())
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path == "/healthz":
+            return self.liveness_response()
+        if request.path == "/readyz":
+            return self.readiness_response(await sync_to_async(get_readiness)())
+        return await self.get_response(request)
+
+    def liveness_response(self):
+        response = HttpResponse("ok", content_type="text/plain")
+        response["Cache-Control"] = "no-store"
+        return response
+
+    def readiness_response(self, results):
+        ready = all(error is None for error in results.values())
+        response = JsonResponse(
+            {
+                "status": "ok" if ready else "unavailable",
+                "checks": {
+                    name: "ok" if error is None else error
+                    for name, error in results.items()
+                },
+            },
+            status=200 if ready else 503,
+        )
+        response["Cache-Control"] = "no-store"
+        return response
+
+
+class RequestTimingMiddleware:
+    """
+    Замеряет каждый запрос (skillshare_platform.instrumentation): число и время
+    SQL-запросов, рендеринг ответа и внешние вызовы (Stripe, urlopen).
+    - Сотрудникам (is_staff) и при DEBUG добавляет заголовок Server-Timing.
+    - Пишет строку JSON в лог skillshare_platform.requests (INFO).
+    - Обновляет метрики Prometheus (skillshare_platform.metrics): длительность, коды
+      ответов и число SQL по представлениям, запросы в обработке.
+    - Запросы дольше REQUEST_SLOW_MS с вероятностью REQUEST_SLOW_SAMPLE_RATE пишет
+      в лог (WARNING) вместе с самыми долгими SQL, сгруппированными по тексту без значений.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Соединения, открытые до загрузки middleware (остальные - по connection_created)
+        for connection in connections.all():
+            instrument_connection(connection)
+        with HTTP_REQUESTS_IN_PROGRESS.track_inprogress():
+            with instrument_request() as timings:
+                response = self.get_response(request)
+            return self.report(request, response, timings)
+
+    async def __acall__(self, request):
+        with HTTP_REQUESTS_IN_PROGRESS.track_inprogress():
+            with instrument_request() as timings:
+                response = await self.get_response(request)
+            return self.report(request, response, timings)
+
+    def report(self, request, response, timings):
+        duration = timings.elapsed
+        durations = {name: round(value, 2) for name, value in timings.durations.items()}
+        match = request.resolver_match
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "duration_ms": round(duration, 2),
+            "db_queries": timings.queries,
+            **{f"{name}_ms": value for name, value in durations.items()},
+        }
+        request_logger.info(json.dumps(record, ensure_ascii=False))
+        observe_request(
+            record["view"],
+            request.method,
+            response.status_code,
+            duration / 1000,
+            timings.queries,
+        )
+
+        if (
+            duration >= settings.REQUEST_SLOW_MS
+            and random.random() < settings.REQUEST_SLOW_SAMPLE_RATE
+        ):
+            record["queries"] = group_queries(
+                timings.sql, settings.REQUEST_SLOW_TOP_QUERIES
+            )
+            request_logger.warning(
+                "Медленный запрос: %s", json.dumps(record, ensure_ascii=False)
+            )
+
+        user = getattr(request, "user", None)
+        if settings.DEBUG or getattr(user, "is_staff", False):
+            metrics = [
+                f'db;dur={durations.get("db", 0)};desc="{timings.queries} queries"'
+            ]
+            metrics += [
+                f"{name};dur={value}"
+                for name, value in durations.items()
+                if name != "db"
+            ]
+            metrics.append(f"total;dur={round(duration, 2)}")
+            response["Server-Timing"] = ", ".join(metrics)
+        return response
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Добавляет к ответу заголовки RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset
+    и RateLimit-Policy, если запрос проходил проверку лимита
+    (users.throttling.RedisTokenBucketThrottle). При превышении лимита DRF
+    дополнительно возвращает Retry-After.
+    Поддерживает синхронный и асинхронный режимы (ASGI).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        ratelimit = getattr(request, "ratelimit", None)
+        if ratelimit:
+            response["RateLimit-Limit"] = ratelimit["limit"]
+            response["RateLimit-Remaining"] = ratelimit["remaining"]
+            response["RateLimit-Reset"] = ratelimit["reset"]
+            response["RateLimit-Policy"] = (
+                f"{ratelimit['limit']};w={ratelimit['window']}"
+            )
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Отправляет чтения запросов GET, HEAD и OPTIONS на реплику базы данных
+    (skillshare_platform.db_router.PrimaryReplicaRouter).
+    Пользователь, выполнивший запись, на DATABASE_REPLICA_PIN_SECONDS секунд закрепляется
+    за основной базой и сразу видит свои изменения. Пользователь определяется по
+    JWT-токену запроса или по сессии. Если реплика не задана, middleware ничего не делает.
+    В асинхронном режиме (ASGI) обращения к сессии и Redis выполняются в потоке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.jwt_authentication = JWTAuthentication()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def get_user_id(self, request):
+        header = self.jwt_authentication.get_header(request)
+        if header is not None:
+            raw_token = self.jwt_authentication.get_raw_token(header)
+            if raw_token is not None:
+                try:
+                    token = self.jwt_authentication.get_validated_token(raw_token)
+                except InvalidToken:
+                    return None
+                return token.get(jwt_settings.USER_ID_CLAIM)
+        session = getattr(request, "session", None)
+        return session.get(SESSION_KEY) if session is not None else None
+
+    def get_routing(self, request):
+        """Возвращает (user_id, use_replica) для запроса."""
+        user_id = self.get_user_id(request)
+        use_replica = request.method in SAFE_METHODS and not (
+            user_id is not None and is_pinned(user_id)
+        )
+        return user_id, use_replica
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not replica_configured():
+            return self.get_response(request)
+
+        user_id, use_replica = self.get_routing(request)
+        with db_routing(use_replica) as state:
+            response = self.get_response(request)
+        if state.wrote and user_id is not None:
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_configured():
+            return await self.get_response(request)
+
+        user_id, use_replica = await sync_to_async(self.get_routing)(request)
+        with db_routing(use_replica) as state:
+            response = await self.get_response(request)
+        if state.wrote and user_id is not None:
+            await sync_to_async(pin_to_primary)(user_id)
+        return response
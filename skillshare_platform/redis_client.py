@@ -0,0 +1,22 @@
+import redis
+from django.conf import settings
+
+# Клиент создаётся один раз на процесс и переиспользует пул соединений
+_client = None
+
+
+def get_redis():
+    """
+    Возвращает общий клиент Redis приложения (REDIS_URL).
+    Ответы декодируются в строки. Ошибки соединения (redis.RedisError)
+    обрабатывает вызывающий код.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            decode_responses=True,
+        )
+    return _client
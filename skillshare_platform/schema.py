@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+logger = logging.getLogger(__name__)
+
+# Формат схемы: (имя файла, Content-Type, рендерер drf-spectacular)
+SCHEMA_FORMATS = {
+    "yaml": ("schema.yaml", "application/vnd.oai.openapi", OpenApiYamlRenderer),
+    "json": ("schema.json", "application/vnd.oai.openapi+json", OpenApiJsonRenderer),
+}
+
+# Загруженные документы: путь файла -> (mtime файла или None, тело, ETag)
+_documents = {}
+
+
+def generate_schema():
+    """Строит схему OpenAPI обходом всех представлений и сериализаторов."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    return generator.get_schema(request=None, public=True)
+
+
+def render_schema(schema, fmt):
+    return SCHEMA_FORMATS[fmt][2]().render(schema, renderer_context={})
+
+
+def schema_path(fmt):
+    return os.path.join(settings.OPENAPI_SCHEMA_DIR, SCHEMA_FORMATS[fmt][0])
+
+
+def write_schema():
+    """
+    Генерирует схему один раз и записывает её во всех форматах в OPENAPI_SCHEMA_DIR.
+    Файлы заменяются атомарно: воркеры и nginx не прочитают недописанную схему.
+    Возвращает пути записанных файлов.
+    """
+    schema = generate_schema()
+    os.makedirs(settings.OPENAPI_SCHEMA_DIR, exist_ok=True)
+    paths = []
+    for fmt in SCHEMA_FORMATS:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=settings.OPENAPI_SCHEMA_DIR, prefix=".schema-"
+        )
+        with os.fdopen(fd, "wb") as f:
+            f.write(render_schema(schema, fmt))
+        # mkstemp создаёт файл с правами 0600, а статику читает nginx
+        os.chmod(tmp_path, 0o644)
+        path = schema_path(fmt)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def get_schema_document(fmt):
+    """
+    Возвращает тело схемы и ETag. Файл перечитывается только при изменении mtime
+    (новый деплой). Если файла нет, схема генерируется один раз на процесс.
+    """
+    path = schema_path(fmt)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    cached = _documents.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    if mtime is not None:
+        with open(path, "rb") as f:
+            body = f.read()
+    else:
+        logger.warning(
+            "Файл схемы OpenAPI %s не найден, схема генерируется в процессе "
+            "(выполните build_openapi_schema)",
+            path,
+        )
+        body = render_schema(generate_schema(), fmt)
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    _documents[path] = (mtime, body, etag)
+    return body, etag
@@ -45,14 +45,21 @@ INSTALLED_APPS = [
     "django_filters",
     "rest_framework_simplejwt",
     "drf_spectacular",
+    "drf_spectacular_sidecar",
 ]
 
 MIDDLEWARE = [
+    # /healthz и /readyz отвечают до остальных middleware
+    "skillshare_platform.middleware.HealthCheckMiddleware",
+    # Замеры запроса (SQL, рендеринг, внешние вызовы): лог и Server-Timing
+    "skillshare_platform.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "skillshare_platform.middleware.RateLimitHeadersMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "skillshare_platform.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -76,6 +83,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "skillshare_platform.wsgi.application"
 
+# Асинхронные обработчики GET-запросов горячих эндпоинтов (skillshare_platform.async_views).
+# Включаются ASGI-приложением (skillshare_platform/asgi.py); под WSGI остаются синхронные
+ASYNC_VIEWS = os.getenv("DJANGO_ASYNC_VIEWS", "False").lower() == "true"
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -84,9 +95,49 @@ DATABASES = {
         "PASSWORD": os.environ.get("DB_PASSWORD"),
         "HOST": os.environ.get("DB_HOST"),
         "PORT": os.environ.get("DB_PORT"),
+        # Сколько секунд соединение переиспользуется между запросами (0 - новое на каждый запрос).
+        # Под ASGI синхронный код запроса выполняется в отдельном потоке и постоянные
+        # соединения не переиспользуются, поэтому по умолчанию 0 (переиспользование - через пул)
+        "CONN_MAX_AGE": int(
+            os.getenv("DB_CONN_MAX_AGE", "0" if ASYNC_VIEWS else "60")
+        ),
+        # Перед повторным использованием соединение проверяется, разорванное заменяется новым
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "True").lower()
+        == "true",
+        # Через PgBouncer в режиме transaction серверные курсоры (iterator()) не работают
+        "DISABLE_SERVER_SIDE_CURSORS": os.getenv("DB_PGBOUNCER", "False").lower()
+        == "true",
+        "OPTIONS": {},
     }
 }
 
+# Пул соединений psycopg (необязателен, требует psycopg[pool] 3-й версии вместо psycopg2):
+# соединения держит пул процесса, поэтому CONN_MAX_AGE не используется
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+if DB_POOL_MAX_SIZE:
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+        "max_size": DB_POOL_MAX_SIZE,
+        # Сколько секунд запрос ждёт свободное соединение
+        "timeout": int(os.getenv("DB_POOL_TIMEOUT", "10")),
+    }
+
+# Реплика для чтения (необязательна): GET-запросы API, отчёты и тяжёлые фоновые чтения
+if os.environ.get("DB_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": os.environ.get("DB_REPLICA_HOST"),
+        "PORT": os.environ.get("DB_REPLICA_PORT", os.environ.get("DB_PORT")),
+        # В тестах реплика - второе подключение к тестовой базе default
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["skillshare_platform.db_router.PrimaryReplicaRouter"]
+
+# Сколько секунд после записи пользователь читает с основной базы
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv("DB_REPLICA_PIN_SECONDS", "5"))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -120,9 +171,22 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
 
+# Режим аутентификации по JWT без обращения к базе: пользователь восстанавливается
+# из claims access-токена (is_active, is_staff, is_superuser, roles), а строка User
+# загружается только если представлению нужны другие поля.
+JWT_STATELESS_AUTH = os.getenv("JWT_STATELESS_AUTH", "False").lower() == "true"
+# Если Redis недоступен, обновление токенов по умолчанию отклоняется (503): без проверки
+# повторного использования украденный refresh-токен можно ротировать сколько угодно.
+# True - пропускать обновление без проверки.
+JWT_REFRESH_FAIL_OPEN = os.getenv("JWT_REFRESH_FAIL_OPEN", "False").lower() == "true"
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        (
+            "users.authentication.StatelessJWTAuthentication"
+            if JWT_STATELESS_AUTH
+            else "users.authentication.ActivityTrackingJWTAuthentication"
+        ),
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_FILTER_BACKENDS": (
@@ -130,14 +194,34 @@ REST_FRAMEWORK = {
         "rest_framework.filters.OrderingFilter",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # Время рендеринга JSON учитывается в замерах запроса (RequestTimingMiddleware)
+    "DEFAULT_RENDERER_CLASSES": (
+        "skillshare_platform.instrumentation.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    # Лимиты запросов (users.throttling.RedisTokenBucketThrottle) по группам эндпоинтов:
+    # "N/период" - ведро на N запросов, которое полностью пополняется за период
+    "DEFAULT_THROTTLE_RATES": {
+        "auth": os.getenv("THROTTLE_RATE_AUTH", "10/min"),
+        "refresh": os.getenv("THROTTLE_RATE_REFRESH", "60/min"),
+        "registration": os.getenv("THROTTLE_RATE_REGISTRATION", "5/hour"),
+        "payments": os.getenv("THROTTLE_RATE_PAYMENTS", "30/min"),
+        "progress": os.getenv("THROTTLE_RATE_PROGRESS", "120/min"),
+    },
+    # Количество прокси перед приложением (nginx) - для определения IP клиента по X-Forwarded-For
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES")) if os.getenv("NUM_PROXIES") else None,
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
-    "ROTATE_REFRESH_TOKENS": False,
+    # При каждом обновлении выдаётся новый refresh-токен, а использованный отмечается
+    # в Redis по jti (users.tokens) - без приложения token_blacklist и запросов к базе
+    "ROTATE_REFRESH_TOKENS": True,
+    "BLACKLIST_AFTER_ROTATION": False,
     "BLACKLIST_ENABLED": False,
-    "UPDATE_LAST_LOGIN": True,
+    # last_login пишется через буфер в Redis (users.activity), а не UPDATE при каждом входе
+    "UPDATE_LAST_LOGIN": False,
     "ALGORITHM": "HS256",
     "SIGNING_KEY": SECRET_KEY,
     "VERIFYING_KEY": None,
@@ -163,15 +247,96 @@ SPECTACULAR_SETTINGS = {
     "DESCRIPTION": "Documentation for SkillShare Platform API endpoints",
     "VERSION": "1.0.0",
     "SERVE_INCLUDE_SCHEMA": False,
+    # Swagger UI и Redoc из drf_spectacular_sidecar: раздаются как статика, без CDN
+    "SWAGGER_UI_DIST": "SIDECAR",
+    "SWAGGER_UI_FAVICON_HREF": "SIDECAR",
+    "REDOC_DIST": "SIDECAR",
+}
+
+# Каталог готовой схемы OpenAPI (build_openapi_schema при деплое) и время,
+# на которое клиенты кэшируют ответ /api/schema/ (дальше - проверка по ETag)
+OPENAPI_SCHEMA_DIR = os.getenv(
+    "OPENAPI_SCHEMA_DIR", os.path.join(STATIC_ROOT, "openapi")
+)
+OPENAPI_SCHEMA_CACHE_SECONDS = int(os.getenv("OPENAPI_SCHEMA_CACHE_SECONDS", "300"))
+
+# Redis
+REDIS_URL = f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_DB', '0')}"
+# Таймаут (в секундах) на соединение и операции с Redis из кода приложения:
+# при недоступном Redis запрос не должен зависать
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+
+# Замеры запросов (RequestTimingMiddleware): запросы дольше REQUEST_SLOW_MS миллисекунд
+# с вероятностью REQUEST_SLOW_SAMPLE_RATE пишутся в лог вместе с REQUEST_SLOW_TOP_QUERIES
+# самыми долгими группами SQL
+REQUEST_SLOW_MS = float(os.getenv("REQUEST_SLOW_MS", "500"))
+REQUEST_SLOW_SAMPLE_RATE = float(os.getenv("REQUEST_SLOW_SAMPLE_RATE", "0.1"))
+REQUEST_SLOW_TOP_QUERIES = int(os.getenv("REQUEST_SLOW_TOP_QUERIES", "10"))
+
+# Лог запросов (skillshare_platform.requests) - в stdout контейнера
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "skillshare_platform.requests": {
+            "handlers": ["console"],
+            "level": os.getenv("REQUEST_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
 }
 
+# Сколько секунд процесс переиспользует результат проверки зависимостей для /readyz
+HEALTH_CHECK_CACHE_SECONDS = float(os.getenv("HEALTH_CHECK_CACHE_SECONDS", "5"))
+
+# Кэш Django: LRU в памяти процесса перед общим Redis, инвалидация через pub/sub
+# (skillshare_platform.cache.TwoTierCache). Ключи кэша - с префиксом cache:
+CACHES = {
+    "default": {
+        "BACKEND": "skillshare_platform.cache.TwoTierCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "cache",
+        "TIMEOUT": int(os.getenv("CACHE_TIMEOUT", "300")),
+        "OPTIONS": {
+            # Число записей и срок жизни (в секундах) значений в памяти процесса
+            "MAX_ENTRIES": int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "1000")),
+            "LOCAL_TIMEOUT": int(os.getenv("CACHE_LOCAL_TIMEOUT", "60")),
+            # Как часто (в секундах) процесс переносит счётчики попаданий в Redis
+            "STATS_INTERVAL": int(os.getenv("CACHE_STATS_INTERVAL", "30")),
+            "socket_connect_timeout": REDIS_SOCKET_TIMEOUT,
+            "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        },
+    }
+}
+
+# Буферизация last_login/last_seen: как часто (в секундах) процесс пишет last_seen
+# одного пользователя в Redis и сколько строк обновляется одним запросом при переносе в базу
+USER_ACTIVITY_SEEN_INTERVAL = int(os.getenv("USER_ACTIVITY_SEEN_INTERVAL", "60"))
+USER_ACTIVITY_FLUSH_BATCH_SIZE = int(
+    os.getenv("USER_ACTIVITY_FLUSH_BATCH_SIZE", "1000")
+)
+
+# События просмотра уроков (materials.progress): длина потока Redis, после которой старые
+# события отбрасываются, сколько событий пишется в базу одним запросом и как часто
+# (в секундах) запускается перенос
+LESSON_PROGRESS_STREAM_MAXLEN = int(
+    os.getenv("LESSON_PROGRESS_STREAM_MAXLEN", "1000000")
+)
+LESSON_PROGRESS_BATCH_SIZE = int(os.getenv("LESSON_PROGRESS_BATCH_SIZE", "1000"))
+LESSON_PROGRESS_FLUSH_INTERVAL = int(os.getenv("LESSON_PROGRESS_FLUSH_INTERVAL", "10"))
+# Не больше пакетов за один запуск переноса, остальное - при следующем запуске
+LESSON_PROGRESS_MAX_BATCHES = int(os.getenv("LESSON_PROGRESS_MAX_BATCHES", "50"))
+
 # Celery
-CELERY_BROKER_URL = f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_DB', '0')}"
+CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Europe/Moscow"
+# Очередь по умолчанию для задач и расписания beat: её слушает воркер (-Q default)
+CELERY_TASK_DEFAULT_QUEUE = "default"
 
 CELERY_BEAT_SCHEDULE = {
     "debug_every_minute": {
@@ -179,18 +344,34 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": timedelta(minutes=1),
         "args": (),
         "kwargs": {},
-        "options": {"queue": "celery"},
         "name": "Отладочная задача каждую минуту",
         "relative": False,
     },
     "deactivate_inactive_users_daily": {
         "task": "materials.tasks.deactivate_inactive_users",
         "schedule": timedelta(days=30),
-        "options": {"queue": "celery"},
         "name": "Деактивация неактивных пользователей",
     },
+    "flush_user_activity_every_minute": {
+        "task": "users.tasks.flush_activity",
+        "schedule": timedelta(minutes=1),
+        "name": "Перенос last_login и last_seen из Redis в базу",
+    },
+    "flush_lesson_progress": {
+        "task": "materials.tasks.flush_lesson_progress",
+        "schedule": timedelta(seconds=LESSON_PROGRESS_FLUSH_INTERVAL),
+        "name": "Перенос прогресса по урокам из Redis в базу",
+    },
+    "reconcile_stale_payments_hourly": {
+        "task": "users.tasks.reconcile_stale_payments",
+        "schedule": timedelta(hours=1),
+        "name": "Сверка зависших платежей со Stripe",
+    },
 }
 
+# Порт, на котором воркер Celery отдаёт метрики задач для Prometheus (0 - не отдавать)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9808"))
+
 # Настройки Email
 EMAIL_BACKEND = os.getenv(
     "EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend"
@@ -202,3 +383,21 @@ EMAIL_USE_SSL = os.getenv("EMAIL_USE_SSL", "False").lower() == "true"
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 DEFAULT_FROM_EMAIL = os.getenv("EMAIL_HOST_USER", "webmaster@localhost")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+
+# Режим создания платёжной сессии Stripe:
+# "sync"  - сессия создаётся прямо в запросе (worker gunicorn ждёт ответа Stripe);
+# "async" - создаётся платёж pending, сессию создаёт задача Celery, клиент получает 202
+#           и опрашивает эндпоинт статуса платежа.
+PAYMENT_CHECKOUT_MODE = os.getenv("PAYMENT_CHECKOUT_MODE", "sync").lower()
+# Максимальное время ожидания (в секундах) для long-poll запроса статуса платежа
+PAYMENT_STATUS_MAX_WAIT = int(os.getenv("PAYMENT_STATUS_MAX_WAIT", "20"))
+# Интервал (в секундах) между проверками статуса платежа при long-poll
+PAYMENT_STATUS_POLL_INTERVAL = float(os.getenv("PAYMENT_STATUS_POLL_INTERVAL", "0.5"))
+# Размер пачки строк, читаемых из базы при потоковой CSV-выгрузке платежей
+PAYMENT_EXPORT_CHUNK_SIZE = int(os.getenv("PAYMENT_EXPORT_CHUNK_SIZE", "2000"))
+# Через сколько часов платёж pending считается брошенным и сверяется со Stripe
+# (сессия Stripe Checkout по умолчанию живёт 24 часа)
+PAYMENT_STALE_AFTER_HOURS = int(os.getenv("PAYMENT_STALE_AFTER_HOURS", "24"))
+# Размер пачки платежей и число одновременных запросов к Stripe при сверке
+PAYMENT_RECONCILE_BATCH_SIZE = int(os.getenv("PAYMENT_RECONCILE_BATCH_SIZE", "200"))
+PAYMENT_RECONCILE_CONCURRENCY = int(os.getenv("PAYMENT_RECONCILE_CONCURRENCY", "8"))
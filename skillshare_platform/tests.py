@@ -0,0 +1,1144 @@
+import json
+import os
+import runpy
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+
+import fakeredis
+import redis
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from celery.signals import task_retry
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from materials.models import Course, CourseSubscription, Lesson
+from materials.tasks import deactivate_inactive_users
+from skillshare_platform.cache import (INVALIDATION_CHANNEL, LocalLRU,
+                                       TwoTierCache)
+from skillshare_platform.db_router import (REPLICA_DB_ALIAS, db_routing,
+                                           read_from_primary,
+                                           read_from_replica)
+from skillshare_platform.instrumentation import (instrument_request,
+                                                 normalize_sql, record_time)
+from skillshare_platform.middleware import (HealthCheckMiddleware,
+                                            ReplicaRoutingMiddleware)
+from skillshare_platform.schema import schema_path
+from users.models import Payment, RevenueRollup, User
+from users.services import grant_entitlement
+from users.throttling import RedisTokenBucketThrottle
+
+
+@skipUnless(
+    REPLICA_DB_ALIAS in settings.DATABASES, "Реплика не задана (DB_REPLICA_HOST)"
+)
+class ReplicaRoutingTest(TransactionTestCase):
+    # Реплика в тестах - зеркало тестовой базы default (TEST MIRROR)
+    databases = {"default", REPLICA_DB_ALIAS}
+
+    def setUp(self):
+        redis_patcher = patch(
+            "skillshare_platform.redis_client._client",
+            fakeredis.FakeRedis(decode_responses=True),
+        )
+        redis_patcher.start()
+        self.addCleanup(redis_patcher.stop)
+
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.course = Course.objects.create(title="Курс", course_user=self.user)
+        self.factory = RequestFactory()
+        self.auth = f"Bearer {AccessToken.for_user(self.user)}"
+
+    def queries_by_alias(self, func):
+        """Выполняет func и возвращает число запросов к основной базе и к реплике."""
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections[REPLICA_DB_ALIAS]) as replica:
+                func()
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def read_courses(self, request):
+        list(Course.objects.all())
+        return HttpResponse()
+
+    def update_course(self, request):
+        Course.objects.filter(pk=self.course.pk).update(title="Новый курс")
+        return HttpResponse()
+
+    def test_get_reads_from_replica(self):
+        """Чтения GET-запроса идут на реплику, чтения без маршрутизации - на основную базу."""
+        middleware = ReplicaRoutingMiddleware(self.read_courses)
+        request = self.factory.get("/", HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(self.queries_by_alias(lambda: middleware(request)), (0, 1))
+        self.assertEqual(
+            self.queries_by_alias(lambda: list(Course.objects.all())), (1, 0)
+        )
+
+    def test_writer_is_pinned_to_primary(self):
+        """После записи пользователь читает с основной базы, другие - с реплики."""
+        ReplicaRoutingMiddleware(self.update_course)(
+            self.factory.post("/", HTTP_AUTHORIZATION=self.auth)
+        )
+        middleware = ReplicaRoutingMiddleware(self.read_courses)
+
+        request = self.factory.get("/", HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(self.queries_by_alias(lambda: middleware(request)), (1, 0))
+
+        other = User.objects.create_user(email="other@example.com", password="pass")
+        request = self.factory.get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(other)}"
+        )
+        self.assertEqual(self.queries_by_alias(lambda: middleware(request)), (0, 1))
+
+    def test_async_middleware(self):
+        """В асинхронном режиме (ASGI) маршрутизация и закрепление работают так же."""
+
+        async def read_courses(request):
+            [course async for course in Course.objects.all()]
+            return HttpResponse()
+
+        async def update_course(request):
+            await Course.objects.filter(pk=self.course.pk).aupdate(title="Новый курс")
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(read_courses)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = self.factory.get("/", HTTP_AUTHORIZATION=self.auth)
+
+        def read():
+            async_to_sync(middleware)(request)
+
+        self.assertEqual(self.queries_by_alias(read), (0, 1))
+
+        async_to_sync(ReplicaRoutingMiddleware(update_course))(
+            self.factory.post("/", HTTP_AUTHORIZATION=self.auth)
+        )
+        self.assertEqual(self.queries_by_alias(read), (1, 0))
+
+    def test_reads_in_transaction_stay_on_primary(self):
+        """Чтения внутри транзакции и select_for_update идут на основную базу."""
+
+        def read_in_transaction():
+            with db_routing(use_replica=True), transaction.atomic():
+                list(Course.objects.all())
+                list(Course.objects.select_for_update())
+
+        self.assertEqual(self.queries_by_alias(read_in_transaction), (4, 0))
+
+    def test_explicit_routing(self):
+        """read_from_replica и read_from_primary переопределяют маршрутизацию запроса."""
+
+        def read_reports():
+            with db_routing(use_replica=False), read_from_replica():
+                list(Course.objects.all())
+
+        def read_callback():
+            with db_routing(use_replica=True), read_from_primary():
+                list(Course.objects.all())
+
+        self.assertEqual(self.queries_by_alias(read_reports), (0, 1))
+        self.assertEqual(self.queries_by_alias(read_callback), (1, 0))
+
+    def test_replica_sees_committed_data(self):
+        """Реплика в тестах - второе подключение к той же тестовой базе."""
+        with read_from_replica():
+            self.assertEqual(Course.objects.get().title, "Курс")
+
+
+class TwoTierCacheTest(TestCase):
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        client_patcher = patch(
+            "django.core.cache.backends.redis.RedisCacheClient.get_client",
+            side_effect=lambda *args, **kwargs: fakeredis.FakeRedis(server=self.server),
+        )
+        client_patcher.start()
+        self.addCleanup(client_patcher.stop)
+        # Локальные уровни процесса - свои для каждого теста
+        tiers_patcher = patch("skillshare_platform.cache._local_tiers", {})
+        tiers_patcher.start()
+        self.addCleanup(tiers_patcher.stop)
+
+        self.pubsub = fakeredis.FakeRedis(server=self.server).pubsub(
+            ignore_subscribe_messages=True
+        )
+        self.pubsub.subscribe(INVALIDATION_CHANNEL)
+        # Два процесса приложения с общим Redis
+        self.first = self.make_cache("redis://first:6379/0")
+        self.second = self.make_cache("redis://second:6379/0")
+
+    def make_cache(self, location):
+        backend = TwoTierCache(
+            location,
+            {"KEY_PREFIX": "test", "TIMEOUT": 300},
+        )
+        # Подписку заменяет deliver(): поток-подписчик не запускается
+        backend._tier.pid = os.getpid()
+        backend._tier.subscribed.set()
+        return backend
+
+    def deliver(self):
+        """Доставляет опубликованные инвалидации обоим процессам."""
+        while message := self.pubsub.get_message():
+            for backend in (self.first, self.second):
+                backend._tier.handle_message(message["data"])
+
+    def test_reads_from_local_tier_after_shared(self):
+        """Первое чтение - из Redis, повторное - из памяти процесса."""
+        self.first.set("course", {"title": "Курс"})
+        self.deliver()
+        self.assertEqual(self.second.get("course"), {"title": "Курс"})
+        self.assertEqual(self.second.get("course"), {"title": "Курс"})
+        self.assertIsNone(self.second.get("missing"))
+
+        stats = self.second.stats()
+        self.assertEqual(
+            (stats["local_hits"], stats["shared_hits"], stats["misses"]), (1, 1, 1)
+        )
+        self.assertAlmostEqual(stats["local_hit_ratio"], 1 / 3)
+        self.assertAlmostEqual(stats["shared_hit_ratio"], 1 / 2)
+
+    def test_write_invalidates_other_processes(self):
+        """После записи в одном процессе другой не отдаёт старое значение из памяти."""
+        self.first.set("roles", ["Moderators"])
+        self.deliver()
+        self.second.get("roles")
+
+        self.first.set("roles", [])
+        self.deliver()
+        self.assertEqual(self.second.get("roles"), [])
+
+        self.first.delete("roles")
+        self.deliver()
+        self.assertIsNone(self.second.get("roles"))
+
+        self.second.set_many({"a": 1, "b": 2})
+        self.deliver()
+        self.assertEqual(self.first.get_many(["a", "b", "c"]), {"a": 1, "b": 2})
+        self.first.clear()
+        self.deliver()
+        self.assertEqual(self.second.get_many(["a", "b"]), {})
+
+    def test_local_tier_requires_subscription(self):
+        """Без подписки на инвалидацию значения читаются только из Redis."""
+        self.second.set("course", 1)
+        self.second._tier.subscribed.clear()
+        # Изменение, инвалидация которого не была доставлена
+        fakeredis.FakeRedis(server=self.server).set(
+            self.second.make_key("course"), b"\x80\x04K\x02."
+        )
+        self.assertEqual(self.second.get("course"), 2)
+
+    def test_redis_errors_are_cache_misses(self):
+        """При недоступном Redis чтение - промах, запись не падает."""
+        with patch(
+            "django.core.cache.backends.redis.RedisCacheClient.get_client",
+            side_effect=redis.ConnectionError,
+        ):
+            self.first.set("course", 1)
+            self.assertEqual(self.first.get("course", "default"), 1)
+            self.first.delete("course")
+            self.assertEqual(self.first.get("course", "default"), "default")
+
+    def test_cluster_stats_command(self):
+        """Счётчики процессов собираются в Redis и выводятся командой cache_stats."""
+        backend = TwoTierCache(
+            "redis://third:6379/0",
+            {"KEY_PREFIX": "test", "OPTIONS": {"STATS_INTERVAL": 0}},
+        )
+        backend.get("course")
+        backend.set("course", 1)
+        backend.get("course")
+
+        out = StringIO()
+        call_command("cache_stats", "--reset", stdout=out)
+        self.assertIn("Попадания в Redis: 1", out.getvalue())
+        self.assertIn("Промахи: 1", out.getvalue())
+        self.assertEqual(cache.cluster_stats()["misses"], 0)
+
+    def test_local_lru_bounds(self):
+        """Локальный уровень вытесняет давно не читавшиеся и просроченные записи."""
+        lru = LocalLRU(max_entries=2)
+        lru.set("a", 1, time.monotonic() + 60)
+        lru.set("b", 2, time.monotonic() + 60)
+        lru.get("a")
+        lru.set("c", 3, time.monotonic() + 60)
+        self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+        lru.set("d", 4, time.monotonic() - 1)
+        self.assertIsNone(lru.get("d"))
+
+
+class CachedRolesAndLessonsTest(TestCase):
+    def setUp(self):
+        redis_client = fakeredis.FakeRedis()
+        client_patcher = patch(
+            "django.core.cache.backends.redis.RedisCacheClient.get_client",
+            return_value=redis_client,
+        )
+        client_patcher.start()
+        self.addCleanup(client_patcher.stop)
+        cache.clear()
+
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.moderators = Group.objects.create(name="Moderators")
+        self.course = Course.objects.create(title="Курс", course_user=self.user)
+
+    def test_roles_cached_until_groups_change(self):
+        """Роли читаются из кэша и сбрасываются при изменении групп."""
+        self.assertFalse(self.user.is_moderator)
+        with self.assertNumQueries(0):
+            self.assertFalse(self.user.is_moderator)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.moderators)
+        self.assertTrue(self.user.is_moderator)
+
+    def test_course_lessons_cached_until_lessons_change(self):
+        """Список уроков курса читается из кэша и сбрасывается при изменении уроков."""
+        self.assertEqual(self.course.lesson_summaries, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(course=self.course, title="Урок")
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.course.lesson_summaries, [{"id": lesson.pk, "title": "Урок"}]
+            )
+        with self.assertNumQueries(0):
+            self.course.lesson_summaries
+
+        other = Course.objects.create(title="Другой курс", course_user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.course = other
+            lesson.save()
+        self.assertEqual(self.course.lesson_summaries, [])
+
+
+class GunicornConfigTest(SimpleTestCase):
+    def setUp(self):
+        self.config = runpy.run_path(str(settings.BASE_DIR / "gunicorn.conf.py"))
+
+    def test_default_workers(self):
+        """Воркеры считаются по CPU и ограничиваются памятью."""
+        default_workers = self.config["default_workers"]
+        self.assertEqual(default_workers("sync", 1, 16, None), 33)
+        self.assertEqual(default_workers("sync", 4, 16, None), 16)
+        self.assertEqual(
+            default_workers("uvicorn_worker.UvicornWorker", 1, 16, None), 16
+        )
+        # (2048 - 256) // 150 МБ на воркер
+        self.assertEqual(default_workers("sync", 4, 16, 2048), 11)
+        self.assertEqual(default_workers("sync", 1, 16, 256), 1)
+
+    def test_profile(self):
+        """По умолчанию - потоки, preload и перезапуск воркеров с разбросом."""
+        self.assertEqual(self.config["threads"], 4)
+        self.assertGreaterEqual(self.config["workers"], 1)
+        self.assertTrue(self.config["preload_app"])
+        self.assertGreater(self.config["max_requests_jitter"], 0)
+        # long-poll статуса платежа укладывается в таймаут воркера
+        self.assertGreater(self.config["timeout"], settings.PAYMENT_STATUS_MAX_WAIT)
+
+
+class OpenAPISchemaTest(SimpleTestCase):
+    def setUp(self):
+        schema_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, schema_dir)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=schema_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        documents_patcher = patch.dict(
+            "skillshare_platform.schema._documents", clear=True
+        )
+        documents_patcher.start()
+        self.addCleanup(documents_patcher.stop)
+
+    def test_serves_built_schema_with_etag(self):
+        """Схема отдаётся из файла build_openapi_schema и проверяется по ETag."""
+        call_command("build_openapi_schema", stdout=StringIO())
+        with open(schema_path("yaml"), "rb") as f:
+            built = f.read()
+
+        with patch("skillshare_platform.schema.generate_schema") as generate:
+            response = self.client.get("/api/schema/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, built)
+            self.assertEqual(response["Content-Type"], "application/vnd.oai.openapi")
+            self.assertIn("max-age=", response["Cache-Control"])
+
+            not_modified = self.client.get(
+                "/api/schema/", HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified.content, b"")
+
+            json_response = self.client.get(
+                "/api/schema/", HTTP_ACCEPT="application/json"
+            )
+            self.assertIn("/api/courses/", json_response.json()["paths"])
+            self.assertNotEqual(json_response["ETag"], response["ETag"])
+        generate.assert_not_called()
+
+        # Новый деплой: файл заменён - меняется и ETag
+        with open(schema_path("yaml"), "ab") as f:
+            f.write(b"# new\n")
+        response = self.client.get("/api/schema/?format=yaml")
+        self.assertTrue(response.content.endswith(b"# new\n"))
+        self.assertEqual(
+            self.client.get(
+                "/api/schema/", HTTP_IF_NONE_MATCH=not_modified["ETag"]
+            ).status_code,
+            200,
+        )
+
+    def test_generates_once_without_file(self):
+        """Без файла схема генерируется один раз на процесс."""
+        with self.assertLogs("skillshare_platform.schema", "WARNING"):
+            first = self.client.get("/api/schema/?format=json")
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("/api/courses/", first.json()["paths"])
+        with patch("skillshare_platform.schema.generate_schema") as generate:
+            second = self.client.get("/api/schema/?format=json")
+        generate.assert_not_called()
+        self.assertEqual(second.content, first.content)
+
+    def test_docs_use_local_assets(self):
+        """Swagger UI и Redoc загружают скрипты из статики, а не с CDN."""
+        for url in ("/api/schema/swagger-ui/", "/api/schema/redoc/"):
+            content = self.client.get(url).content.decode()
+            self.assertIn("/static/drf_spectacular_sidecar/", content)
+            self.assertNotIn("cdn.jsdelivr.net", content)
+
+
+class HealthCheckTest(TestCase):
+    def setUp(self):
+        readiness_patcher = patch("skillshare_platform.health._readiness", None)
+        readiness_patcher.start()
+        self.addCleanup(readiness_patcher.stop)
+        self.redis_check = Mock()
+        self.broker_check = Mock()
+        checks_patcher = patch.dict(
+            "skillshare_platform.health.CHECKS",
+            {"redis": self.redis_check, "broker": self.broker_check},
+        )
+        checks_patcher.start()
+        self.addCleanup(checks_patcher.stop)
+
+    def test_liveness_bypasses_middleware(self):
+        """/healthz не обращается к базе, не проверяет Host и токен."""
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/healthz",
+                HTTP_HOST="unknown.example",
+                HTTP_AUTHORIZATION="Bearer invalid",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"ok")
+        self.redis_check.assert_not_called()
+
+    def test_readiness_cached(self):
+        """/readyz проверяет зависимости и переиспользует результат."""
+        with self.assertNumQueries(1):
+            response = self.client.get("/readyz", HTTP_HOST="unknown.example")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "status": "ok",
+                "checks": {"database": "ok", "redis": "ok", "broker": "ok"},
+            },
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/readyz").status_code, 200)
+        self.assertEqual(self.redis_check.call_count, 1)
+
+        with patch("skillshare_platform.health.time.monotonic", return_value=1e12):
+            self.client.get("/readyz")
+        self.assertEqual(self.redis_check.call_count, 2)
+
+    def test_readiness_reports_failed_dependency(self):
+        self.broker_check.side_effect = ConnectionError("broker down")
+        with self.assertLogs("skillshare_platform.health", "WARNING"):
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "unavailable")
+        self.assertEqual(response.json()["checks"]["broker"], "broker down")
+        self.assertEqual(response.json()["checks"]["redis"], "ok")
+
+    def test_async_middleware(self):
+        async def get_response(request):
+            return HttpResponse("view")
+
+        middleware = HealthCheckMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        factory = RequestFactory()
+        response = async_to_sync(middleware)(factory.get("/readyz"))
+        self.assertEqual(response.status_code, 200)
+        response = async_to_sync(middleware)(factory.get("/api/courses/"))
+        self.assertEqual(response.content, b"view")
+
+
+class RequestTimingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        Course.objects.create(title="Курс", course_user=self.user)
+        self.auth = f"Bearer {AccessToken.for_user(self.user)}"
+
+    def get_courses(self):
+        with self.assertLogs("skillshare_platform.requests", "INFO") as logs:
+            with CaptureQueriesContext(connections["default"]) as queries:
+                response = self.client.get(
+                    "/api/courses/", HTTP_AUTHORIZATION=self.auth
+                )
+        return response, logs, queries
+
+    def test_logs_request_timings(self):
+        """Строка лога: представление, статус, число SQL и время по категориям."""
+        response, logs, queries = self.get_courses()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(logs.records), 1)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "materials:course-list")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["db_queries"], len(queries))
+        self.assertGreater(record["db_ms"], 0)
+        self.assertIn("serialize_ms", record)
+        self.assertNotIn("Server-Timing", response)
+
+    def test_server_timing_for_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+        response, logs, queries = self.get_courses()
+        self.assertIn(f'desc="{len(queries)} queries"', response["Server-Timing"])
+        self.assertIn("serialize;dur=", response["Server-Timing"])
+        self.assertIn("total;dur=", response["Server-Timing"])
+
+    @override_settings(REQUEST_SLOW_MS=0, REQUEST_SLOW_SAMPLE_RATE=1)
+    def test_slow_request_dump_groups_queries(self):
+        response, logs, queries = self.get_courses()
+        self.assertEqual(logs.records[-1].levelname, "WARNING")
+        dump = json.loads(logs.records[-1].getMessage().split(": ", 1)[1])
+        self.assertEqual(sum(group["count"] for group in dump["queries"]), len(queries))
+        self.assertTrue(all("%s" not in group["sql"] for group in dump["queries"]))
+
+    def test_outbound_calls_and_normalization(self):
+        with instrument_request() as timings:
+            with record_time("stripe"):
+                pass
+            with record_time("stripe"):
+                pass
+            User.objects.filter(pk__in=[1, 2, 3]).count()
+            User.objects.filter(pk__in=[4]).count()
+        self.assertEqual(timings.queries, 2)
+        self.assertEqual(set(timings.durations), {"stripe", "db"})
+        # Вне запроса время не учитывается
+        with record_time("stripe"):
+            User.objects.count()
+        self.assertEqual(timings.queries, 2)
+
+        self.assertEqual(
+            normalize_sql(
+                "SELECT * FROM t WHERE a IN (%s, %s) AND b = 'x''y' LIMIT 21"
+            ),
+            "SELECT * FROM t WHERE a IN (...) AND b = ? LIMIT ?",
+        )
+        self.assertEqual(
+            normalize_sql("INSERT INTO t (a) VALUES (%s), (%s),\n (%s)"),
+            "INSERT INTO t (a) VALUES (...)",
+        )
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.auth = f"Bearer {AccessToken.for_user(self.user)}"
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_metrics(self):
+        """Запросы, длительность и число SQL по имени представления."""
+        labels = {"view": "materials:course-list", "method": "GET"}
+        requests_before = self.sample("http_requests_total", status="200", **labels)
+        queries_before = self.sample(
+            "http_request_db_queries_sum", view="materials:course-list"
+        )
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.client.get("/api/courses/", HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(
+            self.sample("http_requests_total", status="200", **labels),
+            requests_before + 1,
+        )
+        self.assertEqual(
+            self.sample("http_request_db_queries_sum", view="materials:course-list"),
+            queries_before + len(queries),
+        )
+        self.assertGreater(
+            self.sample("http_request_duration_seconds_count", **labels), 0
+        )
+        # Неизвестные пути не создают метку на каждый адрес
+        unmatched = self.sample(
+            "http_requests_total", view="unmatched", method="GET", status="404"
+        )
+        self.client.get("/no-such-page/")
+        self.assertEqual(
+            self.sample(
+                "http_requests_total", view="unmatched", method="GET", status="404"
+            ),
+            unmatched + 1,
+        )
+
+    def test_metrics_endpoint(self):
+        """/metrics доступен без токена и отдаёт текстовый формат Prometheus."""
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        content = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", content)
+        # Считается и сам запрос к /metrics
+        self.assertIn("http_requests_in_progress 1.0", content)
+        self.assertIn("# TYPE cache_reads_total counter", content)
+
+    def test_cache_reads(self):
+        misses = self.sample("cache_reads_total", result="misses")
+        cache.get("metrics-test-missing-key")
+        self.assertEqual(self.sample("cache_reads_total", result="misses"), misses + 1)
+
+    def test_celery_task_metrics(self):
+        """Время выполнения, ошибки и повторы задач по имени задачи."""
+        task = deactivate_inactive_users.name
+        runtime = self.sample(
+            "celery_task_runtime_seconds_count", task=task, state="SUCCESS"
+        )
+        failures = self.sample("celery_task_failures_total", task=task)
+        failed_runtime = self.sample(
+            "celery_task_runtime_seconds_count", task=task, state="FAILURE"
+        )
+
+        deactivate_inactive_users.apply()
+        self.assertEqual(
+            self.sample(
+                "celery_task_runtime_seconds_count", task=task, state="SUCCESS"
+            ),
+            runtime + 1,
+        )
+        with patch(
+            "materials.tasks.flush_user_activity", side_effect=ValueError("ошибка")
+        ):
+            deactivate_inactive_users.apply()
+        self.assertEqual(
+            self.sample("celery_task_failures_total", task=task), failures + 1
+        )
+        self.assertEqual(
+            self.sample(
+                "celery_task_runtime_seconds_count", task=task, state="FAILURE"
+            ),
+            failed_runtime + 1,
+        )
+
+        retries = self.sample("celery_task_retries_total", task=task)
+        task_retry.send(sender=deactivate_inactive_users, request=None, reason="")
+        self.assertEqual(
+            self.sample("celery_task_retries_total", task=task), retries + 1
+        )
+
+
+# Роли, от имени которых проверяется бюджет SQL-запросов
+BUDGET_ROLES = ("owner", "moderator", "superuser")
+
+
+def budget(route, method, queries, status=200, request=None):
+    """
+    Бюджет SQL-запросов эндпоинта. queries и status - число или словарь {роль: число}.
+    request(test, role) готовит объекты и возвращает (url, тело запроса);
+    по умолчанию - адрес маршрута без аргументов и без тела.
+    """
+    return {
+        "route": route,
+        "method": method,
+        "queries": queries,
+        "status": status,
+        "request": request or (lambda test, role: (reverse(route), None)),
+    }
+
+
+def for_role(value, role):
+    return value[role] if isinstance(value, dict) else value
+
+
+# Бюджеты всех маршрутов materials/urls.py, users/urls.py и skillshare_platform/urls.py
+# (кроме админки - её списки проверяют *AdminQueriesTest). Маршрут без имени - по пути
+QUERY_BUDGETS = [
+    budget("/", "get", 0, status=302, request=lambda test, role: ("/", None)),
+    budget("metrics", "get", 0),
+    budget("schema", "get", 0),
+    budget("swagger-ui", "get", 1),
+    budget("redoc", "get", 1),
+    budget("materials:api-root", "get", 1),
+    budget("users:api-root", "get", 1),
+    budget("materials:course-list", "get", 3),
+    budget(
+        "materials:course-list",
+        "post",
+        {"owner": 5, "moderator": 1, "superuser": 5},
+        status={"owner": 201, "moderator": 403, "superuser": 201},
+        request=lambda test, role: (
+            reverse("materials:course-list"),
+            {"title": "Новый курс"},
+        ),
+    ),
+    budget(
+        "materials:course-detail",
+        "get",
+        {"owner": 3, "moderator": 3, "superuser": 2},
+        request=lambda test, role: (test.course_url(test.course), None),
+    ),
+    budget(
+        "materials:course-detail",
+        "put",
+        {"owner": 6, "moderator": 6, "superuser": 4},
+        request=lambda test, role: (
+            test.course_url(test.course),
+            {"title": "Курс", "description": "Описание"},
+        ),
+    ),
+    budget(
+        "materials:course-detail",
+        "patch",
+        {"owner": 6, "moderator": 6, "superuser": 4},
+        request=lambda test, role: (test.course_url(test.course), {"title": "Курс"}),
+    ),
+    budget(
+        "materials:course-detail",
+        "delete",
+        {"owner": 9, "moderator": 3, "superuser": 8},
+        status={"owner": 204, "moderator": 403, "superuser": 204},
+        request=lambda test, role: (test.course_url(test.make_course()), None),
+    ),
+    budget(
+        "materials:course_subscribe",
+        "post",
+        6,
+        request=lambda test, role: (
+            reverse("materials:course_subscribe"),
+            {"course_id": test.make_course().pk},
+        ),
+    ),
+    budget("materials:lesson-list-create", "get", 3),
+    budget(
+        "materials:lesson-list-create",
+        "post",
+        {"owner": 3, "moderator": 1, "superuser": 3},
+        status={"owner": 201, "moderator": 403, "superuser": 201},
+        request=lambda test, role: (
+            reverse("materials:lesson-list-create"),
+            test.lesson_data(),
+        ),
+    ),
+    budget(
+        "materials:lesson-detail",
+        "get",
+        {"owner": 3, "moderator": 3, "superuser": 2},
+        request=lambda test, role: (test.lesson_url(test.lesson), None),
+    ),
+    budget(
+        "materials:lesson-detail",
+        "put",
+        {"owner": 9, "moderator": 9, "superuser": 7},
+        request=lambda test, role: (test.lesson_url(test.lesson), test.lesson_data()),
+    ),
+    budget(
+        "materials:lesson-detail",
+        "patch",
+        {"owner": 8, "moderator": 8, "superuser": 6},
+        request=lambda test, role: (test.lesson_url(test.lesson), {"title": "Урок"}),
+    ),
+    budget(
+        "materials:lesson-detail",
+        "delete",
+        {"owner": 7, "moderator": 3, "superuser": 6},
+        status={"owner": 204, "moderator": 403, "superuser": 204},
+        request=lambda test, role: (test.lesson_url(test.make_lesson()), None),
+    ),
+    budget(
+        "materials:lesson-progress",
+        "post",
+        2,
+        status=202,
+        request=lambda test, role: (
+            reverse("materials:lesson-progress", args=[test.lesson.pk]),
+            {"progress": 50},
+        ),
+    ),
+    budget("users:profile-update", "get", 2),
+    budget(
+        "users:profile-update",
+        "put",
+        3,
+        request=lambda test, role: (reverse("users:profile-update"), {"city": "Пермь"}),
+    ),
+    budget(
+        "users:profile-update",
+        "patch",
+        3,
+        request=lambda test, role: (reverse("users:profile-update"), {"city": "Омск"}),
+    ),
+    budget("users:payment-list", "get", 2),
+    budget(
+        "users:payment-create",
+        "post",
+        7,
+        request=lambda test, role: (
+            reverse("users:payment-create"),
+            {"paid_course": test.course.pk},
+        ),
+    ),
+    budget(
+        "users:payment-status",
+        "get",
+        2,
+        request=lambda test, role: (
+            reverse(
+                "users:payment-status", args=[test.make_payment(test.users[role]).pk]
+            ),
+            None,
+        ),
+    ),
+    budget(
+        "users:owned-materials",
+        "get",
+        2,
+        request=lambda test, role: (
+            reverse("users:owned-materials"),
+            {
+                "courses": ",".join(
+                    str(pk) for pk in Course.objects.values_list("pk", flat=True)
+                )
+            },
+        ),
+    ),
+    budget(
+        "users:revenue-report",
+        "get",
+        {"owner": 1, "moderator": 3, "superuser": 3},
+        status={"owner": 403, "moderator": 200, "superuser": 200},
+        request=lambda test, role: (
+            reverse("users:revenue-report"),
+            {"group_by": "course"},
+        ),
+    ),
+    budget("users:user-list", "get", 4),
+    budget(
+        "users:user-list",
+        "post",
+        3,
+        status=201,
+        request=lambda test, role: (reverse("users:user-list"), test.signup_data()),
+    ),
+    budget(
+        "users:user-detail",
+        "get",
+        3,
+        request=lambda test, role: (test.user_url(test.buyer), None),
+    ),
+    budget(
+        "users:user-detail",
+        "put",
+        {"owner": 3, "moderator": 4, "superuser": 4},
+        status={"owner": 403, "moderator": 200, "superuser": 200},
+        request=lambda test, role: (test.user_url(test.buyer), {"city": "Пермь"}),
+    ),
+    budget(
+        "users:user-detail",
+        "patch",
+        {"owner": 3, "moderator": 4, "superuser": 4},
+        status={"owner": 403, "moderator": 200, "superuser": 200},
+        request=lambda test, role: (test.user_url(test.buyer), {"city": "Омск"}),
+    ),
+    budget(
+        "users:user-detail",
+        "delete",
+        {"owner": 3, "moderator": 14, "superuser": 14},
+        status={"owner": 403, "moderator": 204, "superuser": 204},
+        request=lambda test, role: (test.user_url(test.make_user()), None),
+    ),
+    budget(
+        "token_obtain_pair",
+        "post",
+        1,
+        request=lambda test, role: (
+            reverse("token_obtain_pair"),
+            {"email": test.users[role].email, "password": "pass"},
+        ),
+    ),
+    budget(
+        "token_refresh",
+        "post",
+        1,
+        request=lambda test, role: (
+            reverse("token_refresh"),
+            {"refresh": str(RefreshToken.for_user(test.users[role]))},
+        ),
+    ),
+    budget(
+        "stripe-success",
+        "get",
+        5,
+        request=lambda test, role: (
+            reverse("stripe-success"),
+            {"session_id": test.make_stripe_session("paid")},
+        ),
+    ),
+    budget(
+        "stripe-cancel",
+        "get",
+        2,
+        request=lambda test, role: (
+            reverse("stripe-cancel"),
+            {"session_id": test.make_stripe_session("unpaid")},
+        ),
+    ),
+]
+
+
+class QueryBudgetTest(APITestCase):
+    """
+    Число SQL-запросов каждого эндпоинта для каждой роли не превышает бюджет
+    QUERY_BUDGETS и не растёт с числом строк: эндпоинты вызываются на маленьком
+    и на большом наборе данных. Безопасные запросы выполняются дважды и считается
+    второй: бюджет описывает работу с прогретым кэшем.
+    """
+
+    # Строк каждого вида в маленьком и большом наборе; большой больше размера страницы
+    SMALL_ROWS = 2
+    LARGE_ROWS = 25
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        for patcher in (
+            patch(
+                "skillshare_platform.redis_client._client",
+                fakeredis.FakeRedis(server=self.server, decode_responses=True),
+            ),
+            patch(
+                "django.core.cache.backends.redis.RedisCacheClient.get_client",
+                side_effect=lambda *args, **kwargs: fakeredis.FakeRedis(
+                    server=self.server
+                ),
+            ),
+            patch("skillshare_platform.cache._local_tiers", {}),
+            patch.dict(
+                RedisTokenBucketThrottle.THROTTLE_RATES,
+                dict.fromkeys(RedisTokenBucketThrottle.THROTTLE_RATES, "1000/min"),
+            ),
+            patch(
+                "materials.validators.urlopen",
+                return_value=Mock(getcode=Mock(return_value=200)),
+            ),
+            patch("users.services.create_stripe_product", return_value=Mock(id="prod")),
+            patch("users.services.create_stripe_price", return_value=Mock(id="price")),
+            patch(
+                "users.services.create_stripe_checkout_session",
+                return_value=Mock(id="cs_test", url="https://checkout.stripe.com/cs"),
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        retrieve_patcher = patch("users.views.retrieve_stripe_session")
+        self.retrieve_session = retrieve_patcher.start()
+        self.addCleanup(retrieve_patcher.stop)
+        cache.clear()
+
+        self.numbers = iter(range(1, 1_000_000))
+        self.users = {
+            "owner": User.objects.create_user(
+                email="owner@example.com", password="pass"
+            ),
+            "moderator": User.objects.create_user(
+                email="moderator@example.com", password="pass"
+            ),
+            "superuser": User.objects.create_superuser(
+                email="admin@example.com", password="pass"
+            ),
+        }
+        self.users["moderator"].groups.add(Group.objects.create(name="Moderators"))
+        self.owner = self.users["owner"]
+        self.buyer = self.make_user()
+        self.course = self.make_course()
+        self.lesson = self.make_lesson()
+
+    def make_number(self):
+        return next(self.numbers)
+
+    def make_user(self):
+        return User.objects.create(email=f"user-{self.make_number()}@example.com")
+
+    def make_course(self):
+        return Course.objects.create(
+            title="Курс", course_user=self.owner, fixed_price=100
+        )
+
+    def make_lesson(self):
+        return Lesson.objects.create(
+            course=self.course, title="Урок", price=10, lesson_user=self.owner
+        )
+
+    def make_payment(self, user, status="pending"):
+        return Payment.objects.create(
+            user=user,
+            paid_course=self.course,
+            amount=100,
+            payment_method="stripe",
+            status=status,
+        )
+
+    def make_stripe_session(self, payment_status):
+        """Сессия Stripe, которую вернёт колбэку заглушка, по новому платежу."""
+        payment = self.make_payment(self.buyer)
+        self.retrieve_session.return_value = Mock(
+            payment_status=payment_status,
+            metadata={"payment_id": str(payment.pk)},
+        )
+        return f"cs_{payment.pk}"
+
+    def signup_data(self):
+        # email в UserSerializer только для чтения: регистрация создаёт пользователя
+        # с пустым email, поэтому предыдущая регистрация удаляется
+        User.objects.filter(email="").delete()
+        return {"email": f"new-{self.make_number()}@example.com", "password": "pass"}
+
+    def lesson_data(self):
+        return {
+            "title": "Урок",
+            "course": self.course.pk,
+            "video_link": "https://www.youtube.com/watch?v=budgetLesso",
+        }
+
+    def course_url(self, course):
+        return reverse("materials:course-detail", args=[course.pk])
+
+    def lesson_url(self, lesson):
+        return reverse("materials:lesson-detail", args=[lesson.pk])
+
+    def user_url(self, user):
+        return reverse("users:user-detail", args=[user.pk])
+
+    def add_rows(self, count):
+        """Курсы с уроками, подписки, платежи, доступы, агрегаты выручки и пользователи."""
+        today = timezone.localdate()
+        for _ in range(count):
+            user = self.make_user()
+            course = self.make_course()
+            Lesson.objects.create(
+                course=course, title="Урок", price=10, lesson_user=self.owner
+            )
+            for subscriber in (user, *self.users.values()):
+                CourseSubscription.objects.create(user=subscriber, course=course)
+            for buyer in (user, *self.users.values()):
+                payment = Payment.objects.create(
+                    user=buyer,
+                    paid_course=course,
+                    amount=100,
+                    payment_method="stripe",
+                    status="succeeded",
+                )
+                grant_entitlement(payment)
+            RevenueRollup.objects.create(
+                day=today,
+                course=course,
+                payment_method="stripe",
+                payments_count=1,
+                amount_total=100,
+            )
+
+    def count_queries(self, endpoint, role):
+        url, data = endpoint["request"](self, role)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.users[role])}"
+        )
+        # Роли пользователя уже в кэше, как в установившемся режиме
+        User.objects.get(pk=self.users[role].pk).is_moderator
+        send = getattr(self.client, endpoint["method"])
+        if endpoint["method"] == "get":
+            send(url, data)
+        with CaptureQueriesContext(connections["default"]) as queries:
+            response = send(url, data, format="json")
+        self.assertEqual(
+            response.status_code,
+            for_role(endpoint["status"], role),
+            f"{endpoint['method'].upper()} {url} ({role}): {response.content[:200]}",
+        )
+        return len(queries)
+
+    def measure(self):
+        """{(маршрут, метод, роль): число запросов} на текущем наборе данных."""
+        return {
+            (endpoint["route"], endpoint["method"], role): self.count_queries(
+                endpoint, role
+            )
+            for endpoint in QUERY_BUDGETS
+            for role in BUDGET_ROLES
+        }
+
+    def test_queries_within_budget_and_constant(self):
+        self.add_rows(self.SMALL_ROWS)
+        small = self.measure()
+        self.add_rows(self.LARGE_ROWS - self.SMALL_ROWS)
+        large = self.measure()
+        for endpoint in QUERY_BUDGETS:
+            for role in BUDGET_ROLES:
+                key = (endpoint["route"], endpoint["method"], role)
+                with self.subTest(route=key[0], method=key[1], role=role):
+                    self.assertEqual(
+                        large[key], small[key], "Число запросов растёт с числом строк"
+                    )
+                    self.assertLessEqual(
+                        large[key], for_role(endpoint["queries"], role)
+                    )
+
+    def test_all_routes_have_budgets(self):
+        """Каждый маршрут и каждый метод представления DRF есть в QUERY_BUDGETS."""
+        covered = {}
+        for endpoint in QUERY_BUDGETS:
+            covered.setdefault(endpoint["route"], set()).add(endpoint["method"])
+
+        def walk(resolver, namespace=""):
+            for pattern in resolver.url_patterns:
+                if hasattr(pattern, "url_patterns"):
+                    if pattern.namespace == "admin":
+                        continue
+                    walk(pattern, pattern.namespace or namespace)
+                    continue
+                route = (
+                    f"{namespace}:{pattern.name}" if namespace else pattern.name
+                ) or f"/{pattern.pattern}".replace("^", "").replace("$", "")
+                callback = pattern.callback
+                if hasattr(callback, "actions"):
+                    methods = set(callback.actions)
+                elif issubclass(getattr(callback, "cls", object), APIView):
+                    methods = {
+                        method
+                        for method in callback.cls.http_method_names
+                        if hasattr(callback.cls, method)
+                    }
+                else:
+                    methods = {"get"}
+                # HEAD и OPTIONS обслуживает DRF (ViewSet добавляет head в actions при запросе)
+                methods -= {"head", "options"}
+                with self.subTest(route=route):
+                    self.assertLessEqual(methods, covered.get(route, set()))
+
+        walk(get_resolver())
@@ -3,10 +3,11 @@ from django.urls import include, path, re_path
 from django.views.generic import RedirectView
 # from rest_framework_simplejwt.views import (TokenObtainPairView,
 #                                             TokenRefreshView)
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from drf_spectacular.views import SpectacularRedocView, SpectacularSwaggerView
 
 from skillshare_platform.views import (CustomTokenObtainPairView,
-                                       CustomTokenRefreshView)
+                                       CustomTokenRefreshView, MetricsView,
+                                       OpenAPISchemaView)
 from users.views import StripeCancelView, StripeSuccessView
 
 urlpatterns = [
@@ -14,6 +15,7 @@ urlpatterns = [
         r"^$", RedirectView.as_view(url="/api/schema/swagger-ui/", permanent=False)
     ),
     path("admin/", admin.site.urls),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     path("api/", include("materials.urls")),
     path("api/", include("users.urls")),
     path("api/token/", CustomTokenObtainPairView.as_view(), name="token_obtain_pair"),
@@ -25,11 +27,17 @@ urlpatterns = [
     # Новые URL-адреса для колбэков Stripe на корневом уровне
     path("success/", StripeSuccessView.as_view(), name="stripe-success"),
     path("cancel/", StripeCancelView.as_view(), name="stripe-cancel"),
-    # Пути для документации DRF Spectacular
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    # Пути для документации DRF Spectacular: схема - готовый файл (build_openapi_schema),
+    # Swagger UI и Redoc - статика drf_spectacular_sidecar
+    path("api/schema/", OpenAPISchemaView.as_view(), name="schema"),
     path(
         "api/schema/swagger-ui/",
         SpectacularSwaggerView.as_view(url_name="schema"),
         name="swagger-ui",
     ),
+    path(
+        "api/schema/redoc/",
+        SpectacularRedocView.as_view(url_name="schema"),
+        name="redoc",
+    ),
 ]
@@ -1,19 +1,79 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.views import View
 from drf_spectacular.utils import extend_schema
 from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
+from materials.progress import ProgressLagCollector
+from skillshare_platform.metrics import render_metrics
+from skillshare_platform.schema import SCHEMA_FORMATS, get_schema_document
+from users.serializers import (CustomTokenObtainPairSerializer,
+                               CustomTokenRefreshSerializer)
+from users.throttling import RedisTokenBucketThrottle
+
 
 @extend_schema(
     summary="Получение Access и Refresh токенов",
-    description="Принимает учетные данные пользователя (email, password) и возвращает Access и Refresh токены для аутентификации.",
+    description="Принимает учетные данные пользователя (email, password) и возвращает Access и Refresh токены для аутентификации. "
+    "Токены содержат claims is_active, is_staff, is_superuser и roles.",
 )
 class CustomTokenObtainPairView(TokenObtainPairView):
-    pass
+    serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [RedisTokenBucketThrottle]
+    throttle_scope = "auth"
 
 
 @extend_schema(
     summary="Обновление Access Token",
-    description="Принимает Refresh Token и возвращает новый Access Token, если Refresh Token действителен.",
+    description="Принимает Refresh Token и возвращает новую пару Access и Refresh токенов, если Refresh Token действителен. "
+    "Использованный Refresh Token повторно не принимается.",
 )
 class CustomTokenRefreshView(TokenRefreshView):
-    pass
+    serializer_class = CustomTokenRefreshSerializer
+    throttle_classes = [RedisTokenBucketThrottle]
+    throttle_scope = "refresh"
+
+
+class OpenAPISchemaView(View):
+    """
+    Схема OpenAPI из файла, сгенерированного при деплое командой build_openapi_schema,
+    вместо генерации drf-spectacular на каждый запрос. Формат - ?format=json|yaml
+    или JSON по заголовку Accept, по умолчанию YAML. Ответ кэшируется клиентом
+    на OPENAPI_SCHEMA_CACHE_SECONDS и проверяется по ETag (304 Not Modified).
+    """
+
+    def get_format(self, request):
+        fmt = request.GET.get("format")
+        if fmt in SCHEMA_FORMATS:
+            return fmt
+        return "json" if "json" in request.headers.get("Accept", "") else "yaml"
+
+    def get(self, request, *args, **kwargs):
+        fmt = self.get_format(request)
+        body, etag = get_schema_document(fmt)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type=SCHEMA_FORMATS[fmt][1])
+        response["ETag"] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.OPENAPI_SCHEMA_CACHE_SECONDS
+        )
+        patch_vary_headers(response, ["Accept"])
+        return response
+
+
+class MetricsView(View):
+    """
+    Метрики Prometheus всех воркеров процесса-сервера (skillshare_platform.metrics).
+    Снаружи закрыт в nginx: Prometheus обращается к backend:8000 напрямую.
+    Отставание переноса прогресса по урокам считается при каждом запросе.
+    """
+
+    collectors = [ProgressLagCollector()]
+
+    def get(self, request, *args, **kwargs):
+        body, content_type = render_metrics(self.collectors)
+        return HttpResponse(body, content_type=content_type)
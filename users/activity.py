@@ -0,0 +1,100 @@
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from redis import RedisError, ResponseError
+
+from skillshare_platform.redis_client import get_redis
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# Хэши Redis: поле - ID пользователя, значение - время события (unix time)
+ACTIVITY_KEYS = {
+    "last_login": "activity:last_login",
+    "last_seen": "activity:last_seen",
+}
+
+# Время последней записи last_seen по пользователям в этом процессе
+_seen_recorded_at = {}
+
+
+def record_login(user_id):
+    """
+    Запоминает время входа пользователя в буфере Redis вместо UPDATE users_user.
+    В базу значение попадает при следующем flush_user_activity. Если Redis недоступен,
+    last_login записывается сразу: по нему деактивируются неактивные пользователи,
+    и потерянный вход мог бы привести к деактивации активного пользователя.
+    """
+    try:
+        get_redis().hset(ACTIVITY_KEYS["last_login"], user_id, time.time())
+    except RedisError as e:
+        logger.warning(f"Буфер активности недоступен, last_login пишется в базу: {e}")
+        User.objects.filter(pk=user_id).update(last_login=timezone.now())
+
+
+def record_seen(user_id):
+    """
+    Запоминает время запроса пользователя в буфере Redis.
+    Для одного пользователя запись выполняется не чаще раза в
+    USER_ACTIVITY_SEEN_INTERVAL секунд на процесс. Ошибки Redis только логируются.
+    """
+    now = time.time()
+    if now - _seen_recorded_at.get(user_id, 0) < settings.USER_ACTIVITY_SEEN_INTERVAL:
+        return
+    if len(_seen_recorded_at) >= 10000:
+        _seen_recorded_at.clear()
+    _seen_recorded_at[user_id] = now
+
+    try:
+        get_redis().hset(ACTIVITY_KEYS["last_seen"], user_id, now)
+    except RedisError as e:
+        logger.debug(f"Не удалось записать last_seen пользователя {user_id}: {e}")
+
+
+def _flush_field(redis_client, field, batch_size):
+    """
+    Переносит значения одного хэша активности в поле field таблицы пользователей.
+    Хэш атомарно переименовывается перед чтением, поэтому события, пришедшие во время
+    переноса, попадают в новый хэш и не теряются. Если прошлый перенос прервался,
+    сначала дописывается оставшийся от него хэш.
+    """
+    key = ACTIVITY_KEYS[field]
+    flushing_key = f"{key}:flushing"
+    if not redis_client.exists(flushing_key):
+        try:
+            redis_client.rename(key, flushing_key)
+        except ResponseError:
+            # Хэша нет - новых событий не было
+            return 0
+
+    users = [
+        User(
+            pk=int(user_id),
+            **{
+                field: datetime.datetime.fromtimestamp(
+                    float(timestamp), tz=datetime.timezone.utc
+                )
+            },
+        )
+        for user_id, timestamp in redis_client.hgetall(flushing_key).items()
+    ]
+    User.objects.bulk_update(users, [field], batch_size=batch_size)
+    redis_client.delete(flushing_key)
+    return len(users)
+
+
+def flush_user_activity(batch_size=None):
+    """
+    Записывает накопленные в Redis last_login и last_seen в таблицу пользователей
+    пакетными UPDATE (bulk_update по batch_size строк).
+        Возвращает:
+            dict: Количество перенесённых значений по полям.
+    """
+    batch_size = batch_size or settings.USER_ACTIVITY_FLUSH_BATCH_SIZE
+    redis_client = get_redis()
+    return {
+        field: _flush_field(redis_client, field, batch_size) for field in ACTIVITY_KEYS
+    }
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from users.models import Payment, User
+from users.models import Entitlement, Payment, User
+from users.services import mark_payment_succeeded
 
 
 class CustomUserAdmin(UserAdmin):
@@ -51,7 +52,7 @@ class CustomUserAdmin(UserAdmin):
                 )
             },
         ),
-        ("Important dates", {"fields": ("last_login", "date_joined")}),
+        ("Important dates", {"fields": ("last_login", "last_seen", "date_joined")}),
     )
 
     # Переопределяем add_fieldsets для страницы создания нового пользователя
@@ -82,22 +83,29 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
 
+    def get_queryset(self, request):
+        """
+        Группы всех пользователей страницы загружаются одним запросом для колонки ролей.
+        """
+        return super().get_queryset(request).prefetch_related("groups")
+
     def get_roles(self, obj):
         """
         Метод для получения и отображения ролей/групп пользователя.
+        Использует предзагруженные группы, поэтому не выполняет запросов на строку.
         """
         roles = []
         if obj.is_superuser:
             roles.append("Администратор")
 
+        group_names = [group.name for group in obj.groups.all()]
+
         # Проверяем, является ли пользователь модератором
-        if obj.groups.filter(name="Moderators").exists():
+        if "Moderators" in group_names:
             roles.append("Модератор")
 
         # Получаем названия всех других групп, кроме "Moderators"
-        other_groups = obj.groups.exclude(name="Moderators").values_list(
-            "name", flat=True
-        )
+        other_groups = [name for name in group_names if name != "Moderators"]
         if other_groups:
             roles.append(f"Группы: {', '.join(other_groups)}")
 
@@ -112,5 +120,59 @@ class CustomUserAdmin(UserAdmin):
 # Регистрируем пользовательскую модель User с нашим CustomUserAdmin
 admin.site.register(User, CustomUserAdmin)
 
+
+class PaymentAdmin(admin.ModelAdmin):
+    """
+    Класс для настройки отображения модели Payment в админ-панели.
+    Пользователь, курс и урок платежа загружаются вместе со списком, а в форме
+    выбираются поиском, а не через <select> со всеми записями таблиц.
+    Перевод платежа в succeeded проходит через mark_payment_succeeded, как колбэк Stripe:
+    пользователь получает доступ, а платёж учитывается в агрегатах выручки.
+    """
+
+    list_display = (
+        "id",
+        "user",
+        "paid_course",
+        "paid_lesson",
+        "amount",
+        "payment_method",
+        "status",
+        "payment_date",
+    )
+    # paid_lesson__course нужен для __str__ урока
+    list_select_related = ("user", "paid_course", "paid_lesson__course")
+    # Фильтр по статусу опирается на индекс payment_status_date_idx
+    list_filter = ("status", "payment_method")
+    search_fields = ("user__email", "stripe_id")
+    ordering = ("-payment_date",)
+    autocomplete_fields = ("user", "paid_course", "paid_lesson")
+    readonly_fields = ("payment_date",)
+
+    def save_model(self, request, obj, form, change):
+        succeeded = obj.status == "succeeded" and "status" in form.changed_data
+        if succeeded:
+            # Платёж сохраняется с прежним статусом, а меняет его mark_payment_succeeded
+            obj.status = form.initial.get("status", "pending")
+        super().save_model(request, obj, form, change)
+        if succeeded:
+            mark_payment_succeeded(obj)
+
+
+class EntitlementAdmin(admin.ModelAdmin):
+    """
+    Класс для настройки отображения модели Entitlement в админ-панели.
+    """
+
+    list_display = ("user", "course", "lesson", "payment_method", "granted_at")
+    list_select_related = ("user", "course", "lesson__course")
+    autocomplete_fields = ("user", "course", "lesson")
+    # Платёж указывается по ID: подпись платежа строится по пользователю и курсу
+    raw_id_fields = ("payment",)
+
+
 # Регистрируем модель Payment
-admin.site.register(Payment)
+admin.site.register(Payment, PaymentAdmin)
+
+# Регистрируем модель Entitlement
+admin.site.register(Entitlement, EntitlementAdmin)
@@ -21,3 +21,6 @@ class UsersConfig(AppConfig):
 
         # Регистрируем нашу пользовательскую админку для модели User
         admin.site.register(User, CustomUserAdmin)
+
+        # Подключаем обработчики сигналов (отзыв JWT при смене ролей и деактивации)
+        from users import signals  # noqa: F401
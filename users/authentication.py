@@ -0,0 +1,176 @@
+import logging
+import time
+from functools import partial
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from redis import RedisError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from skillshare_platform.redis_client import get_redis
+from users.activity import record_seen
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# Ключ Redis со временем (unix time) последнего отзыва токенов пользователя
+REVOKED_KEY = "auth:revoked:{user_id}"
+
+# Claims, которые CustomTokenObtainPairSerializer добавляет в токены
+CLAIMS = ("is_active", "is_staff", "is_superuser", "roles")
+
+
+def revoke_user_tokens(*user_ids):
+    """
+    Отзывает все выданные ранее токены пользователей (деактивация, смена ролей, удаление).
+    В Redis записывается время отзыва в целых секундах, как iat токена: токены,
+    выпущенные раньше этой секунды, отклоняются, а выпущенные в ту же секунду
+    (повторный вход сразу после смены ролей) действуют.
+    Запись живёт REFRESH_TOKEN_LIFETIME - access-токены, полученные обновлением,
+    наследуют iat refresh-токена, поэтому более старых действующих токенов не бывает.
+    Вне режима JWT_STATELESS_AUTH ничего не делает: пользователь и так проверяется по базе.
+    Ошибки Redis только логируются.
+    """
+    if not settings.JWT_STATELESS_AUTH or not user_ids:
+        return
+    revoked_at = int(time.time())
+    ttl = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.set(REVOKED_KEY.format(user_id=user_id), revoked_at, ex=ttl)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Не удалось отозвать токены пользователей {user_ids}: {e}")
+
+
+def is_token_revoked(token):
+    """
+    Проверяет, выпущен ли токен до последнего отзыва токенов его пользователя.
+    Исключения redis.RedisError обрабатывает вызывающий код.
+    """
+    user_id = token[api_settings.USER_ID_CLAIM]
+    revoked_at = get_redis().get(REVOKED_KEY.format(user_id=user_id))
+    return revoked_at is not None and token["iat"] < int(float(revoked_at))
+
+
+def load_user(user_id):
+    """
+    Загружает пользователя из базы при первом обращении к полю, которого нет в токене.
+    """
+    try:
+        return User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        raise AuthenticationFailed("Пользователь не найден.", code="user_not_found")
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    Пользователь, восстановленный из claims access-токена.
+    ID, флаги и роли берутся из токена без запроса к базе; обращение к любому
+    другому атрибуту (email, связи, save() и т.д.) один раз загружает User из базы,
+    после чего объект ведёт себя как обычный экземпляр User.
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(partial(load_user, user_id))
+        self.__dict__["_claims"] = {
+            "id": user_id,
+            "is_active": token["is_active"],
+            "is_staff": token["is_staff"],
+            "is_superuser": token["is_superuser"],
+            "roles": tuple(token["roles"]),
+        }
+
+    @property
+    def id(self):
+        return self._claims["id"]
+
+    pk = id
+
+    @property
+    def is_active(self):
+        return self._claims["is_active"]
+
+    @property
+    def is_staff(self):
+        return self._claims["is_staff"]
+
+    @property
+    def is_superuser(self):
+        return self._claims["is_superuser"]
+
+    @property
+    def roles(self):
+        return self._claims["roles"]
+
+    @property
+    def is_moderator(self):
+        return "Moderators" in self._claims["roles"]
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def __bool__(self):
+        # Проверка вида "request.user and ..." в разрешениях не должна загружать пользователя
+        return True
+
+    def __eq__(self, other):
+        # Сравнение с пользователем по ID не требует загрузки из базы
+        if isinstance(other, (User, ClaimsUser)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class ActivityTrackingJWTAuthentication(JWTAuthentication):
+    """
+    Стандартная аутентификация по JWT, которая отмечает время последней активности
+    пользователя (last_seen) в буфере Redis, не обновляя строку users_user.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            record_seen(result[0].pk)
+        return result
+
+
+class StatelessJWTAuthentication(ActivityTrackingJWTAuthentication):
+    """
+    Аутентификация по JWT без запроса пользователя из базы.
+    Вместо SELECT по users_user проверяется только список отзыва в Redis
+    (один GET по ключу пользователя), а request.user - ClaimsUser.
+    Токены без claims (выпущенные до включения режима) и запросы при недоступном Redis
+    обрабатываются как в стандартном JWTAuthentication - с загрузкой пользователя.
+    """
+
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in CLAIMS):
+            return super().get_user(validated_token)
+
+        try:
+            revoked = is_token_revoked(validated_token)
+        except RedisError as e:
+            logger.warning(f"Список отзыва токенов недоступен, проверяем по базе: {e}")
+            return super().get_user(validated_token)
+
+        if revoked:
+            raise AuthenticationFailed("Токен отозван.", code="token_revoked")
+        if not validated_token["is_active"]:
+            raise AuthenticationFailed("Пользователь неактивен.", code="user_inactive")
+        return ClaimsUser(validated_token)
@@ -0,0 +1,103 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from users.models import Payment, RevenueRollup
+
+
+class Command(BaseCommand):
+    """
+    Команда Django для построения агрегатов выручки (RevenueRollup) по истории платежей.
+    Агрегирует успешные платежи средствами базы (GROUP BY день, курс, урок, способ оплаты)
+    окнами по несколько дней, чтобы каждый запрос читал ограниченный диапазон дат.
+    Каждое окно заменяется в своей транзакции под блокировкой таблицы агрегатов:
+    инкрементальные обновления от новых платежей (в том числе колбэк Stripe) ждут
+    только текущее окно и применяются поверх. Границы истории читаются под блокировкой,
+    поэтому платёж, успешный во время перестройки, не теряется.
+    """
+
+    help = "Перестраивает агрегаты выручки по дням из истории успешных платежей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days-per-batch",
+            type=int,
+            default=31,
+            help="Сколько дней истории агрегировать одним запросом (по умолчанию 31)",
+        )
+
+    def handle(self, *args, **options):
+        days_per_batch = datetime.timedelta(days=options["days_per_batch"])
+        self.tz = timezone.get_current_timezone()
+        payments = Payment.objects.filter(status="succeeded")
+        bounds = payments.order_by("payment_date").values_list(
+            "payment_date", flat=True
+        )
+
+        with transaction.atomic():
+            self.lock_rollups()
+            first_payment_date = bounds.first()
+            if first_payment_date is None:
+                RevenueRollup.objects.all().delete()
+                self.stdout.write(self.style.WARNING("Успешных платежей нет."))
+                return
+            day = timezone.localdate(first_payment_date)
+            # Агрегаты за дни до первого успешного платежа устарели
+            RevenueRollup.objects.filter(day__lt=day).delete()
+
+        total = 0
+        while True:
+            with transaction.atomic():
+                self.lock_rollups()
+                last_day = timezone.localdate(bounds.last())
+                if day > last_day:
+                    RevenueRollup.objects.filter(day__gte=day).delete()
+                    break
+                window_end = day + days_per_batch
+                RevenueRollup.objects.filter(day__gte=day, day__lt=window_end).delete()
+                rows = (
+                    payments.filter(
+                        payment_date__gte=self.day_start(day),
+                        payment_date__lt=self.day_start(window_end),
+                    )
+                    .annotate(day=TruncDate("payment_date", tzinfo=self.tz))
+                    .values("day", "paid_course_id", "paid_lesson_id", "payment_method")
+                    .annotate(payments_count=Count("id"), amount_total=Sum("amount"))
+                    .order_by()
+                )
+                rollups = [
+                    RevenueRollup(
+                        day=row["day"],
+                        course_id=row["paid_course_id"],
+                        lesson_id=row["paid_lesson_id"],
+                        payment_method=row["payment_method"],
+                        payments_count=row["payments_count"],
+                        amount_total=row["amount_total"],
+                    )
+                    for row in rows
+                ]
+                RevenueRollup.objects.bulk_create(rollups, batch_size=1000)
+            total += len(rollups)
+            self.stdout.write(f"  {day} - {window_end}: строк агрегата {len(rollups)}")
+            day = window_end
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Агрегаты выручки построены. Всего строк: {total}")
+        )
+
+    def day_start(self, day):
+        return datetime.datetime.combine(day, datetime.time.min, tzinfo=self.tz)
+
+    def lock_rollups(self):
+        """Блокирует инкрементальные обновления агрегатов до конца текущей транзакции."""
+        if connection.vendor != "postgresql":
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"LOCK TABLE {connection.ops.quote_name(RevenueRollup._meta.db_table)} "
+                "IN EXCLUSIVE MODE"
+            )
@@ -0,0 +1,82 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+from materials.models import Course
+
+
+class Command(BaseCommand):
+    """
+    Команда Django для сравнения задержки запроса при разных режимах соединений с базой.
+    Каждая итерация повторяет жизненный цикл HTTP-запроса: сигналы request_started и
+    request_finished (по ним Django закрывает устаревшие соединения) и один запрос к базе.
+    Режимы: новое соединение на каждый запрос (CONN_MAX_AGE=0), постоянное соединение,
+    постоянное соединение с проверкой перед повторным использованием и текущие настройки
+    (в том числе пул psycopg, если задан DB_POOL_MAX_SIZE).
+    """
+
+    help = (
+        "Измеряет задержку запроса к базе с новыми, постоянными и пуловыми соединениями"
+    )
+
+    # Название режима: (CONN_MAX_AGE, CONN_HEALTH_CHECKS); None - значения из настроек
+    modes = {
+        "Новое соединение": (0, False),
+        "Постоянное соединение": (None, False),
+        "Постоянное с проверкой": (None, True),
+        "Текущие настройки": None,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Количество запросов в каждом режиме (по умолчанию 200)",
+        )
+
+    def measure(self, requests):
+        """Возвращает задержки requests запросов в миллисекундах."""
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            Course.objects.exists()
+            request_finished.send(sender=self.__class__)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def handle(self, *args, **options):
+        if connection.in_atomic_block:
+            raise CommandError("Замер нельзя выполнять внутри транзакции.")
+
+        settings_dict = connection.settings_dict
+        configured = (
+            settings_dict["CONN_MAX_AGE"],
+            settings_dict["CONN_HEALTH_CHECKS"],
+        )
+        self.stdout.write(
+            f"{'Режим':<24}{'среднее, мс':>14}{'p50, мс':>10}{'p95, мс':>10}"
+        )
+        try:
+            for name, mode in self.modes.items():
+                max_age, health_checks = mode or configured
+                settings_dict["CONN_MAX_AGE"] = max_age
+                settings_dict["CONN_HEALTH_CHECKS"] = health_checks
+                connection.close()
+
+                timings = self.measure(options["requests"])
+                # Границы 5%-х интервалов: 10-я - медиана, 19-я - 95-й перцентиль
+                quantiles = statistics.quantiles(timings, n=20)
+                p50, p95 = quantiles[9], quantiles[18]
+                self.stdout.write(
+                    f"{name:<24}{statistics.mean(timings):>14.2f}{p50:>10.2f}{p95:>10.2f}"
+                )
+        finally:
+            settings_dict["CONN_MAX_AGE"], settings_dict["CONN_HEALTH_CHECKS"] = (
+                configured
+            )
+            connection.close()
@@ -0,0 +1,154 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from materials.models import Course, Lesson
+from users.models import Payment, User
+from users.serializers import CustomTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    """
+    Команда Django для нагрузочного сравнения синхронного (gunicorn, WSGI) и асинхронного
+    (uvicorn, ASGI) развёртываний. Обращается по HTTP к уже запущенному серверу:
+    на каждый эндпоинт --duration секунд отправляет запросы --concurrency параллельными
+    клиентами от имени пользователя --email и печатает пропускную способность и задержки.
+    Эндпоинты: списки и детали курсов и уроков, статус pending-платежа пользователя
+    с long-poll (--wait секунд) - он показывает, сколько запросов ждут одновременно.
+    Запускается с той же базой, что и сервер: идентификаторы и токен берутся из неё.
+    """
+
+    help = "Нагрузочный тест горячих GET-эндпоинтов запущенного сервера"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            default="http://127.0.0.1:8000",
+            help="Адрес сервера (по умолчанию http://127.0.0.1:8000)",
+        )
+        parser.add_argument(
+            "--email",
+            required=True,
+            help="Пользователь, от имени которого идут запросы",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="Число параллельных клиентов (по умолчанию 50)",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10,
+            help="Длительность нагрузки на каждый эндпоинт в секундах (по умолчанию 10)",
+        )
+        parser.add_argument(
+            "--wait",
+            type=float,
+            default=2,
+            help="Параметр wait запроса статуса платежа (по умолчанию 2)",
+        )
+
+    def get_endpoints(self, user, wait):
+        """Возвращает {название: путь} для объектов пользователя."""
+        endpoints = {
+            "Список курсов": reverse("materials:course-list"),
+            "Список уроков": reverse("materials:lesson-list-create"),
+        }
+        course = Course.objects.filter(course_user=user).first()
+        if course is not None:
+            endpoints["Детали курса"] = reverse(
+                "materials:course-detail", args=[course.pk]
+            )
+        lesson = Lesson.objects.filter(lesson_user=user).first()
+        if lesson is not None:
+            endpoints["Детали урока"] = reverse(
+                "materials:lesson-detail", args=[lesson.pk]
+            )
+        payment = Payment.objects.filter(
+            user=user, status="pending", payment_url__isnull=True
+        ).first()
+        if payment is not None:
+            url = reverse("users:payment-status", args=[payment.pk])
+            endpoints["Статус платежа (long-poll)"] = f"{url}?wait={wait}"
+        else:
+            self.stdout.write(
+                "У пользователя нет pending-платежа без payment_url: "
+                "статус платежа не измеряется."
+            )
+        return endpoints
+
+    async def load(self, client, path, concurrency, duration):
+        """Возвращает задержки успешных запросов в миллисекундах и число ошибок."""
+        import httpx
+
+        timings = []
+        errors = 0
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                timings.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return timings, errors
+
+    async def run(self, endpoints, token, options):
+        import httpx
+
+        async with httpx.AsyncClient(
+            base_url=options["base_url"],
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=options["wait"] + 30,
+            limits=httpx.Limits(max_connections=options["concurrency"]),
+        ) as client:
+            for name, path in endpoints.items():
+                timings, errors = await self.load(
+                    client, path, options["concurrency"], options["duration"]
+                )
+                if len(timings) < 2:
+                    self.stdout.write(
+                        f"{name:<28}мало успешных ответов, ошибок: {errors}"
+                    )
+                    continue
+                # Границы 5%-х интервалов: 10-я - медиана, 19-я - 95-й перцентиль
+                quantiles = statistics.quantiles(timings, n=20)
+                self.stdout.write(
+                    f"{name:<28}{len(timings) / options['duration']:>10.1f}"
+                    f"{quantiles[9]:>10.1f}{quantiles[18]:>10.1f}{errors:>8}"
+                )
+
+    def handle(self, *args, **options):
+        try:
+            import httpx  # noqa: F401
+        except ImportError:
+            raise CommandError("Для нагрузочного теста нужен httpx (requirements.txt).")
+
+        user = User.objects.filter(email=options["email"]).first()
+        if user is None:
+            raise CommandError(f"Пользователь {options['email']} не найден.")
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        endpoints = self.get_endpoints(user, options["wait"])
+
+        self.stdout.write(
+            f"{options['base_url']}: {options['concurrency']} клиентов, "
+            f"{options['duration']:g} с на эндпоинт"
+        )
+        self.stdout.write(
+            f"{'Эндпоинт':<28}{'запр./с':>10}{'p50, мс':>10}{'p95, мс':>10}{'ошибки':>8}"
+        )
+        asyncio.run(self.run(endpoints, str(token), options))
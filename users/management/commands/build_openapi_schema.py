@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from skillshare_platform.schema import write_schema
+
+
+class Command(BaseCommand):
+    """
+    Команда Django для генерации схемы OpenAPI в файлы schema.yaml и schema.json
+    каталога OPENAPI_SCHEMA_DIR. Выполняется при деплое после collectstatic:
+    /api/schema/ отдаёт готовый файл, а не строит схему по всем представлениям
+    на каждый запрос.
+    """
+
+    help = "Генерирует схему OpenAPI в статические файлы"
+
+    def handle(self, *args, **options):
+        for path in write_schema():
+            self.stdout.write(f"  {path}")
+        self.stdout.write(self.style.SUCCESS("Схема OpenAPI сгенерирована."))
@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from redis import RedisError
+
+
+class Command(BaseCommand):
+    """
+    Команда Django для просмотра попаданий двухуровневого кэша (skillshare_platform.cache).
+    Счётчики всех процессов (воркеры gunicorn, Celery) собираются в хэше Redis cache:stats;
+    каждый процесс переносит туда свои счётчики раз в CACHE_STATS_INTERVAL секунд.
+    """
+
+    help = "Показывает долю попаданий в память процесса и в Redis по всем процессам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Обнулить счётчики после вывода",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            stats = cache.cluster_stats()
+        except RedisError as e:
+            raise CommandError(f"Redis недоступен: {e}")
+
+        self.stdout.write(f"Попадания в памяти процесса: {stats['local_hits']}")
+        self.stdout.write(f"Попадания в Redis: {stats['shared_hits']}")
+        self.stdout.write(f"Промахи: {stats['misses']}")
+        self.stdout.write(
+            f"Доля попаданий: память {stats['local_hit_ratio']:.1%}, "
+            f"Redis {stats['shared_hit_ratio']:.1%}, всего {stats['hit_ratio']:.1%}"
+        )
+
+        if options["reset"]:
+            cache.reset_cluster_stats()
+            self.stdout.write(self.style.SUCCESS("Счётчики обнулены."))
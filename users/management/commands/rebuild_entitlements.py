@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import Entitlement, Payment
+
+
+class Command(BaseCommand):
+    """
+    Команда Django для построения таблицы доступов (Entitlement) по истории платежей.
+    Проходит успешные платежи пачками по возрастанию ID (без OFFSET) и делает upsert
+    по уникальному ключу (user, course, lesson). При нескольких платежах за один материал
+    остаётся самый поздний, как и при выдаче доступа в момент оплаты.
+    """
+
+    help = "Перестраивает таблицу доступов к курсам и урокам по успешным платежам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Количество платежей, обрабатываемых за один запрос (по умолчанию 5000)",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Удалить существующие доступы перед построением",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        if options["clear"]:
+            deleted, _ = Entitlement.objects.all().delete()
+            self.stdout.write(f"Удалено доступов: {deleted}")
+
+        payments = (
+            Payment.objects.filter(status="succeeded")
+            .exclude(paid_course__isnull=True, paid_lesson__isnull=True)
+            .order_by("id")
+        )
+
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(
+                payments.filter(id__gt=last_id).values_list(
+                    "id",
+                    "user_id",
+                    "paid_course_id",
+                    "paid_lesson_id",
+                    "payment_method",
+                    "payment_date",
+                )[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            # В пределах пачки оставляем последний платёж для каждого ключа,
+            # иначе один INSERT ... ON CONFLICT затронет строку дважды
+            entitlements = {}
+            for payment_id, user_id, course_id, lesson_id, method, paid_at in batch:
+                entitlements[(user_id, course_id, lesson_id)] = Entitlement(
+                    user_id=user_id,
+                    course_id=course_id,
+                    lesson_id=lesson_id,
+                    payment_id=payment_id,
+                    payment_method=method,
+                    granted_at=paid_at,
+                )
+
+            with transaction.atomic():
+                Entitlement.objects.bulk_create(
+                    entitlements.values(),
+                    update_conflicts=True,
+                    unique_fields=["user", "course", "lesson"],
+                    update_fields=["payment", "payment_method", "granted_at"],
+                )
+            total += len(batch)
+            self.stdout.write(f"  Обработано платежей: {total}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Таблица доступов построена. Всего доступов: {Entitlement.objects.count()}"
+            )
+        )
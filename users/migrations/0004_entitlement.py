@@ -0,0 +1,109 @@
+# Generated by Django 5.2.3 on 2026-10-18 22:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_course_updated_at"),
+        ("users", "0003_alter_payment_payment_method"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Entitlement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "payment_method",
+                    models.CharField(
+                        choices=[
+                            ("cash", "Наличные"),
+                            ("transfer", "Перевод на счет"),
+                            ("make_qr_code", "Перевод по QR-коду"),
+                            ("stripe", "Stripe"),
+                            ("free", "Бесплатно"),
+                        ],
+                        help_text="Способ оплаты, которым получен доступ",
+                        max_length=20,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "granted_at",
+                    models.DateTimeField(
+                        help_text="Дата и время получения доступа",
+                        verbose_name="Дата получения доступа",
+                    ),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Курс, к которому получен доступ",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="entitlements",
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Урок, к которому получен доступ",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="entitlements",
+                        to="materials.lesson",
+                        verbose_name="Урок",
+                    ),
+                ),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Платёж, которым получен доступ",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="entitlements",
+                        to="users.payment",
+                        verbose_name="Платёж",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        help_text="Пользователь, получивший доступ",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="entitlements",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Доступ к материалу",
+                "verbose_name_plural": "Доступы к материалам",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "course", "lesson"),
+                        name="unique_user_course_lesson_entitlement",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+    ]
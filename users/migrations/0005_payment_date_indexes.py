@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 22:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_course_updated_at"),
+        ("users", "0004_entitlement"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["user", "-payment_date"], name="payment_user_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["-payment_date"], name="payment_date_idx"),
+        ),
+    ]
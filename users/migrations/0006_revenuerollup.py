@@ -0,0 +1,100 @@
+# Generated by Django 5.2.3 on 2026-10-18 22:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_course_updated_at"),
+        ("users", "0005_payment_date_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevenueRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(help_text="День оплаты", verbose_name="День")),
+                (
+                    "payment_method",
+                    models.CharField(
+                        choices=[
+                            ("cash", "Наличные"),
+                            ("transfer", "Перевод на счет"),
+                            ("make_qr_code", "Перевод по QR-коду"),
+                            ("stripe", "Stripe"),
+                            ("free", "Бесплатно"),
+                        ],
+                        help_text="Способ оплаты",
+                        max_length=20,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "payments_count",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Количество успешных платежей",
+                        verbose_name="Количество платежей",
+                    ),
+                ),
+                (
+                    "amount_total",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        help_text="Сумма успешных платежей",
+                        max_digits=14,
+                        verbose_name="Сумма",
+                    ),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        help_text="Оплаченный курс",
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        help_text="Оплаченный урок",
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="materials.lesson",
+                        verbose_name="Урок",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Выручка за день",
+                "verbose_name_plural": "Выручка по дням",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "course", "lesson", "payment_method"),
+                        name="unique_revenue_rollup_key",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0006_revenuerollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="last_seen",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Время последнего запроса к API (обновляется пакетно из Redis)",
+                null=True,
+                verbose_name="Последняя активность",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_course_updated_at"),
+        ("users", "0007_user_last_seen"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["status", "-payment_date"], name="payment_status_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+
+def backfill_entitlements(apps, schema_editor):
+    """
+    Строит доступы по успешным платежам, накопленным до появления таблицы Entitlement:
+    иначе после деплоя проверка "уже куплено?" не видит прошлых покупок. Повторяет
+    rebuild_entitlements: пачки по возрастанию ID, при нескольких платежах за один
+    материал остаётся самый поздний.
+    """
+    Entitlement = apps.get_model("users", "Entitlement")
+    Payment = apps.get_model("users", "Payment")
+    payments = (
+        Payment.objects.filter(status="succeeded")
+        .exclude(paid_course__isnull=True, paid_lesson__isnull=True)
+        .order_by("id")
+    )
+
+    last_id = 0
+    while True:
+        batch = list(
+            payments.filter(id__gt=last_id).values_list(
+                "id",
+                "user_id",
+                "paid_course_id",
+                "paid_lesson_id",
+                "payment_method",
+                "payment_date",
+            )[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        entitlements = {}
+        for payment_id, user_id, course_id, lesson_id, method, paid_at in batch:
+            entitlements[(user_id, course_id, lesson_id)] = Entitlement(
+                user_id=user_id,
+                course_id=course_id,
+                lesson_id=lesson_id,
+                payment_id=payment_id,
+                payment_method=method,
+                granted_at=paid_at,
+            )
+        Entitlement.objects.bulk_create(
+            entitlements.values(),
+            update_conflicts=True,
+            unique_fields=["user", "course", "lesson"],
+            update_fields=["payment", "payment_method", "granted_at"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0008_payment_status_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_entitlements, migrations.RunPython.noop),
+    ]
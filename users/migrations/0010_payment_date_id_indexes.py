@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0007_lesson_progress"),
+        ("users", "0009_backfill_entitlements"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="payment",
+            name="payment_user_date_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="payment",
+            name="payment_date_idx",
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["user", "-payment_date", "-id"], name="payment_user_date_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["-payment_date", "-id"], name="payment_date_id_idx"
+            ),
+        ),
+    ]
@@ -1,9 +1,13 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
 
 from materials.models import Course, Lesson
 
+# Ключ кэша с названиями групп пользователя
+ROLES_CACHE_KEY = "user:roles:{user_id}"
+
 
 class CustomUserManager(BaseUserManager):
     """
@@ -70,6 +74,12 @@ class User(AbstractUser):
         verbose_name="Аватар",
         help_text="Загрузите свой аватар",
     )
+    last_seen = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Последняя активность",
+        help_text="Время последнего запроса к API (обновляется пакетно из Redis)",
+    )
 
     USERNAME_FIELD = "email"  # устанавливаем email как поля для авторизации
     REQUIRED_FIELDS = []
@@ -83,6 +93,30 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+    @property
+    def roles(self):
+        """
+        Названия групп пользователя.
+        Хранятся в кэше (в памяти процесса и в Redis) и сбрасываются при изменении групп
+        (users.signals), поэтому проверка роли в каждом запросе не обращается к базе.
+        """
+        if self.pk is None:
+            return []
+        key = ROLES_CACHE_KEY.format(user_id=self.pk)
+        roles = cache.get(key)
+        if roles is None:
+            roles = list(self.groups.values_list("name", flat=True))
+            cache.set(key, roles)
+        return roles
+
+    @property
+    def is_moderator(self):
+        """
+        Входит ли пользователь в группу модераторов.
+        При аутентификации без базы (ClaimsUser) значение берётся из claims токена.
+        """
+        return "Moderators" in self.roles
+
 
 class Payment(models.Model):
     """
@@ -171,6 +205,18 @@ class Payment(models.Model):
     class Meta:
         verbose_name = "Платёж"
         verbose_name_plural = "Платежи"
+        indexes = [
+            # История платежей пользователя с сортировкой по дате и ID (keyset-пагинация)
+            models.Index(
+                fields=["user", "-payment_date", "-id"], name="payment_user_date_id_idx"
+            ),
+            # Список всех платежей для модераторов и администраторов
+            models.Index(fields=["-payment_date", "-id"], name="payment_date_id_idx"),
+            # Фильтр по статусу в админке и сверка зависших платежей pending
+            models.Index(
+                fields=["status", "-payment_date"], name="payment_status_date_idx"
+            ),
+        ]
 
     def __str__(self):
         if self.paid_course:
@@ -192,3 +238,138 @@ class Payment(models.Model):
             raise ValidationError(
                 "Платеж должен быть связан либо с курсом, либо с уроком."
             )
+
+
+class Entitlement(models.Model):
+    """
+    Право доступа пользователя к курсу или уроку.
+    Создаётся при успешной оплате или бесплатном приобретении материала.
+    Ключ (user, course, lesson) уникален, поэтому проверка "принадлежит ли пользователю
+    этот курс/урок" - это поиск по уникальному индексу, а не сканирование платежей.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="entitlements",
+        verbose_name="Пользователь",
+        help_text="Пользователь, получивший доступ",
+    )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="entitlements",
+        verbose_name="Курс",
+        help_text="Курс, к которому получен доступ",
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="entitlements",
+        verbose_name="Урок",
+        help_text="Урок, к которому получен доступ",
+    )
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="entitlements",
+        verbose_name="Платёж",
+        help_text="Платёж, которым получен доступ",
+    )
+    payment_method = models.CharField(
+        max_length=20,
+        choices=Payment.PAYMENT_METHOD_CHOICES,
+        verbose_name="Способ оплаты",
+        help_text="Способ оплаты, которым получен доступ",
+    )
+    granted_at = models.DateTimeField(
+        verbose_name="Дата получения доступа",
+        help_text="Дата и время получения доступа",
+    )
+
+    class Meta:
+        verbose_name = "Доступ к материалу"
+        verbose_name_plural = "Доступы к материалам"
+        constraints = [
+            # NULL в course/lesson считаются равными, чтобы ключ оставался уникальным
+            models.UniqueConstraint(
+                fields=["user", "course", "lesson"],
+                name="unique_user_course_lesson_entitlement",
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        if self.course_id:
+            return f"Доступ пользователя {self.user_id} к курсу {self.course_id}"
+        return f"Доступ пользователя {self.user_id} к уроку {self.lesson_id}"
+
+
+class RevenueRollup(models.Model):
+    """
+    Агрегат выручки за день по курсу, уроку и способу оплаты.
+    Обновляется инкрементально при переходе платежа в статус succeeded,
+    поэтому отчёты о выручке читают только эту таблицу, а не всю историю платежей.
+    Ссылки на курс и урок без ограничения внешнего ключа: выручка по удалённым
+    материалам остаётся в отчётах.
+    """
+
+    day = models.DateField(verbose_name="День", help_text="День оплаты")
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        blank=True,
+        null=True,
+        related_name="+",
+        verbose_name="Курс",
+        help_text="Оплаченный курс",
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        blank=True,
+        null=True,
+        related_name="+",
+        verbose_name="Урок",
+        help_text="Оплаченный урок",
+    )
+    payment_method = models.CharField(
+        max_length=20,
+        choices=Payment.PAYMENT_METHOD_CHOICES,
+        verbose_name="Способ оплаты",
+        help_text="Способ оплаты",
+    )
+    payments_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество платежей",
+        help_text="Количество успешных платежей",
+    )
+    amount_total = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name="Сумма",
+        help_text="Сумма успешных платежей",
+    )
+
+    class Meta:
+        verbose_name = "Выручка за день"
+        verbose_name_plural = "Выручка по дням"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "course", "lesson", "payment_method"],
+                name="unique_revenue_rollup_key",
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return f"Выручка за {self.day} ({self.payment_method}): {self.amount_total}"
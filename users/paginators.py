@@ -0,0 +1,43 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class UsersPagination(PageNumberPagination):
+    """
+    Пагинация для списка пользователей.
+
+    - page_size: Количество элементов на странице (20)
+    - page_size_query_param: Параметр для изменения размера страницы
+    - max_page_size: Максимальное количество элементов на странице (100)
+    """
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class PaymentCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация для истории платежей.
+    Следующая страница выбирается условием по дате оплаты (WHERE payment_date < ...),
+    а не OFFSET, поэтому стоимость запроса не растёт с номером страницы.
+    Дата оплаты не уникальна, поэтому к любой сортировке добавляется ID в том же
+    направлении: платежи с одинаковой датой идут в постоянном порядке и не пропускаются
+    и не повторяются между страницами. Сортировку поддерживают составные индексы Payment.
+
+    - page_size: Количество элементов на странице (20)
+    - page_size_query_param: Параметр для изменения размера страницы
+    - max_page_size: Максимальное количество элементов на странице (100)
+    - ordering: Сортировка по умолчанию - сначала новые платежи
+    """
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-payment_date", "-id")
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            direction = "-" if ordering[0].startswith("-") else ""
+            ordering = (*ordering, f"{direction}id")
+        return ordering
@@ -10,9 +10,7 @@ class IsModerator(BasePermission):
 
     def has_permission(self, request, view):
         return (
-            request.user
-            and request.user.is_authenticated
-            and request.user.groups.filter(name="Moderators").exists()
+            request.user and request.user.is_authenticated and request.user.is_moderator
         )
 
 
@@ -25,7 +23,7 @@ class IsNotModerator(BasePermission):
         return (
             request.user
             and request.user.is_authenticated
-            and not request.user.groups.filter(name="Moderators").exists()
+            and not request.user.is_moderator
         )
 
 
@@ -82,3 +80,15 @@ class IsOwnerOrSuperuser(BasePermission):
             # Проверяем, является ли пользователь владельцем
             return IsOwner().has_object_permission(request, view, obj)
         return False
+
+
+class IsModeratorOrSuperuser(BasePermission):
+    """
+    Пользовательское разрешение, пропускающее только модераторов и суперпользователей.
+    Используется для отчётов, которые не привязаны к конкретному владельцу.
+    """
+
+    def has_permission(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return False
+        return request.user.is_superuser or IsModerator().has_permission(request, view)
@@ -0,0 +1,40 @@
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EchoBuffer:
+    """
+    Псевдо-буфер для csv.writer: вместо накопления строк сразу возвращает их,
+    чтобы StreamingHttpResponse отдавал CSV клиенту построчно.
+    """
+
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Рендерер для формата CSV (`?format=csv`).
+    Выгрузка данных выполняется потоково в самом представлении (StreamingHttpResponse),
+    а этот рендерер нужен для согласования формата и для вывода ошибок (401, 400 и т.п.) в CSV.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if isinstance(data, dict):
+            for key, value in data.items():
+                writer.writerow([key, value])
+        else:
+            for row in data:
+                writer.writerow(row.values() if isinstance(row, dict) else [row])
+        return buffer.getvalue().encode(self.charset)
@@ -1,7 +1,22 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+from redis import RedisError
 from rest_framework import serializers
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings
 
 from materials.models import Course, Lesson
+from users.activity import record_login
+from users.authentication import CLAIMS, is_token_revoked
 from users.models import Payment, User
+from users.tokens import consume_refresh_token
+
+logger = logging.getLogger(__name__)
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -38,6 +53,7 @@ class PaymentCreateSerializer(serializers.Serializer):
     amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     status = serializers.CharField(read_only=True)
     payment_id = serializers.IntegerField(read_only=True)
+    status_url = serializers.CharField(read_only=True)
 
     def validate(self, data):
         paid_course = data.get("paid_course")
@@ -54,6 +70,200 @@ class PaymentCreateSerializer(serializers.Serializer):
         return data
 
 
+class PaymentStatusSerializer(serializers.Serializer):
+    """
+    Сериализатор ответа эндпоинта статуса платежа.
+    Поле `ready` равно True, когда ссылка на оплату готова или платёж уже завершён.
+    """
+
+    payment_id = serializers.IntegerField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    payment_url = serializers.URLField(read_only=True, allow_null=True)
+    ready = serializers.BooleanField(read_only=True)
+
+
+class OwnedMaterialsSerializer(serializers.Serializer):
+    """
+    Сериализатор ответа пакетной проверки доступа: ID принадлежащих пользователю курсов и уроков.
+    """
+
+    courses = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+    lessons = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+
+
+class RevenueReportQuerySerializer(serializers.Serializer):
+    """
+    Сериализатор параметров отчёта о выручке.
+    По умолчанию отчёт строится за последние 30 дней с группировкой по дням.
+    """
+
+    GROUP_BY_CHOICES = ["day", "course", "lesson", "payment_method"]
+    MAX_RANGE_DAYS = 366
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    course = serializers.IntegerField(required=False)
+    lesson = serializers.IntegerField(required=False)
+    payment_method = serializers.ChoiceField(
+        choices=Payment.PAYMENT_METHOD_CHOICES, required=False
+    )
+    group_by = serializers.ChoiceField(choices=GROUP_BY_CHOICES, default="day")
+
+    def validate(self, data):
+        data.setdefault("date_to", timezone.localdate())
+        data.setdefault("date_from", data["date_to"] - datetime.timedelta(days=29))
+
+        if data["date_from"] > data["date_to"]:
+            raise serializers.ValidationError(
+                "Дата начала периода не может быть позже даты окончания."
+            )
+        if (data["date_to"] - data["date_from"]).days >= self.MAX_RANGE_DAYS:
+            raise serializers.ValidationError(
+                f"Период отчёта не может превышать {self.MAX_RANGE_DAYS} дней."
+            )
+        return data
+
+
+class RevenueReportRowSerializer(serializers.Serializer):
+    """
+    Сериализатор строки отчёта о выручке. Заполнено только поле, по которому идёт группировка.
+    """
+
+    day = serializers.DateField(required=False)
+    course = serializers.IntegerField(required=False, allow_null=True)
+    lesson = serializers.IntegerField(required=False, allow_null=True)
+    payment_method = serializers.CharField(required=False)
+    payments_count = serializers.IntegerField()
+    amount_total = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class RevenueReportSerializer(serializers.Serializer):
+    """
+    Сериализатор ответа отчёта о выручке: строки и итог за период.
+    """
+
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    group_by = serializers.CharField()
+    results = RevenueReportRowSerializer(many=True)
+    total = RevenueReportRowSerializer()
+
+
+class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Сериализатор получения пары токенов с claims ролей пользователя.
+    is_active, is_staff, is_superuser и roles (названия групп) позволяют
+    StatelessJWTAuthentication аутентифицировать запрос без обращения к базе.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["is_active"] = user.is_active
+        token["is_staff"] = user.is_staff
+        token["is_superuser"] = user.is_superuser
+        token["roles"] = user.roles
+        return token
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        # Время входа попадает в базу пакетно (UPDATE_LAST_LOGIN отключён)
+        record_login(self.user.pk)
+        return data
+
+
+class RefreshUnavailable(APIException):
+    """Обновление токенов невозможно: недоступно хранилище использованных токенов."""
+
+    status_code = 503
+    default_detail = "Обновление токенов временно недоступно, повторите позже."
+    default_code = "refresh_unavailable"
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Сериализатор обновления токенов с ротацией refresh-токена.
+    Использованный refresh-токен отмечается в Redis по jti (users.tokens) и повторно
+    не принимается. В режиме JWT_STATELESS_AUTH активность пользователя проверяется
+    по claims и списку отзыва в Redis, без запроса к базе; в остальных случаях
+    - по базе, как в стандартном TokenRefreshSerializer. Если Redis недоступен,
+    обновление с ротацией отклоняется (503), пока не включён JWT_REFRESH_FAIL_OPEN.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        stateless = settings.JWT_STATELESS_AUTH and all(
+            claim in refresh for claim in CLAIMS
+        )
+
+        redis_available = True
+        try:
+            if api_settings.ROTATE_REFRESH_TOKENS and not consume_refresh_token(
+                refresh
+            ):
+                raise AuthenticationFailed(
+                    "Refresh-токен уже использован.", code="token_reused"
+                )
+            if stateless and is_token_revoked(refresh):
+                raise AuthenticationFailed("Токен отозван.", code="token_revoked")
+        except RedisError as e:
+            logger.warning(f"Хранилище отзыва токенов недоступно: {e}")
+            if (
+                api_settings.ROTATE_REFRESH_TOKENS
+                and not settings.JWT_REFRESH_FAIL_OPEN
+            ):
+                raise RefreshUnavailable()
+            redis_available = False
+
+        if stateless and redis_available:
+            if not refresh["is_active"]:
+                raise AuthenticationFailed(
+                    self.error_messages["no_active_account"], "no_active_account"
+                )
+        else:
+            self.check_user(refresh)
+
+        data = {"access": str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
+
+    def check_user(self, refresh):
+        """
+        Проверяет по базе, что пользователь токена существует и активен.
+        """
+        user = User.objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}
+        ).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+
+
+class UserPublicSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор публичного профиля пользователя.
+    Используется, когда профиль просматривает не его владелец: без фамилии,
+    даты последнего входа и истории платежей.
+    """
+
+    class Meta:
+        model = User
+        fields = (
+            "id",
+            "email",
+            "phone",
+            "city",
+            "avatar",
+            "first_name",
+        )
+        read_only_fields = fields
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели User, включающий историю платежей.
@@ -84,21 +294,16 @@ class UserSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         """
-        Условно скрывает конфиденциальные поля, если запрашивающий пользователь не является владельцем профиля.
+        Для чужого профиля возвращает только публичные поля (UserPublicSerializer),
+        не обращаясь к платежам пользователя.
         """
-        ret = super().to_representation(instance)
         request = self.context.get("request")
 
-        # Если запрос существует и пользователь аутентифицирован
-        if request and request.user.is_authenticated:
-            # Если запрашивающий пользователь НЕ является владельцем просматриваемого профиля
-            if request.user != instance:
-                # Удаляем конфиденциальные поля
-                ret.pop("last_name", None)
-                ret.pop("payments", None)
-                ret.pop("last_login", None)
-                # Поле 'password' уже write_only, поэтому оно не будет отображаться при GET-запросах.
-        return ret
+        # Если запрашивающий пользователь аутентифицирован и НЕ является владельцем профиля
+        if request and request.user.is_authenticated and request.user != instance:
+            return UserPublicSerializer(instance, context=self.context).data
+        # Поле 'password' уже write_only, поэтому оно не будет отображаться при GET-запросах.
+        return super().to_representation(instance)
 
     def create(self, validated_data):
         password = validated_data.pop("password", None)
@@ -1,15 +1,24 @@
+import datetime
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import stripe
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 from materials.models import Course, Lesson
-from users.models import Payment
+from skillshare_platform.instrumentation import record_time
+from users.models import Entitlement, Payment, RevenueRollup
 
 # Устанавливаем секретный ключ Stripe из переменных окружения
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 
+logger = logging.getLogger(__name__)
+
 
 def create_stripe_product(name: str):
     """
@@ -29,19 +38,21 @@ def create_stripe_product(name: str):
         # в некоторых версиях API или конфигурациях.
         # Для больших объемов данных рекомендуется хранить Stripe ID продукта в вашей базе.
 
-        all_products = stripe.Product.list(
-            active=True, limit=100
-        )  # Увеличьте limit, если у вас много продуктов
+        with record_time("stripe"):
+            all_products = stripe.Product.list(
+                active=True, limit=100
+            )  # Увеличьте limit, если у вас много продуктов
         for product in all_products.data:
             if product.name == name:
                 print(f"Продукт '{name}' уже существует, используем его.")
                 return product
 
         # Если продукт не найден, создать новый
-        product = stripe.Product.create(
-            name=name,
-            active=True,  # Убедитесь, что продукт активен
-        )
+        with record_time("stripe"):
+            product = stripe.Product.create(
+                name=name,
+                active=True,  # Убедитесь, что продукт активен
+            )
         return product
     except stripe.error.StripeError as e:
         print(f"Ошибка при создании/получении продукта Stripe: {e}")
@@ -67,13 +78,14 @@ def create_stripe_price(amount: int, stripe_product_id: str, lookup_key: str):
     try:
         # Попытаться найти существующую цену по lookup_key и product_id
         # Это гарантирует, что мы найдем точную цену, если она уже существует.
-        existing_prices = stripe.Price.list(
-            lookup_keys=[lookup_key],
-            product=stripe_product_id,
-            unit_amount=amount,  # Добавлено для точного соответствия суммы
-            currency="rub",  # Добавлено для точного соответствия валюты
-            active=True,  # Учитывать только активные цены
-        )
+        with record_time("stripe"):
+            existing_prices = stripe.Price.list(
+                lookup_keys=[lookup_key],
+                product=stripe_product_id,
+                unit_amount=amount,  # Добавлено для точного соответствия суммы
+                currency="rub",  # Добавлено для точного соответствия валюты
+                active=True,  # Учитывать только активные цены
+            )
         if existing_prices.data:
             print(
                 f"Цена с lookup_key '{lookup_key}', суммой {amount / 100.0:.2f} и продуктом '{stripe_product_id}' уже существует, используем её."
@@ -81,13 +93,14 @@ def create_stripe_price(amount: int, stripe_product_id: str, lookup_key: str):
             return existing_prices.data[0]  # Вернуть первую найденную цену
 
         # Если цена не найдена, создать новую
-        price = stripe.Price.create(
-            currency="rub",  # Валюта - рубли. Можно изменить на "usd" или другую.
-            unit_amount=amount,  # Сумма в копейках (умножаем на 100)
-            product=stripe_product_id,  # Используем ID существующего продукта
-            lookup_key=lookup_key,  # Используем динамический lookup_key
-            active=True,
-        )
+        with record_time("stripe"):
+            price = stripe.Price.create(
+                currency="rub",  # Валюта - рубли. Можно изменить на "usd" или другую.
+                unit_amount=amount,  # Сумма в копейках (умножаем на 100)
+                product=stripe_product_id,  # Используем ID существующего продукта
+                lookup_key=lookup_key,  # Используем динамический lookup_key
+                active=True,
+            )
         return price
     except stripe.error.StripeError as e:
         print(f"Ошибка при создании цены Stripe: {e}")
@@ -108,19 +121,20 @@ def create_stripe_checkout_session(price_id: str, payment_id: int):
             stripe.error.StripeError: Если произошла ошибка при взаимодействии со Stripe API.
     """
     try:
-        checkout_session = stripe.checkout.Session.create(
-            line_items=[
-                {
-                    "price": price_id,
-                    "quantity": 1,
-                },
-            ],
-            mode="payment",
-            success_url=settings.BASE_URL
-            + "/success?session_id={CHECKOUT_SESSION_ID}",  # URL для успешной оплаты
-            cancel_url=settings.BASE_URL + "/cancel",  # URL для отмены оплаты
-            metadata={"payment_id": payment_id},  # Сохраняем ID нашего платежа
-        )
+        with record_time("stripe"):
+            checkout_session = stripe.checkout.Session.create(
+                line_items=[
+                    {
+                        "price": price_id,
+                        "quantity": 1,
+                    },
+                ],
+                mode="payment",
+                success_url=settings.BASE_URL
+                + "/success?session_id={CHECKOUT_SESSION_ID}",  # URL для успешной оплаты
+                cancel_url=settings.BASE_URL + "/cancel",  # URL для отмены оплаты
+                metadata={"payment_id": payment_id},  # Сохраняем ID нашего платежа
+            )
         return checkout_session
     except stripe.error.StripeError as e:
         print(f"Ошибка при создании сессии Stripe Checkout: {e}")
@@ -141,14 +155,125 @@ def retrieve_stripe_session(session_id: str):
                               (например, сессия не найдена или неверный ID).
     """
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        with record_time("stripe"):
+            session = stripe.checkout.Session.retrieve(session_id)
         return session
     except stripe.error.StripeError as e:
         print(f"Ошибка при получении сессии Stripe: {e}")
         raise
 
 
-def process_payment_and_create_stripe_session(user, paid_course_id, paid_lesson_id):
+async def aretrieve_stripe_session(session_id: str):
+    """
+    Асинхронный вариант retrieve_stripe_session для асинхронных представлений.
+    Запрос к Stripe выполняется асинхронным HTTP-клиентом (httpx) и не занимает поток.
+        Аргументы:
+            session_id (str): ID сессии Stripe.
+        Возвращает:
+            stripe.checkout.Session: Объект сессии Stripe Checkout.
+        Исключения:
+            stripe.error.StripeError: Если произошла ошибка при взаимодействии со Stripe API.
+    """
+    try:
+        with record_time("stripe"):
+            return await stripe.checkout.Session.retrieve_async(session_id)
+    except stripe.error.StripeError as e:
+        print(f"Ошибка при получении сессии Stripe: {e}")
+        raise
+
+
+def get_payable_item(paid_course_id, paid_lesson_id):
+    """
+    Определяет оплачиваемый материал (курс или урок) и его стоимость.
+        Аргументы:
+            paid_course_id (int): ID курса (может быть None).
+            paid_lesson_id (int): ID урока (может быть None).
+        Возвращает:
+            dict: Словарь с данными материала (title, type, amount, price_lookup_key).
+        Исключения:
+            Http404: Если курс или урок не найден.
+    """
+    if paid_course_id:
+        # Получаем курс. get_object_or_404 удобно для обработки несуществующих объектов
+        course = get_object_or_404(Course, pk=paid_course_id)
+        amount_to_pay = course.actual_price  # Используем актуальную цену курса
+        return {
+            "title": course.title,
+            "type": "курс",
+            "amount": amount_to_pay,
+            # Генерируем уникальный lookup_key для цены в Stripe
+            "price_lookup_key": f"course_{paid_course_id}_price_{int(amount_to_pay * 100)}",
+        }
+
+    # Получаем урок
+    lesson = get_object_or_404(Lesson, pk=paid_lesson_id)
+    amount_to_pay = lesson.price  # Используем цену урока
+    return {
+        "title": lesson.title,
+        "type": "урок",
+        "amount": amount_to_pay,
+        # Генерируем уникальный lookup_key для цены в Stripe
+        "price_lookup_key": f"lesson_{paid_lesson_id}_price_{int(amount_to_pay * 100)}",
+    }
+
+
+def create_checkout_session_for_payment(payment):
+    """
+    Создаёт продукт, цену и сессию Stripe Checkout для уже созданного платежа
+    со статусом pending и сохраняет в нём stripe_id и payment_url.
+    Используется как при синхронной оплате, так и фоновой задачей Celery.
+        Аргументы:
+            payment (Payment): Платёж со статусом pending.
+        Возвращает:
+            dict: Словарь с информацией о платеже (payment_id, payment_url, amount, status, message).
+        Исключения:
+            ValueError: Если произошла ошибка Stripe (платёж при этом помечается как failed).
+    """
+    if payment.paid_course_id:
+        item_title = payment.paid_course.title
+        price_lookup_key = (
+            f"course_{payment.paid_course_id}_price_{int(payment.amount * 100)}"
+        )
+    else:
+        item_title = payment.paid_lesson.title
+        price_lookup_key = (
+            f"lesson_{payment.paid_lesson_id}_price_{int(payment.amount * 100)}"
+        )
+
+    try:
+        # Создаем продукт в Stripe
+        stripe_product = create_stripe_product(item_title)
+
+        # Создаем или получаем цену в Stripe (сумма в копейках)
+        stripe_price = create_stripe_price(
+            int(payment.amount * 100), stripe_product.id, price_lookup_key
+        )
+
+        # Создаем сессию оплаты Stripe
+        checkout_session = create_stripe_checkout_session(stripe_price.id, payment.id)
+
+        # Обновляем запись платежа в вашей системе
+        payment.stripe_id = checkout_session.id
+        payment.payment_url = checkout_session.url
+        payment.save(update_fields=["stripe_id", "payment_url"])
+
+        return {
+            "payment_id": payment.id,
+            "payment_url": checkout_session.url,
+            "amount": payment.amount,
+            "status": payment.status,
+            "message": "Сессия оплаты успешно создана.",
+        }
+    except stripe.error.StripeError as e:
+        # Если произошла ошибка Stripe, устанавливаем статус платежа как "failed"
+        payment.status = "failed"
+        payment.save(update_fields=["status"])
+        raise ValueError(f"Ошибка Stripe при создании платежа: {e}")
+
+
+def process_payment_and_create_stripe_session(
+    user, paid_course_id, paid_lesson_id, defer_checkout=False
+):
     """
     Обрабатывает запрос на оплату, создает запись Payment в локальной системе
     и генерирует сессию Stripe для платных материалов.
@@ -158,6 +283,9 @@ def process_payment_and_create_stripe_session(user, paid_course_id, paid_lesson_
             user (User): Пользователь, совершающий оплату.
             paid_course_id (int): ID курса для оплаты (может быть None).
             paid_lesson_id (int): ID урока для оплаты (может быть None).
+            defer_checkout (bool): Если True, для платного материала создаётся только платёж
+                                   со статусом pending, а сессия Stripe не создаётся
+                                   (её создаёт фоновая задача). В ответе будет checkout_deferred=True.
         Возвращает:
             dict: Словарь с информацией о платеже и ссылкой на оплату (payment_id, payment_url, amount, status, message).
         Исключения:
@@ -170,36 +298,19 @@ def process_payment_and_create_stripe_session(user, paid_course_id, paid_lesson_
     if not paid_course_id and not paid_lesson_id:
         raise ValueError("Платеж должен быть связан либо с курсом, либо с уроком.")
 
-    item_title = ""
-    amount_to_pay = 0
-    item_type = ""
-    price_lookup_key = ""
-
     # Определение типа и стоимости оплачиваемого материала
-    if paid_course_id:
-        # Получаем курс. get_object_or_404 удобно для обработки несуществующих объектов
-        course = get_object_or_404(Course, pk=paid_course_id)
-        item_title = course.title
-        item_type = "курс"
-        amount_to_pay = course.actual_price  # Используем актуальную цену курса
-        # Генерируем уникальный lookup_key для цены в Stripe
-        price_lookup_key = f"course_{paid_course_id}_price_{int(amount_to_pay * 100)}"
-    elif paid_lesson_id:
-        # Получаем урок
-        lesson = get_object_or_404(Lesson, pk=paid_lesson_id)
-        item_title = lesson.title
-        item_type = "урок"
-        amount_to_pay = lesson.price  # Используем цену урока
-        # Генерируем уникальный lookup_key для цены в Stripe
-        price_lookup_key = f"lesson_{paid_lesson_id}_price_{int(amount_to_pay * 100)}"
+    item = get_payable_item(paid_course_id, paid_lesson_id)
+    item_title = item["title"]
+    item_type = item["type"]
+    amount_to_pay = item["amount"]
 
-    # Проверка на существующие успешные платежи за данный материал
-    existing_succeeded_payment = Payment.objects.filter(
-        user=user,
-        status="succeeded",
-        paid_course_id=paid_course_id,
-        paid_lesson_id=paid_lesson_id,
-    ).first()
+    # Проверка на существующий доступ к материалу (поиск по уникальному ключу Entitlement)
+    entitlement = (
+        Entitlement.objects.select_related("payment")
+        .filter(user=user, course_id=paid_course_id, lesson_id=paid_lesson_id)
+        .first()
+    )
+    existing_succeeded_payment = entitlement.payment if entitlement else None
 
     # Логика обработки бесплатных материалов и уже оплаченных
     if existing_succeeded_payment:
@@ -230,14 +341,17 @@ def process_payment_and_create_stripe_session(user, paid_course_id, paid_lesson_
     # Если existing_succeeded_payment отсутствует, или если он был 'free' для теперь платного материала:
     if amount_to_pay <= 0:
         # Создаём запись платежа как бесплатное "приобретение"
-        payment = Payment.objects.create(
-            user=user,
-            paid_course_id=paid_course_id,
-            paid_lesson_id=paid_lesson_id,
-            amount=amount_to_pay,
-            payment_method="free",
-            status="succeeded",  # Сразу успешный статус
-        )
+        with transaction.atomic():
+            payment = Payment.objects.create(
+                user=user,
+                paid_course_id=paid_course_id,
+                paid_lesson_id=paid_lesson_id,
+                amount=amount_to_pay,
+                payment_method="free",
+                status="succeeded",  # Сразу успешный статус
+            )
+            grant_entitlement(payment)
+            record_revenue(payment)
         return {
             "payment_id": payment.id,
             "payment_url": None,  # Нет URL для оплаты
@@ -257,32 +371,269 @@ def process_payment_and_create_stripe_session(user, paid_course_id, paid_lesson_
         status="pending",
     )
 
+    if defer_checkout:
+        # Сессию Stripe создаст фоновая задача, клиент узнает ссылку через эндпоинт статуса
+        return {
+            "payment_id": payment.id,
+            "payment_url": None,
+            "amount": payment.amount,
+            "status": payment.status,
+            "message": "Платёж создан, ссылка на оплату формируется.",
+            "checkout_deferred": True,
+        }
+
+    return create_checkout_session_for_payment(payment)
+
+
+def grant_entitlement(payment):
+    """
+    Создаёт или обновляет право доступа пользователя к материалу, оплаченному платежом.
+    Если доступ уже был (например, получен бесплатно), он привязывается к новому платежу.
+        Аргументы:
+            payment (Payment): Успешный платёж за курс или урок.
+        Возвращает:
+            Entitlement: Созданная или обновлённая запись доступа.
+    """
+    entitlement, _ = Entitlement.objects.update_or_create(
+        user_id=payment.user_id,
+        course_id=payment.paid_course_id,
+        lesson_id=payment.paid_lesson_id,
+        defaults={
+            "payment": payment,
+            "payment_method": payment.payment_method,
+            "granted_at": timezone.now(),
+        },
+    )
+    return entitlement
+
+
+def mark_payment_succeeded(payment):
+    """
+    Переводит платёж в статус succeeded и выдаёт пользователю доступ к материалу.
+    Обновление условное (только если платёж ещё не succeeded), поэтому повторные
+    или одновременные колбэки Stripe не выдают доступ дважды.
+        Аргументы:
+            payment (Payment): Платёж, оплату которого подтвердил Stripe.
+        Возвращает:
+            bool: True, если статус платежа был изменён этим вызовом.
+    """
+    with transaction.atomic():
+        updated = (
+            Payment.objects.filter(pk=payment.pk)
+            .exclude(status="succeeded")
+            .update(status="succeeded", stripe_id=None, payment_url=None)
+        )
+        if not updated:
+            return False
+
+        payment.status = "succeeded"
+        # Очищаем stripe_id и payment_url, так как платеж завершен
+        payment.stripe_id = None
+        payment.payment_url = None
+        grant_entitlement(payment)
+        record_revenue(payment)
+    return True
+
+
+def record_revenue(payment):
+    """
+    Добавляет успешный платёж в агрегат выручки (RevenueRollup) за день оплаты.
+    Строка агрегата увеличивается атомарным UPDATE ... SET count = count + 1,
+    а если её ещё нет - создаётся; при гонке двух первых платежей за день
+    проигравший повторяет UPDATE.
+        Аргументы:
+            payment (Payment): Платёж, только что перешедший в статус succeeded.
+    """
+    key = {
+        "day": timezone.localdate(payment.payment_date),
+        "course_id": payment.paid_course_id,
+        "lesson_id": payment.paid_lesson_id,
+        "payment_method": payment.payment_method,
+    }
+    increment = {
+        "payments_count": F("payments_count") + 1,
+        "amount_total": F("amount_total") + payment.amount,
+    }
+
+    if RevenueRollup.objects.filter(**key).update(**increment):
+        return
     try:
-        # Создаем продукт в Stripe
-        stripe_product = create_stripe_product(item_title)
+        with transaction.atomic():
+            RevenueRollup.objects.create(
+                **key, payments_count=1, amount_total=payment.amount
+            )
+    except IntegrityError:
+        # Строку успел создать параллельный запрос - увеличиваем её
+        RevenueRollup.objects.filter(**key).update(**increment)
 
-        # Создаем или получаем цену в Stripe (сумма в копейках)
-        stripe_price = create_stripe_price(
-            int(amount_to_pay * 100), stripe_product.id, price_lookup_key
+
+def fetch_checkout_session_state(stripe_id):
+    """
+    Запрашивает у Stripe состояние сессии Checkout для сверки зависшего платежа.
+        Аргументы:
+            stripe_id (str | None): ID сессии Stripe.
+        Возвращает:
+            str | None: "paid" - сессия оплачена, "expired" - сессия истекла или не существует,
+                        "open" - оплата ещё возможна, None - Stripe временно недоступен.
+    """
+    if not stripe_id:
+        return "expired"
+    try:
+        session = retrieve_stripe_session(stripe_id)
+    except stripe.error.InvalidRequestError:
+        # Сессия не найдена - оплатить по ней уже нельзя
+        return "expired"
+    except stripe.error.StripeError:
+        return None
+
+    if session.payment_status in ("paid", "no_payment_required"):
+        return "paid"
+    if session.status == "expired":
+        return "expired"
+    return "open"
+
+
+def reconcile_pending_payments(older_than=None, batch_size=None, concurrency=None):
+    """
+    Сверяет со Stripe платежи, которые дольше порога остаются в статусе pending.
+    Платежи проходятся пачками по возрастанию ID (без OFFSET), сессии каждой пачки
+    запрашиваются параллельно, но не более чем concurrency запросов одновременно.
+    Оплаченные платежи проводятся через mark_payment_succeeded, истекшие помечаются
+    как failed, а их payment_url и stripe_id очищаются одним bulk_update на пачку.
+    Платежи с ещё открытой сессией и те, по которым Stripe не ответил, остаются pending
+    до следующего запуска.
+        Аргументы:
+            older_than (datetime.timedelta): Возраст платежа, после которого он считается зависшим.
+            batch_size (int): Количество платежей в пачке.
+            concurrency (int): Максимальное число одновременных запросов к Stripe.
+        Возвращает:
+            dict: Количество платежей по результату сверки (succeeded, failed, pending).
+    """
+    if older_than is None:
+        older_than = datetime.timedelta(hours=settings.PAYMENT_STALE_AFTER_HOURS)
+    batch_size = batch_size or settings.PAYMENT_RECONCILE_BATCH_SIZE
+    concurrency = concurrency or settings.PAYMENT_RECONCILE_CONCURRENCY
+
+    stale_payments = Payment.objects.filter(
+        status="pending", payment_date__lt=timezone.now() - older_than
+    ).order_by("id")
+    result = {"succeeded": 0, "failed": 0, "pending": 0}
+
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            batch = list(stale_payments.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            states = executor.map(
+                fetch_checkout_session_state, [p.stripe_id for p in batch]
+            )
+            expired_ids = []
+            for payment, state in zip(batch, states):
+                if state == "paid":
+                    if mark_payment_succeeded(payment):
+                        result["succeeded"] += 1
+                elif state == "expired":
+                    expired_ids.append(payment.id)
+                else:
+                    result["pending"] += 1
+
+            if expired_ids:
+                with transaction.atomic():
+                    # Перечитываем под блокировкой: платёж мог быть оплачен, пока шла сверка
+                    expired = list(
+                        Payment.objects.select_for_update().filter(
+                            id__in=expired_ids, status="pending"
+                        )
+                    )
+                    for payment in expired:
+                        payment.status = "failed"
+                        payment.stripe_id = None
+                        payment.payment_url = None
+                    Payment.objects.bulk_update(
+                        expired, ["status", "stripe_id", "payment_url"]
+                    )
+                result["failed"] += len(expired)
+
+    logger.info(f"Сверка зависших платежей завершена: {result}")
+    return result
+
+
+def has_entitlement(user, course_id=None, lesson_id=None):
+    """
+    Проверяет, есть ли у пользователя доступ к курсу или уроку.
+    Доступ к уроку есть также у владельцев доступа к курсу этого урока.
+    """
+    if course_id:
+        return Entitlement.objects.filter(
+            user_id=user.pk, course_id=course_id, lesson__isnull=True
+        ).exists()
+    return bool(get_owned_material_ids(user, lesson_ids=[lesson_id])["lessons"])
+
+
+def get_accessible_lessons(user):
+    """
+    Уроки, доступные пользователю: как в деталях урока, модераторы и администраторы
+    видят все, остальные - свои, а также купленные отдельно или в составе курса.
+    Проверка доступа к уроку по этому QuerySet - один запрос.
+    """
+    lessons = Lesson.objects.all()
+    if user.is_superuser or user.is_moderator:
+        return lessons
+    return lessons.filter(
+        Q(lesson_user_id=user.pk)
+        | Exists(Entitlement.objects.filter(user_id=user.pk, lesson_id=OuterRef("pk")))
+        | Exists(
+            Entitlement.objects.filter(
+                user_id=user.pk, course_id=OuterRef("course_id"), lesson__isnull=True
+            )
         )
+    )
 
-        # Создаем сессию оплаты Stripe
-        checkout_session = create_stripe_checkout_session(stripe_price.id, payment.id)
 
-        # Обновляем запись платежа в вашей системе
-        payment.stripe_id = checkout_session.id
-        payment.payment_url = checkout_session.url
-        payment.save()
+def get_owned_material_ids(user, course_ids=(), lesson_ids=()):
+    """
+    Возвращает, какие из переданных курсов и уроков принадлежат пользователю.
+    Выполняет не больше двух запросов независимо от числа переданных ID.
+        Аргументы:
+            user (User): Пользователь.
+            course_ids (Iterable[int]): ID курсов для проверки.
+            lesson_ids (Iterable[int]): ID уроков для проверки.
+        Возвращает:
+            dict: {"courses": [...], "lessons": [...]} - отсортированные ID принадлежащих материалов.
+    """
+    course_ids = set(course_ids)
+    lesson_ids = set(lesson_ids)
 
-        return {
-            "payment_id": payment.id,
-            "payment_url": checkout_session.url,
-            "amount": payment.amount,
-            "status": payment.status,
-            "message": "Сессия оплаты успешно создана.",
-        }
-    except stripe.error.StripeError as e:
-        # Если произошла ошибка Stripe, устанавливаем статус платежа как "failed"
-        payment.status = "failed"
-        payment.save()
-        raise ValueError(f"Ошибка Stripe при создании платежа: {e}")
+    # Урок принадлежит пользователю и тогда, когда куплен весь курс, в который он входит
+    lesson_courses = {}
+    if lesson_ids:
+        lesson_courses = dict(
+            Lesson.objects.filter(id__in=lesson_ids).values_list("id", "course_id")
+        )
+    candidate_course_ids = course_ids | set(lesson_courses.values())
+
+    owned_course_ids = set()
+    owned_lesson_ids = set()
+    if candidate_course_ids or lesson_ids:
+        rows = Entitlement.objects.filter(user_id=user.pk).filter(
+            Q(course_id__in=candidate_course_ids, lesson__isnull=True)
+            | Q(lesson_id__in=lesson_ids)
+        )
+        for course_id, lesson_id in rows.values_list("course_id", "lesson_id"):
+            if lesson_id:
+                owned_lesson_ids.add(lesson_id)
+            else:
+                owned_course_ids.add(course_id)
+
+    owned_lesson_ids |= {
+        lesson_id
+        for lesson_id, course_id in lesson_courses.items()
+        if course_id in owned_course_ids
+    }
+    return {
+        "courses": sorted(owned_course_ids & course_ids),
+        "lessons": sorted(owned_lesson_ids & lesson_ids),
+    }
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from users.authentication import revoke_user_tokens
+from users.models import ROLES_CACHE_KEY, User
+
+# Поля пользователя, которые попадают в claims токена
+TOKEN_CLAIM_FIELDS = {"is_active", "is_staff", "is_superuser"}
+
+
+@receiver(pre_save, sender=User)
+def revoke_tokens_on_claims_change(sender, instance, update_fields=None, **kwargs):
+    """
+    Отзывает токены пользователя, если изменились поля, записанные в claims
+    (например, при деактивации): иначе старые токены действовали бы до истечения.
+    """
+    if not settings.JWT_STATELESS_AUTH or instance.pk is None:
+        return
+    if update_fields is not None and not TOKEN_CLAIM_FIELDS & set(update_fields):
+        return
+    old = User.objects.filter(pk=instance.pk).values(*TOKEN_CLAIM_FIELDS).first()
+    if old and any(old[field] != getattr(instance, field) for field in old):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def revoke_tokens_on_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Отзывает токены пользователей, у которых изменился состав групп (claim roles),
+    и сбрасывает их роли в кэше.
+    """
+    if action in ("post_add", "post_remove"):
+        user_ids = pk_set if reverse else {instance.pk}
+    elif action == "pre_clear":
+        user_ids = (
+            set(instance.user_set.values_list("id", flat=True))
+            if reverse
+            else {instance.pk}
+        )
+    else:
+        return
+    revoke_user_tokens(*user_ids)
+    invalidate_roles(user_ids)
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+    invalidate_roles([instance.pk])
+
+
+@receiver(pre_save, sender=Group)
+def revoke_tokens_on_group_rename(sender, instance, **kwargs):
+    """Имя группы записано в claim roles: при переименовании токены участников отзываются."""
+    if instance.pk is None:
+        return
+    old_name = (
+        Group.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+    )
+    if old_name is not None and old_name != instance.name:
+        reset_group_members(instance)
+
+
+@receiver(pre_delete, sender=Group)
+def revoke_tokens_on_group_delete(sender, instance, **kwargs):
+    """
+    Удаление группы удаляет членство без m2m_changed, поэтому токены участников
+    (в том числе с ролью Moderators) отзываются здесь.
+    """
+    reset_group_members(instance)
+
+
+def reset_group_members(group):
+    user_ids = list(group.user_set.values_list("id", flat=True))
+    revoke_user_tokens(*user_ids)
+    invalidate_roles(user_ids)
+
+
+def invalidate_roles(user_ids):
+    """
+    Сбрасывает кэш ролей пользователей сразу и ещё раз после фиксации транзакции:
+    до фиксации параллельный запрос может успеть закэшировать старый состав групп.
+    """
+    keys = [ROLES_CACHE_KEY.format(user_id=user_id) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
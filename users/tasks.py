@@ -0,0 +1,83 @@
+import logging
+
+from celery import shared_task
+from redis import RedisError
+
+from skillshare_platform.db_router import read_from_replica
+from users.activity import flush_user_activity
+from users.models import Payment
+from users.services import (create_checkout_session_for_payment,
+                            reconcile_pending_payments)
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def create_checkout_session(payment_id: int):
+    """
+    Асинхронная задача для создания сессии Stripe Checkout для платежа,
+    созданного в асинхронном режиме оплаты (PAYMENT_CHECKOUT_MODE=async).
+    После выполнения у платежа появляется payment_url, который клиент
+    получает через эндпоинт статуса платежа.
+
+    Args:
+        payment_id (int): ID платежа со статусом pending.
+    """
+    payment = (
+        Payment.objects.select_related("paid_course", "paid_lesson")
+        .filter(id=payment_id)
+        .first()
+    )
+    if payment is None:
+        logger.error(f"Платёж с ID {payment_id} не найден. Сессия Stripe не создана.")
+        return
+
+    if payment.status != "pending" or payment.payment_url:
+        # Задача могла быть доставлена повторно - сессия уже создана или платёж завершён
+        logger.info(
+            f"Платёж ID {payment_id} уже обработан (статус: {payment.status}). Пропускаем."
+        )
+        return
+
+    try:
+        create_checkout_session_for_payment(payment)
+        logger.info(f"Сессия Stripe для платежа ID {payment_id} успешно создана.")
+    except ValueError as e:
+        logger.error(
+            f"Не удалось создать сессию Stripe для платежа ID {payment_id}: {e}"
+        )
+
+
+@shared_task
+def reconcile_stale_payments():
+    """
+    Фоновая задача Celery для сверки платежей, брошенных на странице оплаты.
+    Платежи pending старше PAYMENT_STALE_AFTER_HOURS сверяются с состоянием
+    сессии Stripe Checkout и переводятся в succeeded или failed.
+
+    Список зависших платежей читается с реплики: каждый платёж перед изменением
+    перечитывается с основной базы под блокировкой.
+
+    Эта задача запускается Celery Beat по расписанию,
+    определенному в настройках Django (CELERY_BEAT_SCHEDULE).
+    """
+    with read_from_replica():
+        return reconcile_pending_payments()
+
+
+@shared_task
+def flush_activity():
+    """
+    Фоновая задача Celery для переноса last_login и last_seen пользователей
+    из буфера Redis в базу пакетными UPDATE.
+
+    Эта задача запускается Celery Beat по расписанию,
+    определенному в настройках Django (CELERY_BEAT_SCHEDULE).
+    """
+    try:
+        result = flush_user_activity()
+    except RedisError as e:
+        logger.error(f"Не удалось перенести активность пользователей из Redis: {e}")
+        return
+    logger.info(f"Активность пользователей перенесена в базу: {result}")
+    return result
@@ -0,0 +1,1221 @@
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fakeredis
+import redis
+import stripe
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import connection
+from django.test import (AsyncRequestFactory, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import (APIRequestFactory, APITestCase,
+                                 force_authenticate)
+from rest_framework.views import APIView
+
+from materials.models import Course, Lesson
+from materials.tasks import deactivate_inactive_users
+from users.activity import flush_user_activity, record_seen
+from users.authentication import ClaimsUser, StatelessJWTAuthentication
+from users.models import Entitlement, Payment, RevenueRollup
+from users.services import (grant_entitlement, has_entitlement,
+                            mark_payment_succeeded)
+from users.tasks import create_checkout_session, reconcile_stale_payments
+from users.throttling import RedisTokenBucketThrottle
+from users.views import (PaymentStatusAPIView, StripeCancelView,
+                         StripeSuccessView)
+
+User = get_user_model()
+
+
+def issued_second_ago():
+    """Токены, выпущенные в блоке, получают iat на секунду раньше текущего времени."""
+    return patch(
+        "rest_framework_simplejwt.tokens.aware_utcnow",
+        return_value=timezone.now() - timedelta(seconds=1),
+    )
+
+
+def make_stripe_mocks(mock_product, mock_price, mock_session, session_id="cs_test_1"):
+    """Настраивает моки функций Stripe из users.services."""
+    mock_product.return_value = MagicMock(id="prod_test")
+    mock_price.return_value = MagicMock(id="price_test")
+    mock_session.return_value = MagicMock(
+        id=session_id, url=f"https://checkout.stripe.com/pay/{session_id}"
+    )
+
+
+class StripeCheckoutStub:
+    """
+    Локальная заглушка Stripe Checkout: хранит сессии в словаре и отвечает
+    так же, как stripe.checkout.Session.retrieve (включая ошибки API).
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.unavailable = set()
+
+    def add_session(self, session_id, status="open", payment_status="unpaid"):
+        self.sessions[session_id] = MagicMock(
+            id=session_id, status=status, payment_status=payment_status
+        )
+
+    def retrieve(self, session_id):
+        if session_id in self.unavailable:
+            raise stripe.error.APIConnectionError("Stripe недоступен")
+        if session_id not in self.sessions:
+            raise stripe.error.InvalidRequestError(
+                f"No such checkout.session: '{session_id}'", "id"
+            )
+        return self.sessions[session_id]
+
+
+@override_settings(PAYMENT_CHECKOUT_MODE="async", PAYMENT_STATUS_POLL_INTERVAL=0.01)
+class AsyncCheckoutTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="buyer@example.com", password="pass")
+        self.other_user = User.objects.create_user(
+            email="other@example.com", password="pass"
+        )
+        self.course = Course.objects.create(
+            title="Платный курс",
+            course_user=self.other_user,
+            fixed_price=Decimal("100.00"),
+        )
+        self.create_url = reverse("users:payment-create")
+
+    @patch("users.views.create_checkout_session.delay")
+    def test_async_create_returns_202_and_enqueues(self, mock_delay):
+        """В асинхронном режиме создаётся pending-платёж, а сессия ставится в очередь."""
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            self.create_url, {"paid_course": self.course.id}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        payment = Payment.objects.get(id=response.data["payment_id"])
+        self.assertEqual(payment.status, "pending")
+        self.assertIsNone(payment.payment_url)
+        mock_delay.assert_called_once_with(payment.id)
+        self.assertEqual(
+            response.data["status_url"],
+            reverse("users:payment-status", args=[payment.id]),
+        )
+
+    @patch("users.services.create_stripe_checkout_session")
+    @patch("users.services.create_stripe_price")
+    @patch("users.services.create_stripe_product")
+    @patch("users.views.create_checkout_session.delay")
+    def test_async_create_falls_back_to_sync_when_broker_unavailable(
+        self, mock_delay, mock_product, mock_price, mock_session
+    ):
+        """Если брокер недоступен, сессия создаётся синхронно в том же запросе."""
+        mock_delay.side_effect = ConnectionError("broker is down")
+        make_stripe_mocks(mock_product, mock_price, mock_session)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            self.create_url, {"paid_course": self.course.id}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["payment_url"], "https://checkout.stripe.com/pay/cs_test_1"
+        )
+
+    @patch("users.services.create_stripe_checkout_session")
+    @patch("users.services.create_stripe_price")
+    @patch("users.services.create_stripe_product")
+    def test_task_creates_session_and_status_becomes_ready(
+        self, mock_product, mock_price, mock_session
+    ):
+        """После выполнения задачи эндпоинт статуса возвращает payment_url."""
+        make_stripe_mocks(mock_product, mock_price, mock_session)
+        payment = Payment.objects.create(
+            user=self.user,
+            paid_course=self.course,
+            amount=Decimal("100.00"),
+            payment_method="stripe",
+        )
+        status_url = reverse("users:payment-status", args=[payment.id])
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data["ready"])
+
+        # Синхронный эндпоинт не ждёт готовности ссылки и не держит worker
+        with patch("asyncio.sleep") as sleep, patch("time.sleep") as time_sleep:
+            response = self.client.get(status_url, {"wait": 20})
+        self.assertFalse(response.data["ready"])
+        sleep.assert_not_called()
+        time_sleep.assert_not_called()
+
+        create_checkout_session(payment.id)
+
+        response = self.client.get(status_url, {"wait": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["ready"])
+        self.assertEqual(
+            response.data["payment_url"], "https://checkout.stripe.com/pay/cs_test_1"
+        )
+
+        # Повторная доставка задачи не создаёт новую сессию
+        create_checkout_session(payment.id)
+        self.assertEqual(mock_session.call_count, 1)
+
+    def test_status_of_foreign_payment_not_found(self):
+        """Пользователь не может узнать статус чужого платежа."""
+        payment = Payment.objects.create(
+            user=self.other_user,
+            paid_course=self.course,
+            amount=Decimal("100.00"),
+            payment_method="stripe",
+        )
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse("users:payment-status", args=[payment.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class EntitlementTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="owner@example.com", password="pass")
+        self.author = User.objects.create_user(
+            email="author@example.com", password="pass"
+        )
+        self.paid_course = Course.objects.create(
+            title="Платный курс", course_user=self.author, fixed_price=Decimal("100.00")
+        )
+        self.free_course = Course.objects.create(
+            title="Бесплатный курс", course_user=self.author
+        )
+        self.lesson = Lesson.objects.create(
+            course=self.paid_course, title="Урок платного курса", price=Decimal("10.00")
+        )
+        self.owned_url = reverse("users:owned-materials")
+
+    def test_free_acquisition_grants_entitlement(self):
+        """Бесплатное приобретение сразу создаёт доступ."""
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse("users:payment-create"),
+            {"paid_course": self.free_course.id},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(has_entitlement(self.user, course_id=self.free_course.id))
+
+    @patch("users.views.retrieve_stripe_session")
+    def test_successful_payment_grants_entitlement_once(self, mock_retrieve):
+        """Колбэк успешной оплаты выдаёт доступ, повторный колбэк ничего не меняет."""
+        payment = Payment.objects.create(
+            user=self.user,
+            paid_course=self.paid_course,
+            amount=Decimal("100.00"),
+            payment_method="stripe",
+            stripe_id="cs_test_1",
+        )
+        mock_retrieve.return_value = MagicMock(
+            payment_status="paid", metadata={"payment_id": str(payment.id)}
+        )
+
+        response = self.client.get(
+            reverse("stripe-success"), {"session_id": "cs_test_1"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["message"], "Платёж прошёл успешно!")
+        entitlement = Entitlement.objects.get(user=self.user)
+        self.assertEqual(entitlement.payment_id, payment.id)
+
+        response = self.client.get(
+            reverse("stripe-success"), {"session_id": "cs_test_1"}
+        )
+        self.assertEqual(response.data["message"], "Платеж уже успешно обработан.")
+        self.assertEqual(Entitlement.objects.filter(user=self.user).count(), 1)
+
+    def test_already_purchased_is_answered_from_entitlement(self):
+        """Повторная покупка оплаченного курса не создаёт новый платёж."""
+        payment = Payment.objects.create(
+            user=self.user,
+            paid_course=self.paid_course,
+            amount=Decimal("100.00"),
+            payment_method="stripe",
+            status="succeeded",
+        )
+        grant_entitlement(payment)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse("users:payment-create"),
+            {"paid_course": self.paid_course.id},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["payment_id"], payment.id)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_owned_materials_bulk_check(self):
+        """Доступ к курсу даёт доступ к его урокам, чужие материалы не возвращаются."""
+        grant_entitlement(
+            Payment.objects.create(
+                user=self.user,
+                paid_course=self.paid_course,
+                amount=Decimal("100.00"),
+                payment_method="stripe",
+                status="succeeded",
+            )
+        )
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                self.owned_url,
+                {
+                    "courses": f"{self.paid_course.id},{self.free_course.id}",
+                    "lessons": f"{self.lesson.id}",
+                },
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["courses"], [self.paid_course.id])
+        self.assertEqual(response.data["lessons"], [self.lesson.id])
+
+    def test_owned_materials_invalid_ids(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.owned_url, {"courses": "1,abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_entitlements_from_payments(self):
+        """Команда перестроения берёт последний успешный платёж по каждому материалу."""
+        Payment.objects.create(
+            user=self.user,
+            paid_course=self.paid_course,
+            amount=Decimal("0.00"),
+            payment_method="free",
+            status="succeeded",
+        )
+        latest = Payment.objects.create(
+            user=self.user,
+            paid_course=self.paid_course,
+            amount=Decimal("100.00"),
+            payment_method="stripe",
+            status="succeeded",
+        )
+        Payment.objects.create(
+            user=self.user,
+            paid_lesson=self.lesson,
+            amount=Decimal("10.00"),
+            payment_method="stripe",
+            status="failed",
+        )
+
+        call_command("rebuild_entitlements", batch_size=1, stdout=StringIO())
+
+        entitlement = Entitlement.objects.get()
+        self.assertEqual(entitlement.payment_id, latest.id)
+        self.assertEqual(entitlement.payment_method, "stripe")
+
+    def test_migration_backfills_entitlements_for_past_payments(self):
+        """Миграция строит доступы по платежам, сделанным до появления таблицы."""
+        payment = Payment.objects.create(
+            user=self.user,
+            paid_course=self.paid_course,
+            amount=Decimal("100.00"),
+            payment_method="stripe",
+            status="succeeded",
+        )
+        migration = import_module("users.migrations.0009_backfill_entitlements")
+        migration.backfill_entitlements(apps, None)
+
+        self.assertEqual(Entitlement.objects.get().payment_id, payment.id)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse("users:payment-create"),
+            {"paid_course": self.paid_course.id},
+            format="json",
+        )
+        self.assertEqual(response.data["payment_id"], payment.id)
+        self.assertEqual(Payment.objects.count(), 1)
+
+
+class PaymentListTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="payer@example.com", password="pass")
+        self.other_user = User.objects.create_user(
+            email="other_payer@example.com", password="pass"
+        )
+        mod_group, _ = Group.objects.get_or_create(name="Moderators")
+        self.moderator = User.objects.create_user(
+            email="mod@example.com", password="pass"
+        )
+        self.moderator.groups.add(mod_group)
+        self.course = Course.objects.create(title="Курс", course_user=self.other_user)
+        for payer in (self.user, self.user, self.other_user):
+            Payment.objects.create(
+                user=payer,
+                paid_course=self.course,
+                amount=Decimal("50.00"),
+                payment_method="cash",
+                status="succeeded",
+            )
+        self.list_url = reverse("users:payment-list")
+
+    def test_user_sees_only_own_payments(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertTrue(
+            all(row["user"] == self.user.id for row in response.data["results"])
+        )
+
+    def test_moderator_sees_all_payments_with_cursor_pagination(self):
+        self.client.force_authenticate(self.moderator)
+        response = self.client.get(self.list_url, {"page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIn("cursor=", response.data["next"])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+    def test_cursor_pages_payments_with_equal_dates(self):
+        """Платежи с одинаковой датой не пропускаются и не повторяются между страницами."""
+        for _ in range(4):
+            Payment.objects.create(
+                user=self.user,
+                paid_course=self.course,
+                amount=Decimal("50.00"),
+                payment_method="cash",
+            )
+        Payment.objects.update(payment_date=timezone.now())
+        self.client.force_authenticate(self.moderator)
+        for ordering in (None, "payment_date"):
+            with self.subTest(ordering=ordering):
+                params = {
+                    "page_size": 2,
+                    **({"ordering": ordering} if ordering else {}),
+                }
+                response = self.client.get(self.list_url, params)
+                ids = []
+                while True:
+                    ids += [row["id"] for row in response.data["results"]]
+                    if not response.data["next"]:
+                        break
+                    response = self.client.get(response.data["next"])
+                expected = Payment.objects.order_by("id").values_list("id", flat=True)
+                self.assertEqual(
+                    ids, list(expected if ordering else reversed(expected))
+                )
+
+    def test_csv_export_is_streamed(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.list_url, {"format": "csv"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith("id,payment_date,user_id,user_email"))
+        self.assertEqual(len(lines), 3)  # заголовок + 2 платежа пользователя
+        self.assertIn("payer@example.com", lines[1])
+
+
+class RevenueRollupTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="client@example.com", password="pass"
+        )
+        mod_group, _ = Group.objects.get_or_create(name="Moderators")
+        self.moderator = User.objects.create_user(
+            email="revenue_mod@example.com", password="pass"
+        )
+        self.moderator.groups.add(mod_group)
+        self.course = Course.objects.create(
+            title="Курс", course_user=self.moderator, fixed_price=Decimal("100.00")
+        )
+        self.lesson = Lesson.objects.create(
+            course=self.course, title="Урок", price=Decimal("10.00")
+        )
+        self.report_url = reverse("users:revenue-report")
+
+    def create_payment(self, **kwargs):
+        data = {
+            "user": self.user,
+            "paid_course": self.course,
+            "amount": Decimal("100.00"),
+            "payment_method": "stripe",
+        }
+        data.update(kwargs)
+        return Payment.objects.create(**data)
+
+    def test_successful_payment_increments_rollup_once(self):
+        first = self.create_payment()
+        second = self.create_payment()
+        self.assertTrue(mark_payment_succeeded(first))
+        self.assertTrue(mark_payment_succeeded(second))
+        # Повторная обработка того же платежа не учитывается дважды
+        self.assertFalse(mark_payment_succeeded(first))
+
+        rollup = RevenueRollup.objects.get()
+        self.assertEqual(rollup.course_id, self.course.id)
+        self.assertEqual(rollup.payments_count, 2)
+        self.assertEqual(rollup.amount_total, Decimal("200.00"))
+
+    def test_backfill_matches_incremental_rollups(self):
+        for kwargs in (
+            {},
+            {"payment_method": "cash"},
+            {"paid_course": None, "paid_lesson": self.lesson, "amount": Decimal("10")},
+        ):
+            mark_payment_succeeded(self.create_payment(**kwargs))
+        self.create_payment(status="failed")
+        incremental = set(
+            RevenueRollup.objects.values_list(
+                "day", "course_id", "lesson_id", "payment_method", "amount_total"
+            )
+        )
+
+        call_command("backfill_revenue_rollups", stdout=StringIO())
+
+        rebuilt = set(
+            RevenueRollup.objects.values_list(
+                "day", "course_id", "lesson_id", "payment_method", "amount_total"
+            )
+        )
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(len(rebuilt), 3)
+
+    def test_backfill_replaces_rollups_window_by_window(self):
+        """Каждое окно - своя транзакция с блокировкой; платёж, успешный во время перестройки, учтён один раз."""
+        now = timezone.now()
+        for days_ago in (3, 2):
+            payment = self.create_payment()
+            mark_payment_succeeded(payment)
+            Payment.objects.filter(pk=payment.pk).update(
+                payment_date=now - timedelta(days=days_ago)
+            )
+        RevenueRollup.objects.all().delete()
+        stale_day = timezone.localdate(now) - timedelta(days=10)
+        RevenueRollup.objects.create(
+            day=stale_day, payment_method="cash", payments_count=1, amount_total=1
+        )
+        late = self.create_payment()
+
+        class Output(StringIO):
+            def write(output, text):
+                # Платёж за более поздний день успешен, пока перестраиваются прошлые окна
+                if late.status != "succeeded":
+                    mark_payment_succeeded(late)
+                return super().write(text)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command("backfill_revenue_rollups", days_per_batch=1, stdout=Output())
+
+        if connection.vendor == "postgresql":
+            locks = [q for q in queries.captured_queries if q["sql"].startswith("LOCK")]
+            # Начальные границы, четыре окна и завершающая проверка
+            self.assertEqual(len(locks), 6)
+        self.assertFalse(RevenueRollup.objects.filter(day=stale_day))
+        self.assertEqual(
+            sorted(RevenueRollup.objects.values_list("day", "payments_count")),
+            [
+                (timezone.localdate(now - timedelta(days=3)), 1),
+                (timezone.localdate(now - timedelta(days=2)), 1),
+                (timezone.localdate(now), 1),
+            ],
+        )
+
+    def test_report_requires_moderator(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.report_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_report_grouped_by_payment_method(self):
+        mark_payment_succeeded(self.create_payment())
+        mark_payment_succeeded(self.create_payment(payment_method="cash"))
+        mark_payment_succeeded(
+            self.create_payment(paid_course=None, paid_lesson=self.lesson)
+        )
+
+        self.client.force_authenticate(self.moderator)
+        with self.assertNumQueries(3):  # проверка группы, строки, итог
+            response = self.client.get(self.report_url, {"group_by": "payment_method"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = {row["payment_method"]: row for row in response.data["results"]}
+        self.assertEqual(results["stripe"]["payments_count"], 2)
+        self.assertEqual(results["cash"]["amount_total"], "100.00")
+        self.assertEqual(response.data["total"]["amount_total"], "300.00")
+
+    def test_report_rejects_too_long_range(self):
+        self.client.force_authenticate(self.moderator)
+        response = self.client.get(
+            self.report_url, {"date_from": "2020-01-01", "date_to": "2024-01-01"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(PAYMENT_STALE_AFTER_HOURS=24)
+class StalePaymentReconciliationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="late@example.com", password="pass")
+        self.course = Course.objects.create(
+            title="Курс", course_user=self.user, fixed_price=Decimal("100.00")
+        )
+        self.stripe = StripeCheckoutStub()
+        patcher = patch(
+            "users.services.retrieve_stripe_session", side_effect=self.stripe.retrieve
+        )
+        self.mock_retrieve = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_pending(self, stripe_id, hours_ago=48):
+        payment = Payment.objects.create(
+            user=self.user,
+            paid_course=self.course,
+            amount=Decimal("100.00"),
+            payment_method="stripe",
+            stripe_id=stripe_id,
+            payment_url=f"https://checkout.stripe.com/pay/{stripe_id}",
+        )
+        Payment.objects.filter(id=payment.id).update(
+            payment_date=timezone.now() - timedelta(hours=hours_ago)
+        )
+        return payment
+
+    def test_stale_payments_are_reconciled(self):
+        self.stripe.add_session("cs_paid", status="complete", payment_status="paid")
+        self.stripe.add_session("cs_expired", status="expired")
+        self.stripe.add_session("cs_open")
+        self.stripe.add_session("cs_down")
+        self.stripe.unavailable.add("cs_down")
+        paid = self.create_pending("cs_paid")
+        expired = self.create_pending("cs_expired")
+        missing = self.create_pending("cs_missing")
+        still_open = self.create_pending("cs_open")
+        unreachable = self.create_pending("cs_down")
+        fresh = self.create_pending("cs_fresh", hours_ago=1)
+
+        result = reconcile_stale_payments()
+
+        self.assertEqual(result, {"succeeded": 1, "failed": 2, "pending": 2})
+        self.assertTrue(has_entitlement(self.user, course_id=self.course.id))
+        for payment in (expired, missing):
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, "failed")
+            self.assertIsNone(payment.stripe_id)
+            self.assertIsNone(payment.payment_url)
+        for payment in (still_open, unreachable, fresh):
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, "pending")
+            self.assertIsNotNone(payment.payment_url)
+        paid.refresh_from_db()
+        self.assertEqual(paid.status, "succeeded")
+        # Свежие платежи в Stripe не запрашиваются
+        self.assertNotIn(
+            "cs_fresh", [call.args[0] for call in self.mock_retrieve.call_args_list]
+        )
+
+    @override_settings(PAYMENT_RECONCILE_BATCH_SIZE=2, PAYMENT_RECONCILE_CONCURRENCY=2)
+    def test_reconciliation_walks_all_batches(self):
+        payments = [self.create_pending(f"cs_gone_{i}") for i in range(5)]
+        payments.append(self.create_pending(None))
+
+        result = reconcile_stale_payments()
+
+        self.assertEqual(result["failed"], 6)
+        self.assertFalse(Payment.objects.filter(status="pending").exists())
+        # Платёж без сессии Stripe закрывается без запроса к Stripe
+        self.assertEqual(self.mock_retrieve.call_count, 5)
+
+
+class UserListTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="viewer@example.com", password="pass", last_name="Иванов"
+        )
+        self.course = Course.objects.create(title="Курс", course_user=self.user)
+        self.list_url = reverse("users:user-list")
+
+    def create_users_with_payments(self, count):
+        for i in range(count):
+            other = User.objects.create_user(
+                email=f"member{User.objects.count()}@example.com", password="pass"
+            )
+            Payment.objects.create(
+                user=other,
+                paid_course=self.course,
+                amount=Decimal("10.00"),
+                payment_method="cash",
+            )
+
+    def test_list_is_paginated_with_public_rows(self):
+        Payment.objects.create(
+            user=self.user,
+            paid_course=self.course,
+            amount=Decimal("10.00"),
+            payment_method="cash",
+        )
+        self.create_users_with_payments(2)
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 3)
+        rows = {row["id"]: row for row in response.data["results"]}
+        self.assertEqual(len(rows[self.user.id]["payments"]), 1)
+        self.assertEqual(rows[self.user.id]["last_name"], "Иванов")
+        for user_id, row in rows.items():
+            if user_id != self.user.id:
+                self.assertNotIn("payments", row)
+                self.assertNotIn("last_login", row)
+
+    def test_list_query_count_does_not_grow_with_users(self):
+        self.client.force_authenticate(self.user)
+        self.create_users_with_payments(2)
+        # count, страница пользователей, платежи запрашивающего
+        with self.assertNumQueries(3):
+            self.client.get(self.list_url)
+
+        self.create_users_with_payments(8)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.list_url)
+        self.assertEqual(len(response.data["results"]), 11)
+
+
+@override_settings(JWT_STATELESS_AUTH=True)
+class StatelessJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="stateless@example.com", password="pass"
+        )
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        redis_patcher = patch("skillshare_platform.redis_client._client", self.redis)
+        redis_patcher.start()
+        self.addCleanup(redis_patcher.stop)
+        self.mod_group, _ = Group.objects.get_or_create(name="Moderators")
+        self.user.groups.add(self.mod_group)
+        # Отзыв из-за добавления в группу при подготовке теста не нужен
+        self.redis.flushall()
+        # Все представления в тесте аутентифицируются без базы
+        auth_patcher = patch.object(
+            APIView, "authentication_classes", [StatelessJWTAuthentication]
+        )
+        auth_patcher.start()
+        self.addCleanup(auth_patcher.stop)
+
+    def obtain_access_token(self, issued_earlier=True):
+        """
+        Отзыв сравнивается с iat в целых секундах, поэтому токены, которые тест затем
+        отзывает, выпускаются секундой раньше.
+        """
+        with issued_second_ago() if issued_earlier else nullcontext():
+            response = self.client.post(
+                reverse("token_obtain_pair"),
+                {"email": "stateless@example.com", "password": "pass"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["access"]
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return StatelessJWTAuthentication().authenticate(request)
+
+    def test_authentication_does_not_query_database(self):
+        token = self.obtain_access_token()
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(token)
+            self.assertIsInstance(user, ClaimsUser)
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertTrue(user.is_moderator)
+            self.assertFalse(user.is_superuser)
+            self.assertEqual(user, self.user)
+
+        # Поля, которых нет в токене, загружаются из базы один раз
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "stateless@example.com")
+            self.assertEqual(user.city, None)
+
+    def test_moderator_list_without_user_lookup(self):
+        token = self.obtain_access_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("materials:course-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            any(
+                'FROM "users_user"' in query["sql"]
+                for query in queries.captured_queries
+            )
+        )
+
+    def test_deactivated_user_tokens_are_revoked(self):
+        token = self.obtain_access_token()
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaisesMessage(AuthenticationFailed, "Токен отозван."):
+            self.authenticate(token)
+
+    def test_groups_change_revokes_tokens(self):
+        token = self.obtain_access_token()
+        self.user.groups.remove(self.mod_group)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+        # Токен, выпущенный сразу после отзыва (в ту же секунду), принимается
+        user, _ = self.authenticate(self.obtain_access_token(issued_earlier=False))
+        self.assertFalse(user.is_moderator)
+
+    def test_group_rename_and_delete_revoke_tokens(self):
+        token = self.obtain_access_token()
+        # Сохранение группы без переименования токены не отзывает
+        self.mod_group.save()
+        self.authenticate(token)
+
+        self.mod_group.name = "Старшие модераторы"
+        self.mod_group.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+        self.redis.flushall()
+        token = self.obtain_access_token()
+        # Членство удаляется вместе с группой без m2m_changed
+        self.mod_group.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_periodic_deactivation_revokes_tokens(self):
+        token = self.obtain_access_token()
+        flush_user_activity()
+        User.objects.filter(pk=self.user.pk).update(
+            last_login=timezone.now() - timedelta(days=40)
+        )
+        deactivate_inactive_users()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    @patch("skillshare_platform.redis_client._client")
+    def test_falls_back_to_database_when_redis_unavailable(self, mock_redis):
+        mock_redis.evalsha.side_effect = redis.ConnectionError("Redis недоступен")
+        token = self.obtain_access_token()
+        mock_redis.get.side_effect = redis.ConnectionError("Redis недоступен")
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate(token)
+        self.assertIsInstance(user, User)
+
+
+class UserActivityBufferTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="active@example.com", password="pass"
+        )
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        redis_patcher = patch("skillshare_platform.redis_client._client", self.redis)
+        redis_patcher.start()
+        self.addCleanup(redis_patcher.stop)
+
+    def login(self):
+        return self.client.post(
+            reverse("token_obtain_pair"),
+            {"email": "active@example.com", "password": "pass"},
+            format="json",
+        )
+
+    def test_login_is_buffered_and_flushed_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Вход не обновляет таблицу пользователей
+        self.assertFalse(
+            any(query["sql"].startswith("UPDATE") for query in queries.captured_queries)
+        )
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_login)
+
+        others = [
+            User.objects.create_user(email=f"seen{i}@example.com", password="pass")
+            for i in range(3)
+        ]
+        for other in others:
+            record_seen(other.pk)
+
+        with self.assertNumQueries(2):  # по одному bulk UPDATE на поле
+            result = flush_user_activity()
+        self.assertEqual(result, {"last_login": 1, "last_seen": 3})
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+        self.assertEqual(User.objects.filter(last_seen__isnull=False).count(), 3)
+
+        # Повторный перенос без новых событий ничего не обновляет
+        with self.assertNumQueries(0):
+            self.assertEqual(flush_user_activity(), {"last_login": 0, "last_seen": 0})
+
+    @override_settings(USER_ACTIVITY_SEEN_INTERVAL=60)
+    def test_authenticated_requests_record_last_seen_once_per_interval(self):
+        token = self.login().data["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with patch("users.activity.get_redis", return_value=self.redis) as mock:
+            self.client.get(reverse("users:payment-list"))
+            self.client.get(reverse("users:payment-list"))
+        self.assertEqual(mock.call_count, 1)
+        self.assertIsNotNone(self.redis.hget("activity:last_seen", self.user.pk))
+
+    @patch("skillshare_platform.redis_client._client")
+    def test_login_writes_directly_when_redis_unavailable(self, mock_redis):
+        mock_redis.evalsha.side_effect = redis.ConnectionError("Redis недоступен")
+        mock_redis.hset.side_effect = redis.ConnectionError("Redis недоступен")
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_deactivation_uses_flushed_activity(self):
+        month_ago = timezone.now() - timedelta(days=40)
+        User.objects.filter(pk=self.user.pk).update(last_login=month_ago)
+        idle = User.objects.create_user(email="idle@example.com", password="pass")
+        User.objects.filter(pk=idle.pk).update(last_login=month_ago)
+        # Пользователь недавно обращался к API, но ещё не перенесён в базу
+        record_seen(self.user.pk)
+
+        deactivate_inactive_users()
+
+        self.user.refresh_from_db()
+        idle.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertIsNotNone(self.user.last_seen)
+        self.assertFalse(idle.is_active)
+
+
+class RedisTokenBucketThrottleTest(APITestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        redis_patcher = patch("skillshare_platform.redis_client._client", self.redis)
+        redis_patcher.start()
+        self.addCleanup(redis_patcher.stop)
+        rates_patcher = patch.object(
+            RedisTokenBucketThrottle,
+            "THROTTLE_RATES",
+            {"auth": "3/min", "registration": "2/hour", "payments": "30/min"},
+        )
+        rates_patcher.start()
+        self.addCleanup(rates_patcher.stop)
+        self.token_url = reverse("token_obtain_pair")
+        self.credentials = {"email": "victim@example.com", "password": "wrong"}
+
+    def test_login_bucket_is_exhausted_and_reported_in_headers(self):
+        remaining = []
+        for _ in range(3):
+            response = self.client.post(self.token_url, self.credentials)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(response["RateLimit-Limit"], "3")
+            self.assertEqual(response["RateLimit-Policy"], "3;w=60")
+            remaining.append(int(response["RateLimit-Remaining"]))
+        self.assertEqual(remaining, [2, 1, 0])
+
+        response = self.client.post(self.token_url, self.credentials)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+    def test_abusive_ip_does_not_consume_other_clients_capacity(self):
+        for _ in range(4):
+            self.client.post(self.token_url, self.credentials, REMOTE_ADDR="10.0.0.66")
+
+        response = self.client.post(
+            self.token_url,
+            {"email": "other@example.com", "password": "wrong"},
+            REMOTE_ADDR="10.0.0.7",
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response["RateLimit-Remaining"], "2")
+
+    def test_login_attempts_on_one_account_are_limited_across_ips(self):
+        """Перебор паролей одной учётной записи с разных адресов упирается в её ведро."""
+        for number in range(3):
+            response = self.client.post(
+                self.token_url, self.credentials, REMOTE_ADDR=f"10.0.1.{number}"
+            )
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(
+            self.token_url,
+            {"email": "VICTIM@example.com", "password": "wrong"},
+            REMOTE_ADDR="10.0.1.99",
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_registration_scope_applies_only_to_create(self):
+        register_url = reverse("users:user-list")
+        # Лимит проверяется до валидации данных
+        invalid_data = {"password": "pass", "phone": "1" * 50}
+        for _ in range(2):
+            response = self.client.post(register_url, invalid_data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(register_url, invalid_data)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # Остальные действия с пользователями лимитом регистрации не ограничены
+        self.client.force_authenticate(
+            User.objects.create_user(email="member@example.com", password="pass")
+        )
+        response = self.client.get(register_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("RateLimit-Limit", response)
+
+    @patch("skillshare_platform.redis_client._client")
+    def test_requests_pass_when_redis_unavailable(self, mock_redis):
+        mock_redis.evalsha.side_effect = redis.ConnectionError("Redis недоступен")
+        for _ in range(5):
+            response = self.client.post(self.token_url, self.credentials)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RefreshTokenRotationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="rotate@example.com", password="pass"
+        )
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        redis_patcher = patch("skillshare_platform.redis_client._client", self.redis)
+        redis_patcher.start()
+        self.addCleanup(redis_patcher.stop)
+        self.refresh_url = reverse("token_refresh")
+        self.refresh = self.client.post(
+            reverse("token_obtain_pair"),
+            {"email": "rotate@example.com", "password": "pass"},
+            format="json",
+        ).data["refresh"]
+
+    def test_refresh_rotates_and_rejects_reuse(self):
+        response = self.client.post(self.refresh_url, {"refresh": self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rotated = response.data["refresh"]
+        self.assertNotEqual(rotated, self.refresh)
+
+        # Повтор использованного токена отклоняется
+        for _ in range(2):
+            response = self.client.post(self.refresh_url, {"refresh": self.refresh})
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post(self.refresh_url, {"refresh": rotated})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(JWT_STATELESS_AUTH=True)
+    def test_stateless_refresh_does_not_query_database(self):
+        with self.assertNumQueries(0), issued_second_ago():
+            response = self.client.post(self.refresh_url, {"refresh": self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Отзыв токенов пользователя действует и на refresh-токены
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post(
+            self.refresh_url, {"refresh": response.data["refresh"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_fails_closed_when_redis_unavailable(self):
+        with patch.object(self.redis, "set", side_effect=redis.ConnectionError):
+            response = self.client.post(self.refresh_url, {"refresh": self.refresh})
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+            with override_settings(JWT_REFRESH_FAIL_OPEN=True):
+                response = self.client.post(self.refresh_url, {"refresh": self.refresh})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_inactive_user_is_checked_in_database_mode(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post(self.refresh_url, {"refresh": self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class UsersAdminQueriesTest(APITestCase):
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(
+            email="admin@example.com", password="pass"
+        )
+        self.client.force_login(self.superuser)
+        self.moderators = Group.objects.create(name="Moderators")
+        self.course = Course.objects.create(title="Курс")
+        self.lesson = Lesson.objects.create(course=self.course, title="Урок", price=100)
+        self.users_count = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.users_count += 1
+            user = User.objects.create_user(email=f"user{self.users_count}@example.com")
+            user.groups.add(self.moderators)
+            Payment.objects.create(
+                user=user, paid_course=self.course, amount=100, payment_method="cash"
+            )
+            Payment.objects.create(
+                user=user, paid_lesson=self.lesson, amount=100, payment_method="cash"
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_changelists_do_not_depend_on_rows_count(self):
+        """Число запросов списков пользователей и платежей не растёт с числом строк."""
+        for name in ("admin:users_user_changelist", "admin:users_payment_changelist"):
+            with self.subTest(name=name):
+                self.add_rows(2)
+                queries = self.count_queries(reverse(name))
+                self.add_rows(5)
+                self.assertEqual(self.count_queries(reverse(name)), queries)
+
+    def test_user_roles_column(self):
+        """Колонка ролей строится по предзагруженным группам."""
+        self.add_rows(1)
+        response = self.client.get(reverse("admin:users_user_changelist"))
+        self.assertContains(response, "Модератор")
+        self.assertContains(response, "Администратор")
+
+    def test_payment_form_does_not_list_related_rows(self):
+        """Форма платежа не загружает всех пользователей, курсы и уроки."""
+        self.add_rows(2)
+        payment = Payment.objects.filter(paid_lesson=self.lesson).first()
+        url = reverse("admin:users_payment_change", args=[payment.pk])
+        # Первый запрос заполняет кэш ContentType
+        self.client.get(url)
+        queries = self.count_queries(url)
+        self.add_rows(5)
+        Lesson.objects.create(course=self.course, title="Урок 2", price=100)
+        self.assertEqual(self.count_queries(url), queries)
+        self.assertNotContains(self.client.get(url), "user7@example.com")
+
+    def test_payment_marked_succeeded_in_admin_grants_entitlement(self):
+        """Статус succeeded, выставленный в админке, выдаёт доступ и учитывает выручку."""
+        self.add_rows(1)
+        payment = Payment.objects.filter(paid_course=self.course).get()
+        url = reverse("admin:users_payment_change", args=[payment.pk])
+        data = {
+            "user": payment.user_id,
+            "paid_course": self.course.pk,
+            "paid_lesson": "",
+            "amount": "100.00",
+            "payment_method": "cash",
+            "stripe_id": "",
+            "payment_url": "",
+            "status": "succeeded",
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "succeeded")
+        self.assertEqual(Entitlement.objects.get().payment_id, payment.pk)
+        self.assertEqual(RevenueRollup.objects.get().payments_count, 1)
+
+        # Повторное сохранение без смены статуса не учитывает платёж второй раз
+        self.client.post(url, data)
+        self.assertEqual(RevenueRollup.objects.get().payments_count, 1)
+
+
+class BenchmarkDbConnectionsCommandTest(TransactionTestCase):
+    def test_benchmark_restores_connection_settings(self):
+        """Команда замеряет все режимы и возвращает настройки соединения."""
+        settings_dict = dict(connection.settings_dict)
+        out = StringIO()
+        call_command("benchmark_db_connections", "--requests", "5", stdout=out)
+        output = out.getvalue()
+        self.assertIn("Новое соединение", output)
+        self.assertIn("Постоянное с проверкой", output)
+        self.assertEqual(connection.settings_dict, settings_dict)
+
+
+@override_settings(ASYNC_VIEWS=True, PAYMENT_STATUS_POLL_INTERVAL=0.01)
+class AsyncPaymentViewsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="buyer@example.com", password="pass")
+        self.other_user = User.objects.create_user(
+            email="other@example.com", password="pass"
+        )
+        self.course = Course.objects.create(
+            title="Платный курс",
+            course_user=self.other_user,
+            fixed_price=Decimal("100.00"),
+        )
+        self.payment = Payment.objects.create(
+            user=self.user,
+            paid_course=self.course,
+            amount=Decimal("100.00"),
+            payment_method="stripe",
+            stripe_id="cs_test_1",
+        )
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, url, user=None, data=None, **kwargs):
+        """Вызывает асинхронное представление так же, как ASGI-обработчик Django."""
+        self.assertTrue(iscoroutinefunction(view))
+        request = self.factory.get(url, data)
+        if user is not None:
+            force_authenticate(request, user)
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_payment_status(self):
+        """Статус платежа: готовность ссылки, чужой платёж и неверный wait."""
+        view = PaymentStatusAPIView.as_view()
+        url = reverse("users:payment-status", args=[self.payment.id])
+
+        started = time.monotonic()
+        response = self.call(view, url, self.user, {"wait": 0.05}, pk=self.payment.id)
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data["ready"])
+
+        Payment.objects.filter(pk=self.payment.pk).update(
+            payment_url="https://checkout.stripe.com/pay/cs_test_1"
+        )
+        response = self.call(view, url, self.user, {"wait": 5}, pk=self.payment.id)
+        self.assertTrue(response.data["ready"])
+
+        response = self.call(view, url, self.other_user, pk=self.payment.id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.call(view, url, self.user, {"wait": "x"}, pk=self.payment.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch("users.views.aretrieve_stripe_session", new_callable=AsyncMock)
+    def test_stripe_success_grants_entitlement_once(self, mock_retrieve):
+        """Асинхронный колбэк успешной оплаты выдаёт доступ один раз."""
+        mock_retrieve.return_value = MagicMock(
+            payment_status="paid", metadata={"payment_id": str(self.payment.id)}
+        )
+        view = StripeSuccessView.as_view()
+
+        response = self.call(view, reverse("stripe-success"), data={"session_id": "cs"})
+        self.assertEqual(response.data["message"], "Платёж прошёл успешно!")
+        response = self.call(view, reverse("stripe-success"), data={"session_id": "cs"})
+        self.assertEqual(response.data["message"], "Платеж уже успешно обработан.")
+        self.assertEqual(Entitlement.objects.filter(user=self.user).count(), 1)
+
+        mock_retrieve.side_effect = stripe.error.InvalidRequestError("No such", "id")
+        response = self.call(view, reverse("stripe-success"), data={"session_id": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch("users.views.aretrieve_stripe_session", new_callable=AsyncMock)
+    def test_stripe_cancel_fails_pending_payment(self, mock_retrieve):
+        """Асинхронный колбэк отмены переводит pending-платёж в failed."""
+        mock_retrieve.return_value = MagicMock(
+            payment_status="unpaid", metadata={"payment_id": str(self.payment.id)}
+        )
+        response = self.call(
+            StripeCancelView.as_view(),
+            reverse("stripe-cancel"),
+            data={"session_id": "cs"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "failed")
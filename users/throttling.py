@@ -0,0 +1,126 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from redis import RedisError
+from redis.commands.core import Script
+from rest_framework.throttling import ScopedRateThrottle
+
+from skillshare_platform.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Token bucket: ёмкость - число запросов из лимита ("10/min" -> 10), пополнение равномерное
+# (10 токенов за 60 секунд). Скрипт проверяет все вёдра запроса (KEYS) и списывает токен
+# из каждого, только если запрос разрешён всеми; пополнение и списание выполняются
+# атомарно, поэтому параллельные запросы не могут потратить один и тот же токен.
+# Возвращает {разрешён, остаток в самом пустом ведре}.
+# Время берётся из Redis, чтобы не зависеть от расхождения часов между серверами.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local allowed = 1
+local buckets = {}
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call("HMGET", key, "tokens", "updated_at")
+    local tokens = tonumber(bucket[1])
+    local updated_at = tonumber(bucket[2])
+    if tokens == nil then
+        tokens = capacity
+        updated_at = now
+    end
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * refill_rate)
+    if tokens < cost then
+        allowed = 0
+    end
+    buckets[i] = tokens
+end
+
+local remaining = capacity
+for i, key in ipairs(KEYS) do
+    local tokens = buckets[i]
+    if allowed == 1 then
+        tokens = tokens - cost
+    end
+    remaining = math.min(remaining, tokens)
+    redis.call("HSET", key, "tokens", tostring(tokens), "updated_at", tostring(now))
+    redis.call("PEXPIRE", key, math.ceil(capacity / refill_rate * 1000))
+end
+return {allowed, tostring(remaining)}
+"""
+# Скрипт создаётся один раз на процесс и выполняется через EVALSHA клиентом get_redis();
+# текст передаётся байтами, поэтому SHA1 считается без клиента
+token_bucket = Script(None, TOKEN_BUCKET_SCRIPT.encode())
+
+
+class RedisTokenBucketThrottle(ScopedRateThrottle):
+    """
+    Ограничение частоты запросов по алгоритму token bucket с хранением в Redis.
+    Как и ScopedRateThrottle, берёт лимит из DEFAULT_THROTTLE_RATES по атрибуту
+    throttle_scope представления. Запрос проверяется по нескольким вёдрам с этим лимитом:
+    по IP, по пользователю (если он аутентифицирован) и, для входа (scope "auth"),
+    по учётной записи из поля email. Поэтому всплеск запросов с одного адреса
+    не расходует лимит остальных клиентов, а перебор паролей одной учётной записи
+    с многих адресов всё равно ограничен.
+    Состояние лимита сохраняется в request.ratelimit для заголовков RateLimit-*
+    (skillshare_platform.middleware.RateLimitHeadersMiddleware).
+    При недоступном Redis запросы пропускаются.
+    """
+
+    cache_format = "ratelimit:%(scope)s:%(ident)s"
+    # Области, в которых лимит ведётся и по учётной записи из тела запроса
+    account_scopes = ("auth",)
+
+    def get_cache_keys(self, request):
+        """Ключи вёдер запроса: IP, пользователь, учётная запись при входе."""
+        idents = [f"ip:{self.get_ident(request)}"]
+        if request.user and request.user.is_authenticated:
+            idents.append(f"user:{request.user.pk}")
+        if self.scope in self.account_scopes:
+            data = request.data if hasattr(request.data, "get") else {}
+            account = data.get(get_user_model().USERNAME_FIELD)
+            if isinstance(account, str) and account.strip():
+                idents.append(f"account:{account.strip().lower()}")
+        return [
+            self.cache_format % {"scope": self.scope, "ident": ident}
+            for ident in idents
+        ]
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        refill_rate = self.num_requests / self.duration
+
+        try:
+            allowed, tokens = token_bucket(
+                keys=self.get_cache_keys(request),
+                args=[self.num_requests, refill_rate, 1],
+                client=get_redis(),
+            )
+        except RedisError as e:
+            logger.warning(f"Лимит запросов '{self.scope}' не проверен: {e}")
+            return True
+
+        tokens = float(tokens)
+        self.wait_seconds = (1 - tokens) / refill_rate if not allowed else None
+        # Для заголовков сохраняем самый строгий из лимитов запроса
+        ratelimit = {
+            "limit": self.num_requests,
+            "remaining": int(tokens),
+            "reset": int((self.num_requests - tokens) / refill_rate + 0.999),
+            "window": self.duration,
+        }
+        current = getattr(request._request, "ratelimit", None)
+        if current is None or ratelimit["remaining"] < current["remaining"]:
+            request._request.ratelimit = ratelimit
+        return bool(allowed)
+
+    def wait(self):
+        return self.wait_seconds
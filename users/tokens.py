@@ -0,0 +1,26 @@
+import time
+
+from rest_framework_simplejwt.settings import api_settings
+
+from skillshare_platform.redis_client import get_redis
+
+# Ключ Redis для использованного (отозванного) refresh-токена
+USED_REFRESH_KEY = "auth:refresh:used:{jti}"
+
+
+def consume_refresh_token(token):
+    """
+    Отмечает refresh-токен как использованный при ротации.
+    Запись в Redis (SET NX) атомарна: из нескольких одновременных обновлений
+    с одним токеном успешно только одно. Запись живёт до истечения токена,
+    поэтому хранилище не растёт бесконечно. Проверка и отметка - один запрос к Redis.
+        Аргументы:
+            token (RefreshToken): Проверенный refresh-токен.
+        Возвращает:
+            bool: True, если токен использован впервые.
+        Исключения:
+            redis.RedisError: Redis недоступен.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    ttl = max(1, int(token["exp"] - time.time()))
+    return bool(get_redis().set(USED_REFRESH_KEY.format(jti=jti), 1, nx=True, ex=ttl))
@@ -1,8 +1,9 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from users.views import (PaymentCreateAPIView, PaymentListAPIView,
-                         ProfileUpdateView, UserViewSet)
+from users.views import (OwnedMaterialsAPIView, PaymentCreateAPIView,
+                         PaymentListAPIView, PaymentStatusAPIView,
+                         ProfileUpdateView, RevenueReportAPIView, UserViewSet)
 
 app_name = "users"
 
@@ -13,4 +14,13 @@ urlpatterns = [
     path("profile/", ProfileUpdateView.as_view(), name="profile-update"),
     path("payments/", PaymentListAPIView.as_view(), name="payment-list"),
     path("payments/create/", PaymentCreateAPIView.as_view(), name="payment-create"),
+    path(
+        "payments/<int:pk>/status/",
+        PaymentStatusAPIView.as_view(),
+        name="payment-status",
+    ),
+    path(
+        "entitlements/owned/", OwnedMaterialsAPIView.as_view(), name="owned-materials"
+    ),
+    path("reports/revenue/", RevenueReportAPIView.as_view(), name="revenue-report"),
 ] + router.urls
@@ -1,18 +1,43 @@
+import asyncio
+import csv
+import logging
+import time
+
 import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch, Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import OpenApiParameter, OpenApiTypes, extend_schema
 from rest_framework import filters, generics, status, viewsets
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from users.models import Payment, User
-from users.permissions import IsOwnerOrModerator
-from users.serializers import (PaymentCreateSerializer, PaymentSerializer,
-                               UserSerializer)
-from users.services import (process_payment_and_create_stripe_session,
+from skillshare_platform.async_views import AsyncReadMixin
+from skillshare_platform.db_router import read_from_primary, read_from_replica
+from users.models import Payment, RevenueRollup, User
+from users.paginators import PaymentCursorPagination, UsersPagination
+from users.permissions import IsModeratorOrSuperuser, IsOwnerOrModerator
+from users.renderers import CSVRenderer, EchoBuffer
+from users.serializers import (OwnedMaterialsSerializer,
+                               PaymentCreateSerializer, PaymentSerializer,
+                               PaymentStatusSerializer,
+                               RevenueReportQuerySerializer,
+                               RevenueReportSerializer, UserSerializer)
+from users.services import (aretrieve_stripe_session,
+                            create_checkout_session_for_payment,
+                            get_owned_material_ids, mark_payment_succeeded,
+                            process_payment_and_create_stripe_session,
                             retrieve_stripe_session)
+from users.tasks import create_checkout_session
+from users.throttling import RedisTokenBucketThrottle
+
+logger = logging.getLogger(__name__)
 
 
 @extend_schema(tags=["Users"])
@@ -23,12 +48,46 @@ class UserViewSet(viewsets.ModelViewSet):
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UsersPagination
+    throttle_scope = "registration"
+
+    def get_throttles(self):
+        """
+        Лимит запросов применяется только к регистрации (доступна без аутентификации).
+        """
+        if self.action == "create":
+            return [RedisTokenBucketThrottle()]
+        return super().get_throttles()
+
+    def get_queryset(self):
+        """
+        Пользователи отсортированы по ID для стабильной пагинации.
+        Платежи подгружаются одним запросом и только для самого запрашивающего:
+        в чужих профилях они не отображаются.
+        """
+        queryset = super().get_queryset().order_by("id")
+        if getattr(self, "swagger_fake_view", False):
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset
+        return queryset.prefetch_related(
+            Prefetch(
+                "payments",
+                queryset=Payment.objects.filter(user_id=self.request.user.pk).order_by(
+                    "-payment_date"
+                ),
+            )
+        )
 
     @extend_schema(
         summary="Создание нового пользователя",
         description="Регистрация нового пользователя (доступно без аутентификации).",
         request=UserSerializer,
-        responses={201: UserSerializer, 400: {"description": "Ошибка валидации"}},
+        responses={
+            201: UserSerializer,
+            400: {"description": "Ошибка валидации"},
+            429: {"description": "Превышен лимит запросов"},
+        },
         auth=[],
     )
     def create(self, request, *args, **kwargs):
@@ -36,7 +95,8 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @extend_schema(
         summary="Получение списка пользователей",
-        description="Получает список всех зарегистрированных пользователей (требуется аутентификация).",
+        description="Получает постраничный список зарегистрированных пользователей (требуется аутентификация). "
+        "Для чужих профилей возвращаются только публичные поля.",
         responses={200: UserSerializer(many=True)},
     )
     def list(self, request, *args, **kwargs):
@@ -191,10 +251,13 @@ class PaymentListAPIView(generics.ListAPIView):
     - Сортировать по дате оплаты (`payment_date`).
     - Фильтровать по курсу (`paid_course`) и уроку (`paid_lesson`).
     - Фильтровать по способу оплаты (`payment_method`).
+    - Выгружать платежи в CSV (`?format=csv`) потоково, без буферизации всей выборки.
+    Пользователи видят только свои платежи, модераторы и администраторы — все платежи.
     """
 
-    queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    pagination_class = PaymentCursorPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = {
         "paid_course": ["exact"],
@@ -204,9 +267,64 @@ class PaymentListAPIView(generics.ListAPIView):
     ordering_fields = ["payment_date"]
     permission_classes = [IsAuthenticated]
 
+    # Колонки CSV-выгрузки: (заголовок, поле для values_list)
+    csv_columns = (
+        ("id", "id"),
+        ("payment_date", "payment_date"),
+        ("user_id", "user_id"),
+        ("user_email", "user__email"),
+        ("paid_course_id", "paid_course_id"),
+        ("paid_course_title", "paid_course__title"),
+        ("paid_lesson_id", "paid_lesson_id"),
+        ("paid_lesson_title", "paid_lesson__title"),
+        ("amount", "amount"),
+        ("payment_method", "payment_method"),
+        ("status", "status"),
+    )
+
+    def get_queryset(self):
+        # Если запрос от DRF Spectacular для генерации схемы, возвращаем пустой QuerySet.
+        if getattr(self, "swagger_fake_view", False):
+            return Payment.objects.none()
+
+        queryset = Payment.objects.select_related("paid_course", "paid_lesson")
+        # Если пользователь не является суперпользователем и не входит в группу модераторов,
+        # он видит только свои платежи.
+        if not self.request.user.is_superuser and not self.request.user.is_moderator:
+            return queryset.filter(user_id=self.request.user.pk)
+        return queryset
+
+    def stream_csv(self, queryset):
+        """
+        Возвращает StreamingHttpResponse с платежами в формате CSV.
+        Строки читаются из базы пачками через iterator(chunk_size=...) и сразу
+        отправляются клиенту, поэтому память worker'а не зависит от размера выгрузки.
+        """
+        if not queryset.ordered:
+            queryset = queryset.order_by("id")
+        rows = queryset.values_list(*(field for _, field in self.csv_columns))
+        writer = csv.writer(EchoBuffer())
+
+        def generate():
+            yield writer.writerow([header for header, _ in self.csv_columns])
+            for row in rows.iterator(chunk_size=settings.PAYMENT_EXPORT_CHUNK_SIZE):
+                yield writer.writerow(row)
+
+        response = StreamingHttpResponse(generate(), content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="payments.csv"'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == "csv":
+            return self.stream_csv(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
+
     @extend_schema(
         summary="Получение списка платежей",
-        description="Получает список всех платежей с возможностью фильтрации по курсу, уроку, способу оплаты и сортировки по дате.",
+        description="Получает список платежей с возможностью фильтрации по курсу, уроку, способу оплаты и сортировки по дате. "
+        "Пользователи видят только свои платежи, модераторы и администраторы — все. "
+        "Пагинация курсорная: для перехода используйте ссылки `next`/`previous`. "
+        "С параметром `format=csv` возвращает потоковую выгрузку всех подходящих платежей.",
         parameters=[
             OpenApiParameter(
                 name="paid_course",
@@ -223,9 +341,9 @@ class PaymentListAPIView(generics.ListAPIView):
             OpenApiParameter(
                 name="payment_method",
                 type=OpenApiTypes.STR,
-                description="Фильтр по способу оплаты (cash, transfer, make_qr_code)",
+                description="Фильтр по способу оплаты (cash, transfer, make_qr_code, stripe, free)",
                 required=False,
-                enum=["cash", "transfer", "make_qr_code"],
+                enum=["cash", "transfer", "make_qr_code", "stripe", "free"],
             ),
             OpenApiParameter(
                 name="ordering",
@@ -233,6 +351,13 @@ class PaymentListAPIView(generics.ListAPIView):
                 description="Порядок сортировки (-payment_date для убывания)",
                 required=False,
             ),
+            OpenApiParameter(
+                name="format",
+                type=OpenApiTypes.STR,
+                description="Формат ответа: csv для потоковой выгрузки",
+                required=False,
+                enum=["json", "csv"],
+            ),
         ],
         responses={
             200: PaymentSerializer(many=True),
@@ -248,20 +373,28 @@ class PaymentCreateAPIView(generics.CreateAPIView):
     """
     API View для создания новой платежной сессии Stripe.
     Принимает course_id или lesson_id и возвращает URL для оплаты.
+    В асинхронном режиме (PAYMENT_CHECKOUT_MODE=async) создаёт платёж со статусом pending,
+    ставит создание сессии Stripe в очередь Celery и сразу возвращает 202 с ID платежа.
     """
 
     serializer_class = PaymentCreateSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RedisTokenBucketThrottle]
+    throttle_scope = "payments"
 
     @extend_schema(
         summary="Инициировать новый платеж через Stripe",
         description="Создает новую платежную сессию для курса или урока и возвращает URL для оплаты. "
-        "Необходимо указать либо 'paid_course', либо 'paid_lesson'.",
+        "Необходимо указать либо 'paid_course', либо 'paid_lesson'. "
+        "В асинхронном режиме возвращает 202 и ссылку на эндпоинт статуса, "
+        "по которому можно дождаться payment_url.",
         request=PaymentCreateSerializer,
         responses={
             200: PaymentCreateSerializer,
+            202: PaymentCreateSerializer,
             400: {"description": "Неверные входные данные или ошибка Stripe"},
             401: {"description": "Неавторизованный доступ"},
+            429: {"description": "Превышен лимит запросов"},
         },
     )
     def post(self, request, *args, **kwargs):
@@ -276,7 +409,37 @@ class PaymentCreateAPIView(generics.CreateAPIView):
                 user=request.user,
                 paid_course_id=paid_course_id.id if paid_course_id else None,
                 paid_lesson_id=paid_lesson_id.id if paid_lesson_id else None,
+                defer_checkout=settings.PAYMENT_CHECKOUT_MODE == "async",
             )
+
+            if payment_info.get("checkout_deferred"):
+                try:
+                    create_checkout_session.delay(payment_info["payment_id"])
+                except Exception as e:
+                    # Брокер недоступен - создаём сессию синхронно, как в обычном режиме
+                    logger.warning(
+                        f"Не удалось поставить создание сессии Stripe в очередь "
+                        f"(платёж ID {payment_info['payment_id']}): {e}. Создаём синхронно."
+                    )
+                    payment = Payment.objects.select_related(
+                        "paid_course", "paid_lesson"
+                    ).get(id=payment_info["payment_id"])
+                    payment_info = create_checkout_session_for_payment(payment)
+                else:
+                    return Response(
+                        {
+                            "payment_id": payment_info["payment_id"],
+                            "payment_url": None,
+                            "amount": payment_info["amount"],
+                            "status": payment_info["status"],
+                            "status_url": reverse(
+                                "users:payment-status",
+                                args=[payment_info["payment_id"]],
+                            ),
+                        },
+                        status=status.HTTP_202_ACCEPTED,
+                    )
+
             # Возвращаем данные, которые ожидает PaymentCreateSerializer
             return Response(
                 {
@@ -291,16 +454,328 @@ class PaymentCreateAPIView(generics.CreateAPIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@extend_schema(tags=["Payments"])
+class PaymentStatusAPIView(AsyncReadMixin, APIView):
+    """
+    Лёгкий эндпоинт статуса платежа для асинхронного режима оплаты.
+    Читает из базы только id, status и payment_url платежа текущего пользователя.
+    С параметром `wait` в ASGI-развёртывании работает как long-poll (aget): ждёт до `wait`
+    секунд (не больше PAYMENT_STATUS_MAX_WAIT), пока не появится payment_url или платёж
+    не завершится. Синхронный get отвечает сразу: ожидание заняло бы worker на всё время
+    long-poll, и клиент повторяет запрос сам.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = PaymentStatusSerializer
+    invalid_wait_error = {"error": "Параметр 'wait' должен быть числом."}
+
+    def get_payments(self, pk):
+        payments = Payment.objects.filter(pk=pk)
+        if not self.request.user.is_superuser:
+            payments = payments.filter(user_id=self.request.user.pk)
+        return payments.values("id", "status", "payment_url")
+
+    def get_payment_status(self, pk):
+        """Возвращает словарь с полями платежа или None, если платёж не найден."""
+        return self.get_payments(pk).first()
+
+    async def aget_payment_status(self, pk):
+        return await self.get_payments(pk).afirst()
+
+    def get_wait(self, request):
+        """Время ожидания в секундах; ValueError, если параметр `wait` не число."""
+        return min(
+            max(float(request.query_params.get("wait", 0)), 0),
+            settings.PAYMENT_STATUS_MAX_WAIT,
+        )
+
+    @staticmethod
+    def is_waiting(payment):
+        """Фоновая задача ещё не создала сессию Stripe и платёж не завершён."""
+        return payment["status"] == "pending" and not payment["payment_url"]
+
+    @staticmethod
+    def status_response(payment):
+        if payment is None:
+            return Response(
+                {"error": "Платёж не найден."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(
+            {
+                "payment_id": payment["id"],
+                "status": payment["status"],
+                "payment_url": payment["payment_url"],
+                "ready": bool(payment["payment_url"]) or payment["status"] != "pending",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @extend_schema(
+        summary="Получение статуса платежа",
+        description="Возвращает статус платежа и payment_url, как только сессия Stripe создана. "
+        "Параметр `wait` включает long-poll: ответ придёт, когда ссылка будет готова или истечёт время ожидания. "
+        "Без ASGI (ASYNC_VIEWS) ответ возвращается сразу, и при `ready=false` запрос нужно повторить.",
+        parameters=[
+            OpenApiParameter(
+                name="wait",
+                type=OpenApiTypes.INT,
+                description="Сколько секунд ждать готовности ссылки на оплату (long-poll)",
+                required=False,
+            ),
+        ],
+        responses={
+            200: PaymentStatusSerializer,
+            401: {"description": "Неавторизованный доступ"},
+            404: {"description": "Платёж не найден"},
+        },
+    )
+    def get(self, request, pk, *args, **kwargs):
+        # wait проверяется, но не ждём: sleep держал бы синхронный worker весь long-poll
+        try:
+            self.get_wait(request)
+        except ValueError:
+            return Response(self.invalid_wait_error, status=status.HTTP_400_BAD_REQUEST)
+        return self.status_response(self.get_payment_status(pk))
+
+    async def aget(self, request, pk, *args, **kwargs):
+        try:
+            wait = self.get_wait(request)
+        except ValueError:
+            return Response(self.invalid_wait_error, status=status.HTTP_400_BAD_REQUEST)
+
+        deadline = time.monotonic() + wait
+        payment = await self.aget_payment_status(pk)
+        # Ждём, пока фоновая задача создаст сессию Stripe или платёж не завершится
+        while (
+            payment is not None
+            and self.is_waiting(payment)
+            and time.monotonic() < deadline
+        ):
+            await asyncio.sleep(settings.PAYMENT_STATUS_POLL_INTERVAL)
+            payment = await self.aget_payment_status(pk)
+        return self.status_response(payment)
+
+
+@extend_schema(tags=["Payments"])
+class OwnedMaterialsAPIView(APIView):
+    """
+    Пакетная проверка доступа: какие из переданных курсов и уроков принадлежат текущему пользователю.
+    Отвечает по таблице Entitlement не больше чем двумя запросами к базе.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = OwnedMaterialsSerializer
+    # Ограничение на количество ID в одном запросе
+    max_ids = 200
+
+    def parse_ids(self, param):
+        """Разбирает параметр вида '1,2,3' в список целых чисел."""
+        raw = self.request.query_params.get(param, "")
+        ids = [value for value in raw.split(",") if value.strip()]
+        if len(ids) > self.max_ids:
+            raise ValueError(
+                f"В параметре '{param}' можно передать не больше {self.max_ids} ID."
+            )
+        try:
+            return [int(value) for value in ids]
+        except ValueError:
+            raise ValueError(f"Параметр '{param}' должен содержать ID через запятую.")
+
+    @extend_schema(
+        summary="Проверка доступа к курсам и урокам",
+        description="Возвращает ID курсов и уроков из запроса, к которым у пользователя есть доступ "
+        "(оплачены или получены бесплатно). Доступ к курсу даёт доступ и ко всем его урокам.",
+        parameters=[
+            OpenApiParameter(
+                name="courses",
+                type=OpenApiTypes.STR,
+                description="ID курсов через запятую",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="lessons",
+                type=OpenApiTypes.STR,
+                description="ID уроков через запятую",
+                required=False,
+            ),
+        ],
+        responses={
+            200: OwnedMaterialsSerializer,
+            400: {"description": "Неверный формат ID"},
+            401: {"description": "Неавторизованный доступ"},
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        try:
+            course_ids = self.parse_ids("courses")
+            lesson_ids = self.parse_ids("lessons")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        owned = get_owned_material_ids(
+            request.user, course_ids=course_ids, lesson_ids=lesson_ids
+        )
+        return Response(owned, status=status.HTTP_200_OK)
+
+
+@extend_schema(tags=["Reports"])
+class RevenueReportAPIView(APIView):
+    """
+    Отчёт о выручке по дням, курсам, урокам или способам оплаты.
+    Читает только агрегаты RevenueRollup, поэтому стоимость запроса зависит от длины
+    периода и числа материалов, а не от размера истории платежей.
+    Доступен модераторам и администраторам.
+    """
+
+    permission_classes = [IsAuthenticated, IsModeratorOrSuperuser]
+    serializer_class = RevenueReportSerializer
+
+    # Соответствие параметра группировки полю агрегата
+    group_by_fields = {
+        "day": "day",
+        "course": "course_id",
+        "lesson": "lesson_id",
+        "payment_method": "payment_method",
+    }
+
+    @extend_schema(
+        summary="Отчёт о выручке",
+        description="Возвращает количество и сумму успешных платежей за период (по умолчанию - последние 30 дней), "
+        "сгруппированные по дню, курсу, уроку или способу оплаты. Доступно модераторам и администраторам.",
+        parameters=[RevenueReportQuerySerializer],
+        responses={
+            200: RevenueReportSerializer,
+            400: {"description": "Неверные параметры отчёта"},
+            401: {"description": "Неавторизованный доступ"},
+            403: {"description": "Доступ запрещен"},
+        },
+    )
+    @read_from_replica()
+    def get(self, request, *args, **kwargs):
+        query = RevenueReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        rollups = RevenueRollup.objects.filter(
+            day__range=(params["date_from"], params["date_to"])
+        )
+        if "course" in params:
+            rollups = rollups.filter(course_id=params["course"])
+        if "lesson" in params:
+            rollups = rollups.filter(lesson_id=params["lesson"])
+        if "payment_method" in params:
+            rollups = rollups.filter(payment_method=params["payment_method"])
+
+        group_by = params["group_by"]
+        group_field = self.group_by_fields[group_by]
+        totals = {
+            "payments_count": Sum("payments_count"),
+            "amount_total": Sum("amount_total"),
+        }
+        rows = rollups.values(group_field).annotate(**totals).order_by(group_field)
+        total = rollups.aggregate(**totals)
+
+        return Response(
+            RevenueReportSerializer(
+                {
+                    "date_from": params["date_from"],
+                    "date_to": params["date_to"],
+                    "group_by": group_by,
+                    "results": [
+                        {
+                            group_by: row[group_field],
+                            "payments_count": row["payments_count"],
+                            "amount_total": row["amount_total"],
+                        }
+                        for row in rows
+                    ],
+                    "total": {
+                        "payments_count": total["payments_count"] or 0,
+                        "amount_total": total["amount_total"] or 0,
+                    },
+                }
+            ).data,
+            status=status.HTTP_200_OK,
+        )
+
+
 @extend_schema(tags=["Stripe Callbacks"])
-class StripeSuccessView(APIView):
+class StripeSuccessView(AsyncReadMixin, APIView):
     """
     Обрабатывает успешные колбэки платежей от Stripe.
     Извлекает сессию Stripe, обновляет локальный статус Payment на 'succeeded'.
+    В ASGI-развёртывании сессия запрашивается асинхронным клиентом (aget).
     """
 
     permission_classes = []
     serializer_class = None
 
+    def session_response(self, stripe_session):
+        """Обновляет платёж по состоянию сессии Stripe и возвращает ответ колбэка."""
+        if stripe_session.payment_status == "paid":
+            payment_id = stripe_session.metadata.get("payment_id")
+            if not payment_id:
+                return Response(
+                    {
+                        "error": "Идентификатор платежа отсутствует в метаданных сессии Stripe."
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            payment = get_object_or_404(Payment, id=payment_id)
+
+            # Статус меняется условно: повторный колбэк не выдаст доступ второй раз
+            if not mark_payment_succeeded(payment):
+                # Платеж уже обработан, нет необходимости обновлять снова
+                return Response(
+                    {
+                        "message": "Платеж уже успешно обработан.",
+                        "payment_id": payment.id,
+                    },
+                    status=status.HTTP_200_OK,
+                )
+
+            return Response(
+                {"message": "Платёж прошёл успешно!", "payment_id": payment.id},
+                status=status.HTTP_200_OK,
+            )
+        else:
+            # Если payment_status не 'paid', это может означать 'unpaid' или 'no_payment_required'.
+            # Для нашего случая, если нас перенаправили сюда, это подразумевает неудачу или отмену.
+            payment_id = stripe_session.metadata.get("payment_id")
+            if payment_id:
+                payment = get_object_or_404(Payment, id=payment_id)
+                if (
+                    payment.status == "pending"
+                ):  # Обновляем только если статус еще "ожидает"
+                    payment.status = "failed"
+                    payment.save()
+                return Response(
+                    {
+                        "message": f"Платеж не завершен. Статус: {stripe_session.payment_status}",
+                        "payment_id": payment.id,
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            return Response(
+                {
+                    "message": f"Платеж не завершен. Статус: {stripe_session.payment_status}"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+    @staticmethod
+    def error_response(exc):
+        if isinstance(exc, stripe.error.InvalidRequestError):
+            return Response(
+                {"error": f"Неверный ID сессии Stripe или ошибка API: {exc}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {"error": f"Произошла непредвиденная ошибка: {exc}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
     @extend_schema(
         summary="Обработка успешной оплаты Stripe",
         parameters=[
@@ -317,6 +792,7 @@ class StripeSuccessView(APIView):
             500: OpenApiTypes.OBJECT,
         },
     )
+    @read_from_primary()
     def get(self, request, *args, **kwargs):
         session_id = request.GET.get("session_id")
         if not session_id:
@@ -326,87 +802,53 @@ class StripeSuccessView(APIView):
             )
 
         try:
-            stripe_session = retrieve_stripe_session(session_id)
-
-            if stripe_session.payment_status == "paid":
-                payment_id = stripe_session.metadata.get("payment_id")
-                if not payment_id:
-                    return Response(
-                        {
-                            "error": "Идентификатор платежа отсутствует в метаданных сессии Stripe."
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                payment = get_object_or_404(Payment, id=payment_id)
-
-                if payment.status == "succeeded":
-                    # Платеж уже обработан, нет необходимости обновлять снова
-                    return Response(
-                        {
-                            "message": "Платеж уже успешно обработан.",
-                            "payment_id": payment.id,
-                        },
-                        status=status.HTTP_200_OK,
-                    )
-
-                payment.status = "succeeded"
-                # Очищаем stripe_id и payment_url, так как платеж завершен
-                payment.stripe_id = None
-                payment.payment_url = None
-                payment.save()
-
-                return Response(
-                    {"message": "Платёж прошёл успешно!", "payment_id": payment.id},
-                    status=status.HTTP_200_OK,
-                )
-            else:
-                # Если payment_status не 'paid', это может означать 'unpaid' или 'no_payment_required'.
-                # Для нашего случая, если нас перенаправили сюда, это подразумевает неудачу или отмену.
-                payment_id = stripe_session.metadata.get("payment_id")
-                if payment_id:
-                    payment = get_object_or_404(Payment, id=payment_id)
-                    if (
-                        payment.status == "pending"
-                    ):  # Обновляем только если статус еще "ожидает"
-                        payment.status = "failed"
-                        payment.save()
-                    return Response(
-                        {
-                            "message": f"Платеж не завершен. Статус: {stripe_session.payment_status}",
-                            "payment_id": payment.id,
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-                return Response(
-                    {
-                        "message": f"Платеж не завершен. Статус: {stripe_session.payment_status}"
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            return self.session_response(retrieve_stripe_session(session_id))
+        except Exception as e:
+            return self.error_response(e)
 
-        except stripe.error.InvalidRequestError as e:
+    async def aget(self, request, *args, **kwargs):
+        session_id = request.GET.get("session_id")
+        if not session_id:
             return Response(
-                {"error": f"Неверный ID сессии Stripe или ошибка API: {e}"},
+                {"error": "Идентификатор сессии отсутствует."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        except Exception as e:
-            return Response(
-                {"error": f"Произошла непредвиденная ошибка: {e}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+
+        with read_from_primary():
+            try:
+                stripe_session = await aretrieve_stripe_session(session_id)
+                return await sync_to_async(self.session_response)(stripe_session)
+            except Exception as e:
+                return self.error_response(e)
 
 
 @extend_schema(tags=["Stripe Callbacks"])
-class StripeCancelView(APIView):
+class StripeCancelView(AsyncReadMixin, APIView):
     """
     Обрабатывает колбэки отмены платежа от Stripe.
     Обновляет локальный статус Payment на 'failed', если он был 'pending'.
+    В ASGI-развёртывании сессия запрашивается асинхронным клиентом (aget).
     """
 
     permission_classes = []  # Аутентификация не требуется для колбэков Stripe
     serializer_class = None
 
+    @staticmethod
+    def fail_payment(stripe_session):
+        payment_id = stripe_session.metadata.get("payment_id")
+        if payment_id:
+            payment = get_object_or_404(Payment, id=payment_id)
+            if payment.status == "pending":
+                payment.status = "failed"
+                payment.save()
+
+    @staticmethod
+    def cancel_response():
+        return Response(
+            {"message": "Платеж отменен пользователем."}, status=status.HTTP_200_OK
+        )
+
+    @read_from_primary()
     def get(self, request, *args, **kwargs):
         session_id = request.GET.get(
             "session_id"
@@ -415,19 +857,25 @@ class StripeCancelView(APIView):
         # При желании, можно получить сессию и обновить статус платежа на 'failed'
         if session_id:
             try:
-                stripe_session = retrieve_stripe_session(session_id)
-                payment_id = stripe_session.metadata.get("payment_id")
-                if payment_id:
-                    payment = get_object_or_404(Payment, id=payment_id)
-                    if payment.status == "pending":
-                        payment.status = "failed"
-                        payment.save()
+                self.fail_payment(retrieve_stripe_session(session_id))
             except (stripe.error.InvalidRequestError, Exception) as e:
                 # Зарегистрируйте ошибку, но все равно верните сообщение об отмене пользователю/Stripe
                 print(
                     f"Ошибка обработки колбэка отмены Stripe для сессии {session_id}: {e}"
                 )
 
-        return Response(
-            {"message": "Платеж отменен пользователем."}, status=status.HTTP_200_OK
-        )
+        return self.cancel_response()
+
+    async def aget(self, request, *args, **kwargs):
+        session_id = request.GET.get("session_id")
+        if session_id:
+            with read_from_primary():
+                try:
+                    stripe_session = await aretrieve_stripe_session(session_id)
+                    await sync_to_async(self.fail_payment)(stripe_session)
+                except Exception as e:
+                    print(
+                        f"Ошибка обработки колбэка отмены Stripe для сессии {session_id}: {e}"
+                    )
+
+        return self.cancel_response()